@@ -1,18 +1,33 @@
-from flask import Flask, render_template_string, request, redirect, url_for, flash, session, g, jsonify
+from flask import Flask, render_template, stream_template, request, redirect, url_for, flash, session, g, jsonify, \
+    has_request_context
+from markupsafe import Markup
+from jinja2 import ChoiceLoader, DictLoader, FileSystemLoader, FileSystemBytecodeCache
 from werkzeug.security import generate_password_hash, check_password_hash
 from functools import wraps
 import sqlite3
+import queue
 import os
 import secrets
 import smtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 import re
-from datetime import datetime, timedelta
+import math
+import json
+import hashlib
+import base64
+from datetime import datetime, timedelta, timezone
+from collections import OrderedDict
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import time
 import numpy as np
 import pickle
 from sklearn.neighbors import KNeighborsClassifier
 from sklearn.preprocessing import StandardScaler
+from ml_engine import KNNInferenceEngine, ANNInferenceEngine, ModelRegistry, CategoricalEncoder, load_knn_index, \
+    load_knn_artifacts, artifacts_current, ARTIFACT_HEADER
+from weather_service import WeatherCache, StaticWeatherProvider, HTTPWeatherProvider, StationCatalog, STATIC_WEATHER
 
 # ==============================================================================
 # --- HTML CONTENT TEMPLATES (Jinja2) ---
@@ -413,7 +428,7 @@ DASHBOARD_CONTENT = """
         <div class="stat-card card bg-success text-white">
             <div class="card-body text-center">
                 <i class="fas fa-leaf fa-3x mb-2"></i>
-                <h3>{{ crops|length }}</h3>
+                <h3>{{ crop_count }}</h3>
                 <p class="mb-0">Active Crops</p>
             </div>
         </div>
@@ -466,7 +481,7 @@ DASHBOARD_CONTENT = """
                             </tr>
                         </thead>
                         <tbody>
-                            {% for crop in crops[:5] %}
+                            {% for crop in crops %}
                             <tr>
                                 <td><strong>{{ crop.crop_type }}</strong></td>
                                 <td>{{ crop.acre }}</td>
@@ -557,6 +572,12 @@ WEATHER_CONTENT = """
             <i class="fas fa-cloud-sun me-2"></i>
             Weather Intelligence for {{ weather.city }}
         </h2>
+        {% if station and station.distance_km is not none %}
+        <p class="text-muted">
+            <i class="fas fa-map-marker-alt me-1"></i>
+            Nearest station to {{ location }}: {{ station.station.name }} ({{ station.distance_km }} km away)
+        </p>
+        {% endif %}
     </div>
 </div>
 
@@ -658,8 +679,7 @@ FERTILIZER_CONTENT = """
                 <h5 class="mb-0"><i class="fas fa-vial me-2"></i>Latest Soil Test Results</h5>
             </div>
             <div class="card-body">
-                {% if soil_data %}
-                {% set latest = soil_data[0] %}
+                {% if latest %}
                 <p><strong>Test Date:</strong> {{ latest.test_date }}</p>
                 <hr>
                 <div class="row text-center mb-3">
@@ -785,12 +805,15 @@ FERTILIZER_CONTENT = """
     </div>
 </div>
 
-{% if soil_data and soil_data|length > 1 %}
+{% if history %}
 <div class="row mt-4">
     <div class="col-12">
         <div class="card">
-            <div class="card-header bg-info text-white">
+            <div class="card-header bg-info text-white d-flex justify-content-between align-items-center">
                 <h5 class="mb-0"><i class="fas fa-history me-2"></i>Soil Test History</h5>
+                <a href="{{ url_for('export_soil_history') }}" class="btn btn-sm btn-light">
+                    <i class="fas fa-file-export me-1"></i>Export Full History
+                </a>
             </div>
             <div class="card-body">
                 <div class="table-responsive">
@@ -805,8 +828,8 @@ FERTILIZER_CONTENT = """
                                 <th>Notes</th>
                             </tr>
                         </thead>
-                        <tbody>
-                            {% for test in soil_data[1:] %}
+                        <tbody id="soilHistoryRows">
+                            {% for test in history %}
                             <tr>
                                 <td>{{ test.test_date }}</td>
                                 <td class="{{ get_soil_status_class(test.nitrogen_level) }}">{{ test.nitrogen_level }}</td>
@@ -819,13 +842,102 @@ FERTILIZER_CONTENT = """
                         </tbody>
                     </table>
                 </div>
+                {% if history_cursor %}
+                <div class="text-center">
+                    <button type="button" id="loadOlderTests" class="btn btn-outline-info" data-cursor="{{ history_cursor }}">
+                        <i class="fas fa-angle-double-down me-1"></i>Load Older Tests
+                    </button>
+                </div>
+                {% endif %}
             </div>
         </div>
     </div>
 </div>
+
+{% if history_cursor %}
+<script>
+// Older tests are fetched one page at a time when the button scrolls into view (or is clicked)
+(function() {
+    const button = document.getElementById('loadOlderTests');
+    const rows = document.getElementById('soilHistoryRows');
+    let loading = false;
+
+    async function loadOlderTests() {
+        if (loading || !button.dataset.cursor) return;
+        loading = true;
+        button.disabled = true;
+        try {
+            const response = await fetch({{ url_for('api_soil_tests')|tojson }} + '?cursor=' + encodeURIComponent(button.dataset.cursor));
+            if (!response.ok) throw new Error(response.statusText);
+            const page = await response.json();
+            page.tests.forEach(test => {
+                const row = rows.insertRow();
+                [
+                    [test.test_date, ''],
+                    [test.nitrogen_level, test.status_classes.nitrogen_level],
+                    [test.phosphorus_level, test.status_classes.phosphorus_level],
+                    [test.potassium_level, test.status_classes.potassium_level],
+                    [test.ph_level === null ? '' : Number(test.ph_level).toFixed(1), ''],
+                    [test.recommendations || '-', '']
+                ].forEach(([text, className]) => {
+                    const cell = row.insertCell();
+                    cell.textContent = text;
+                    cell.className = className;
+                });
+            });
+            button.dataset.cursor = page.next_cursor || '';
+            if (!page.next_cursor) {
+                observer.disconnect();
+                button.remove();
+            }
+        } catch (error) {
+            button.textContent = 'Could not load older tests. Retry';
+        } finally {
+            loading = false;
+            button.disabled = false;
+        }
+    }
+
+    const observer = new IntersectionObserver(entries => {
+        if (entries[0].isIntersecting) loadOlderTests();
+    });
+    observer.observe(button);
+    button.addEventListener('click', loadOlderTests);
+})();
+</script>
+{% endif %}
 {% endif %}
 """
 
+# Standalone page streamed by /fertilizer/history/export; rows are rendered as the keyset pages arrive
+SOIL_HISTORY_EXPORT_TEMPLATE = """<!DOCTYPE html>
+<html lang="en">
+<head>
+    <meta charset="UTF-8">
+    <title>Soil Test History - {{ user.full_name }}</title>
+    <style>
+        body { font-family: sans-serif; margin: 2rem; }
+        table { border-collapse: collapse; }
+        th, td { border: 1px solid #ccc; padding: 4px 10px; text-align: left; }
+    </style>
+</head>
+<body>
+    <h1>Soil Test History</h1>
+    <p>{{ user.full_name }} &middot; {{ user.farm_name }} &middot; exported {{ exported_at }}</p>
+    <table>
+        <thead>
+            <tr><th>Date</th><th>N</th><th>P</th><th>K</th><th>pH</th><th>Notes</th></tr>
+        </thead>
+        <tbody>
+            {% for test in tests %}
+            <tr><td>{{ test.test_date }}</td><td>{{ test.nitrogen_level }}</td><td>{{ test.phosphorus_level }}</td><td>{{ test.potassium_level }}</td><td>{{ "%.1f"|format(test.ph_level) }}</td><td>{{ test.recommendations or '-' }}</td></tr>
+            {% endfor %}
+        </tbody>
+    </table>
+</body>
+</html>
+"""
+
 ML_PREDICTOR_CONTENT = """
 <div class="row mb-4">
     <div class="col-12">
@@ -860,44 +972,11 @@ ML_PREDICTOR_CONTENT = """
                         <div class="col-md-6 mb-3">
                             <label for="crop" class="form-label"><i class="fas fa-seedling me-1"></i>Crop Type</label>
                             <select class="form-select" id="crop" name="crop" required>
-                                <optgroup label="Cereals">
-                                    {% for crop in crops.cereals %}
-                                    <option value="{{ crop }}">{{ crop }}</option>
-                                    {% endfor %}
-                                </optgroup>
-                                <optgroup label="Pulses">
-                                    {% for crop in crops.pulses %}
-                                    <option value="{{ crop }}">{{ crop }}</option>
-                                    {% endfor %}
-                                </optgroup>
-                                <optgroup label="Oilseeds">
-                                    {% for crop in crops.oilseeds %}
-                                    <option value="{{ crop }}">{{ crop }}</option>
-                                    {% endfor %}
-                                </optgroup>
-                                <optgroup label="Cash Crops">
-                                    {% for crop in crops.cash_crops %}
-                                    <option value="{{ crop }}">{{ crop }}</option>
-                                    {% endfor %}
-                                </optgroup>
-                                <optgroup label="Vegetables">
-                                    {% for crop in crops.vegetables %}
-                                    <option value="{{ crop }}">{{ crop }}</option>
-                                    {% endfor %}
-                                </optgroup>
-                                <optgroup label="Fruits">
-                                    {% for crop in crops.fruits %}
-                                    <option value="{{ crop }}">{{ crop }}</option>
-                                    {% endfor %}
-                                </optgroup>
                             </select>
                         </div>
                         <div class="col-md-6 mb-3">
                             <label for="region" class="form-label"><i class="fas fa-map-marker-alt me-1"></i>Region</label>
                             <select class="form-select" id="region" name="region" required>
-                                {% for region in regions %}
-                                <option value="{{ region }}">{{ region }}</option>
-                                {% endfor %}
                             </select>
                         </div>
                     </div>
@@ -906,9 +985,6 @@ ML_PREDICTOR_CONTENT = """
                         <div class="col-md-6 mb-3">
                             <label for="month" class="form-label"><i class="fas fa-calendar me-1"></i>Month</label>
                             <select class="form-select" id="month" name="month" required>
-                                {% for month in months %}
-                                <option value="{{ month }}">{{ month }}</option>
-                                {% endfor %}
                             </select>
                         </div>
                         <div class="col-md-6 mb-3">
@@ -961,6 +1037,16 @@ ML_PREDICTOR_CONTENT = """
                         </div>
                     </div>
 
+                    <div class="row">
+                        <div class="col-md-6 mb-3">
+                            <label for="algorithm" class="form-label"><i class="fas fa-microchip me-1"></i>Algorithm</label>
+                            <select class="form-select" id="algorithm" name="algorithm">
+                                <option value="knn" selected>K-Nearest Neighbors (KNN)</option>
+                                <option value="ann">Artificial Neural Network (ANN)</option>
+                            </select>
+                        </div>
+                    </div>
+
                     <div class="d-grid">
                         <button type="submit" class="btn btn-success btn-lg" {% if not ml_model_available %}disabled{% endif %}>
                             <i class="fas fa-magic me-2"></i>Get KNN Recommendation
@@ -999,6 +1085,50 @@ ML_PREDICTOR_CONTENT = """
 </div>
 
 <script>
+// Dropdown options come from the versioned catalog, which the browser caches as immutable
+async function loadCatalog() {
+    const response = await fetch({{ catalog_url|tojson }});
+    const catalog = await response.json();
+    const cropSelect = document.getElementById('crop');
+    catalog.crop_groups.forEach(group => {
+        const optgroup = document.createElement('optgroup');
+        optgroup.label = group.label;
+        group.crops.forEach(crop => optgroup.appendChild(new Option(crop, crop)));
+        cropSelect.appendChild(optgroup);
+    });
+    catalog.regions.forEach(region => document.getElementById('region').appendChild(new Option(region, region)));
+    catalog.months.forEach(month => document.getElementById('month').appendChild(new Option(month, month)));
+}
+
+// Catalog values the selected model has no encoding for are disabled (e.g. regions the ANN was not trained on)
+const unsupportedByAlgorithm = {};
+async function applyModelCoverage() {
+    const algorithm = document.getElementById('algorithm').value;
+    if (!(algorithm in unsupportedByAlgorithm)) {
+        const response = await fetch('/api/models/' + algorithm + '/coverage');
+        unsupportedByAlgorithm[algorithm] = response.ok ? (await response.json()).unsupported : {};
+    }
+    const unsupported = unsupportedByAlgorithm[algorithm];
+    ['crop', 'region', 'month'].forEach(field => {
+        const select = document.getElementById(field);
+        const missing = new Set(unsupported[field] || []);
+        for (const option of select.options) {
+            option.disabled = missing.has(option.value);
+            option.text = option.value + (option.disabled ? ' (not covered by ' + algorithm.toUpperCase() + ')' : '');
+        }
+        if (select.selectedOptions.length && select.selectedOptions[0].disabled) {
+            const firstCovered = Array.from(select.options).find(option => !option.disabled);
+            select.value = firstCovered ? firstCovered.value : '';
+        }
+    });
+}
+
+loadCatalog().then(applyModelCoverage).catch(error => {
+    document.getElementById('errorMessage').textContent = 'Could not load crop catalog: ' + error.message;
+    document.getElementById('predictionError').style.display = 'block';
+});
+document.getElementById('algorithm').addEventListener('change', () => applyModelCoverage().catch(() => {}));
+
 document.getElementById('mlPredictionForm').addEventListener('submit', async function(e) {
     e.preventDefault();
 
@@ -1012,7 +1142,8 @@ document.getElementById('mlPredictionForm').addEventListener('submit', async fun
         K: parseFloat(document.getElementById('K').value),
         humidity: parseFloat(document.getElementById('humidity').value),
         ph: parseFloat(document.getElementById('ph').value),
-        moisture: parseFloat(document.getElementById('moisture').value)
+        moisture: parseFloat(document.getElementById('moisture').value),
+        algorithm: document.getElementById('algorithm').value
     };
     document.getElementById('predictionResult').style.display = 'none';
     document.getElementById('predictionError').style.display = 'none';
@@ -1222,6 +1353,28 @@ CONTACT_CONTENT = """
 </div> 
 <div class="row"> 
     <div class="col-lg-8 mb-4"> 
+        {{ cached_fragment('fragments/contact_form.html') }}
+    </div> 
+    <div class="col-lg-4 mb-4">
+        <div class="card">
+            <div class="card-header bg-info text-white">
+                <h5 class="mb-0"><i class="fas fa-headset me-2"></i> Support Info</h5>
+            </div>
+            <div class="card-body">
+                <p><strong>Email:</strong> help@agridash.com</p>
+                <p><strong>Phone:</strong> +91 1800-AGRIHELP</p>
+                <p><strong>Hours:</strong> Mon - Fri, 9 AM - 5 PM IST</p>
+                <hr>
+                <h6>Active Users: {{ all_users|length }}</h6>
+            </div>
+        </div>
+    </div>
+</div>
+"""
+
+
+# Static blocks rendered once by cached_fragment() and spliced into pages
+CONTACT_FORM_FRAGMENT = """
         <div class="card"> 
             <div class="card-header bg-success text-white"> 
                 <h5 class="mb-0"><i class="fas fa-question-circle me-2"></i> Send us a message</h5> 
@@ -1243,37 +1396,123 @@ CONTACT_CONTENT = """
                 </form>
             </div>
         </div> 
-    </div> 
-    <div class="col-lg-4 mb-4">
-        <div class="card">
-            <div class="card-header bg-info text-white">
-                <h5 class="mb-0"><i class="fas fa-headset me-2"></i> Support Info</h5>
-            </div>
-            <div class="card-body">
-                <p><strong>Email:</strong> help@agridash.com</p>
-                <p><strong>Phone:</strong> +91 1800-AGRIHELP</p>
-                <p><strong>Hours:</strong> Mon - Fri, 9 AM - 5 PM IST</p>
-                <hr>
-                <h6>Active Users: {{ all_users|length }}</h6>
-            </div>
-        </div>
-    </div>
-</div>
 """
 
 
+def extend_base(content):
+    """Wrap a page body so it extends base.html and fills its content block."""
+    return '{% extends "base.html" %}{% block content %}' + content + '{% endblock %}'
+
+
+# Template name -> source, served by the app's Jinja loader. Each page is compiled once at
+# startup (see precompile_templates) instead of re-hashing BASE_TEMPLATE + page per request.
+PAGE_TEMPLATES = {
+    'base.html': BASE_TEMPLATE,
+    'landing.html': extend_base("{{ cached_fragment('fragments/landing.html') }}"),
+    'forgot_password.html': extend_base(FORGOT_PASSWORD_CONTENT),
+    'reset_password.html': extend_base(RESET_PASSWORD_CONTENT),
+    'login.html': extend_base(LOGIN_CONTENT),
+    'register.html': extend_base(REGISTER_CONTENT),
+    'dashboard.html': extend_base(DASHBOARD_CONTENT),
+    'weather.html': extend_base(WEATHER_CONTENT),
+    'fertilizer.html': extend_base(FERTILIZER_CONTENT),
+    'ml_predictor.html': extend_base(ML_PREDICTOR_CONTENT),
+    'crop_management.html': extend_base(CROP_MANAGEMENT_CONTENT),
+    'profile.html': extend_base(PROFILE_CONTENT),
+    'contact.html': extend_base(CONTACT_CONTENT),
+    'soil_history_export.html': SOIL_HISTORY_EXPORT_TEMPLATE,
+    'fragments/landing.html': LANDING_PAGE_CONTENT,
+    'fragments/contact_form.html': CONTACT_FORM_FRAGMENT,
+}
+
+
 # ==============================================================================
 # --- Flask App Initialization ---
 # ==============================================================================
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = secrets.token_hex(32)
-app.config['MAIL_SERVER'] = 'smtp.gmail.com'
-app.config['MAIL_PORT'] = 587
-app.config['MAIL_USE_TLS'] = True
-app.config['MAIL_USERNAME'] = 'your-email@gmail.com'
-app.config['MAIL_PASSWORD'] = 'your-app-password'
-app.config['MAIL_DEFAULT_SENDER'] = 'your-email@gmail.com'
+app.config['MAIL_SERVER'] = os.environ.get('MAIL_SERVER', 'smtp.gmail.com')
+app.config['MAIL_PORT'] = int(os.environ.get('MAIL_PORT', '587'))
+app.config['MAIL_USE_TLS'] = os.environ.get('MAIL_USE_TLS', '1') == '1'
+app.config['MAIL_USERNAME'] = os.environ.get('MAIL_USERNAME', 'your-email@gmail.com')
+app.config['MAIL_PASSWORD'] = os.environ.get('MAIL_PASSWORD', 'your-app-password')
+app.config['MAIL_DEFAULT_SENDER'] = os.environ.get('MAIL_DEFAULT_SENDER', 'your-email@gmail.com')
+# Background mail queue: pending message limit, delivery retries (doubling backoff from MAIL_RETRY_BACKOFF
+# seconds), SMTP socket timeout, and idle seconds before the persistent SMTP connection is closed
+app.config['MAIL_QUEUE_SIZE'] = int(os.environ.get('MAIL_QUEUE_SIZE', '1000'))
+app.config['MAIL_MAX_RETRIES'] = int(os.environ.get('MAIL_MAX_RETRIES', '3'))
+app.config['MAIL_RETRY_BACKOFF'] = float(os.environ.get('MAIL_RETRY_BACKOFF', '2'))
+app.config['MAIL_TIMEOUT'] = float(os.environ.get('MAIL_TIMEOUT', '10'))
+app.config['MAIL_IDLE_TIMEOUT'] = float(os.environ.get('MAIL_IDLE_TIMEOUT', '60'))
+# Password hashing: werkzeug method string (its cost parameters), hashing threads, hashes allowed to
+# wait for a thread before new logins are turned away, and login attempts per identifier per window
+app.config['PASSWORD_HASH_METHOD'] = os.environ.get('PASSWORD_HASH_METHOD', 'scrypt:32768:8:1')
+app.config['PASSWORD_HASH_WORKERS'] = int(os.environ.get('PASSWORD_HASH_WORKERS', '2'))
+app.config['PASSWORD_HASH_MAX_PENDING'] = int(os.environ.get('PASSWORD_HASH_MAX_PENDING', '32'))
+app.config['LOGIN_RATE_LIMIT'] = int(os.environ.get('LOGIN_RATE_LIMIT', '10'))
+app.config['LOGIN_RATE_WINDOW'] = float(os.environ.get('LOGIN_RATE_WINDOW', '300'))
+app.config['DATABASE'] = os.environ.get('AGRIDASH_DB', 'agridash.db')
+# Pooled connections kept idle between requests, and prepared statements cached per connection
+app.config['DB_POOL_SIZE'] = int(os.environ.get('DB_POOL_SIZE', '8'))
+app.config['DB_STATEMENT_CACHE_SIZE'] = int(os.environ.get('DB_STATEMENT_CACHE_SIZE', '256'))
+# Per-connection page cache, memory-mapped I/O window and lock wait (see apply_connection_pragmas)
+app.config['DB_CACHE_SIZE_KB'] = int(os.environ.get('DB_CACHE_SIZE_KB', '16384'))
+app.config['DB_MMAP_SIZE'] = int(os.environ.get('DB_MMAP_SIZE', str(256 * 1024 * 1024)))
+app.config['DB_BUSY_TIMEOUT_MS'] = int(os.environ.get('DB_BUSY_TIMEOUT_MS', '5000'))
+# Logged-in user record cache: max entries (0 disables) and seconds before a record is re-read
+app.config['USER_CACHE_SIZE'] = int(os.environ.get('USER_CACHE_SIZE', '10000'))
+app.config['USER_CACHE_TTL'] = float(os.environ.get('USER_CACHE_TTL', '60'))
+# Crops listed in the dashboard's "Your Crops" table (most recently planted first)
+app.config['DASHBOARD_RECENT_CROPS'] = int(os.environ.get('DASHBOARD_RECENT_CROPS', '5'))
+# Soil test history: rows per page on the fertilizer page, largest page /api/soil-tests returns,
+# and rows fetched per query while streaming the full-history export
+app.config['SOIL_HISTORY_PAGE_SIZE'] = int(os.environ.get('SOIL_HISTORY_PAGE_SIZE', '20'))
+app.config['SOIL_HISTORY_MAX_PAGE_SIZE'] = int(os.environ.get('SOIL_HISTORY_MAX_PAGE_SIZE', '100'))
+app.config['SOIL_HISTORY_EXPORT_BATCH'] = int(os.environ.get('SOIL_HISTORY_EXPORT_BATCH', '500'))
+# Weather source: 'static' (built-in readings) or 'http' (GET <WEATHER_API_URL>/weather?city=..., see
+# weather_service.py; `python weather_service.py` runs a local stub API on the default URL)
+app.config['WEATHER_PROVIDER'] = os.environ.get('WEATHER_PROVIDER', 'static')
+app.config['WEATHER_API_URL'] = os.environ.get('WEATHER_API_URL', 'http://127.0.0.1:8765')
+app.config['WEATHER_API_KEY'] = os.environ.get('WEATHER_API_KEY')
+app.config['WEATHER_TIMEOUT'] = float(os.environ.get('WEATHER_TIMEOUT', '5'))
+# Weather cache: seconds a reading is fresh, further seconds it is served while refreshing in the
+# background, seconds a failed fetch is not retried, max cached locations, and refresh threads
+app.config['WEATHER_CACHE_TTL'] = float(os.environ.get('WEATHER_CACHE_TTL', '600'))
+app.config['WEATHER_STALE_TTL'] = float(os.environ.get('WEATHER_STALE_TTL', '3600'))
+app.config['WEATHER_ERROR_TTL'] = float(os.environ.get('WEATHER_ERROR_TTL', '60'))
+app.config['WEATHER_CACHE_SIZE'] = int(os.environ.get('WEATHER_CACHE_SIZE', '1000'))
+app.config['WEATHER_REFRESH_WORKERS'] = int(os.environ.get('WEATHER_REFRESH_WORKERS', '2'))
+# Bundled station catalog and geocoding table that map each farm location to its nearest weather station
+app.config['WEATHER_STATIONS_PATH'] = os.environ.get('WEATHER_STATIONS_PATH', 'weather_stations.csv')
+app.config['GEOCODING_PATH'] = os.environ.get('GEOCODING_PATH', 'geocoding.csv')
+# Resolved station per user: max entries and lifetime (a changed location is re-resolved immediately)
+app.config['STATION_CACHE_SIZE'] = int(os.environ.get('STATION_CACHE_SIZE', '10000'))
+app.config['STATION_CACHE_TTL'] = float(os.environ.get('STATION_CACHE_TTL', '86400'))
+# Compiled template bytecode persisted across restarts (set to an empty string to disable)
+app.config['TEMPLATE_CACHE_DIR'] = os.environ.get('TEMPLATE_CACHE_DIR', os.path.join(app.instance_path, 'jinja_cache'))
+# Rendered static fragments (landing page, catalog dropdowns, contact form): max entries and lifetime
+app.config['FRAGMENT_CACHE_SIZE'] = int(os.environ.get('FRAGMENT_CACHE_SIZE', '64'))
+app.config['FRAGMENT_CACHE_TTL'] = float(os.environ.get('FRAGMENT_CACHE_TTL', '86400'))
+
+# Page templates come from PAGE_TEMPLATES first, then the regular templates/ folder
+app.jinja_loader = ChoiceLoader([DictLoader(PAGE_TEMPLATES), FileSystemLoader(os.path.join(app.root_path, 'templates'))])
+if app.config['TEMPLATE_CACHE_DIR']:
+    os.makedirs(app.config['TEMPLATE_CACHE_DIR'], exist_ok=True)
+    app.jinja_env.bytecode_cache = FileSystemBytecodeCache(app.config['TEMPLATE_CACHE_DIR'])
+
+
+def precompile_templates():
+    """Compile every page template into the Jinja environment's cache (bytecode cache on restarts)."""
+    for name in PAGE_TEMPLATES:
+        app.jinja_env.get_template(name)
+
+
+precompile_templates()
+
+# Page sources and the catalogs only change with a deploy, so a restart marks when they last changed
+TEMPLATE_VERSION = hashlib.sha256(json.dumps(PAGE_TEMPLATES, sort_keys=True).encode()).hexdigest()[:16]
+CONTENT_LOADED_AT = datetime.now(timezone.utc).replace(microsecond=0)
 
 # ==============================================================================
 # --- KNN Model Loading ---
@@ -1281,25 +1520,123 @@ app.config['MAIL_DEFAULT_SENDER'] = 'your-email@gmail.com'
 
 MODEL_PATH = "knn_model.pkl"
 SCALER_PATH = "scaler.pkl"
-knn_model = None
-scaler = None
-ml_model_available = False
-
-if os.path.exists(MODEL_PATH) and os.path.exists(SCALER_PATH):
-    try:
+# Categorical code tables the KNN was trained with, saved beside the model by train_knn.py
+KNN_ENCODER_PATH = "knn_encoder.npz"
+# Precomputed neighbor index built by build_knn_index.py. KNN_INDEX_MODE selects 'exact' (KD/ball tree),
+# 'approximate' (bucketed IVF search) or 'model' (the pickled classifier's own kneighbors()).
+KNN_INDEX_PATH = "knn_index.pkl"
+app.config['KNN_INDEX_MODE'] = os.environ.get('KNN_INDEX_MODE', 'exact')
+# Memory-mapped export written by export_model_artifacts.py; preferred over the pickles it was exported from
+MODEL_ARTIFACT_DIR = "knn_artifacts"
+# ML_PRELOAD=1 loads the model while the module is imported (e.g. gunicorn --preload, before workers fork)
+app.config['ML_PRELOAD'] = os.environ.get('ML_PRELOAD', '0') == '1'
+app.config['ML_RETRY_INTERVAL'] = float(os.environ.get('ML_RETRY_INTERVAL', '30'))
+# Seconds between checks of the model files for a retrain; 0 disables watching (use /admin/reload-model)
+app.config['ML_WATCH_INTERVAL'] = float(os.environ.get('ML_WATCH_INTERVAL', '10'))
+# Held-out sample (raw feature rows 'X', labels 'y') a reloaded model must score before it is swapped in
+KNN_HOLDOUT_PATH = "knn_holdout.npz"
+app.config['ML_MIN_HOLDOUT_ACCURACY'] = float(os.environ.get('ML_MIN_HOLDOUT_ACCURACY', '0.5'))
+# Prediction result cache: max entries (0 disables), entry lifetime and numeric input quantization step
+app.config['PREDICTION_CACHE_SIZE'] = int(os.environ.get('PREDICTION_CACHE_SIZE', '10000'))
+app.config['PREDICTION_CACHE_TTL'] = float(os.environ.get('PREDICTION_CACHE_TTL', '300'))
+app.config['PREDICTION_CACHE_RESOLUTION'] = float(os.environ.get('PREDICTION_CACHE_RESOLUTION', '0.1'))
+# Token for POST /admin/reload-model; the endpoint is disabled when unset
+app.config['ADMIN_TOKEN'] = os.environ.get('AGRIDASH_ADMIN_TOKEN')
+
+
+def load_knn_engine():
+    """Load the KNN model, scaler and neighbor index; returns None if no model files exist."""
+    if artifacts_current(MODEL_ARTIFACT_DIR, MODEL_PATH, SCALER_PATH):
+        knn_model, scaler = load_knn_artifacts(MODEL_ARTIFACT_DIR)
+    elif os.path.exists(MODEL_PATH) and os.path.exists(SCALER_PATH):
+        if os.path.exists(os.path.join(MODEL_ARTIFACT_DIR, ARTIFACT_HEADER)):
+            print(f"{MODEL_ARTIFACT_DIR}/ was not exported from the current {MODEL_PATH}; serving the pickles "
+                  f"(re-run export_model_artifacts.py).")
         with open(MODEL_PATH, 'rb') as f:
             knn_model = pickle.load(f)
         with open(SCALER_PATH, 'rb') as f:
             scaler = pickle.load(f)
+    else:
+        return None
 
-        # Check if the loaded model has the necessary properties
-        if hasattr(knn_model, 'predict') and hasattr(scaler, 'transform'):
-            ml_model_available = True
-        else:
-            print("Warning: Loaded files do not appear to be valid scikit-learn model/scaler objects.")
+    # Check if the loaded model has the necessary properties
+    if not (hasattr(knn_model, 'kneighbors') and hasattr(scaler, 'transform')):
+        raise TypeError("Loaded files do not appear to be valid scikit-learn model/scaler objects.")
+
+    if not os.path.exists(KNN_ENCODER_PATH):
+        raise FileNotFoundError(f"{KNN_ENCODER_PATH} is missing; re-run train_knn.py to save the model's encoder.")
+    knn_encoder = CategoricalEncoder.load(KNN_ENCODER_PATH)
+
+    knn_index = load_knn_index(KNN_INDEX_PATH, knn_model, app.config['KNN_INDEX_MODE'])
+    return KNNInferenceEngine(knn_model, scaler, index=knn_index, encoder=knn_encoder)
+
+
+def validate_knn_engine(engine):
+    """Reject a freshly loaded engine whose smoke test produces invalid neighbors or labels."""
+    scaler = engine.scaler
+    probe = np.asarray(scaler.mean_) + np.outer(np.linspace(-2, 2, 9), np.asarray(scaler.scale_))
+    result = engine.predict(probe)
+    if not np.all(np.isfinite(result.nearest_distances)) or not np.all(np.isin(result.labels, engine.classes)):
+        raise ValueError("Smoke test produced invalid neighbors or labels.")
+    missing = [INPUT_COLUMNS[field] for field in CATEGORICAL_INPUT_FIELDS
+               if INPUT_COLUMNS[field] not in engine.encoder.classes]
+    if missing:
+        raise ValueError(f"{KNN_ENCODER_PATH} has no code table for {', '.join(missing)}.")
+
+
+def check_knn_holdout(engine):
+    """Reject a retrained engine that scores poorly on the held-out sample (gates reloads only)."""
+    if os.path.exists(KNN_HOLDOUT_PATH):
+        with np.load(KNN_HOLDOUT_PATH, allow_pickle=False) as holdout:
+            X, y = holdout['X'], holdout['y']
+        # Compare fertilizer names, so models predicting fertilizers_ml indexes are scored on the same labels
+        predicted = [format_prediction(label, 0)["fertilizer"].lower() for label in engine.predict(X).labels]
+        accuracy = float(np.mean(np.asarray(predicted) == np.char.lower(y.astype(str))))
+        if accuracy < app.config['ML_MIN_HOLDOUT_ACCURACY']:
+            raise ValueError(f"Held-out accuracy {accuracy:.3f} is below {app.config['ML_MIN_HOLDOUT_ACCURACY']}.")
+
+
+knn_registry = ModelRegistry(
+    load_knn_engine,
+    name='knn',
+    retry_interval=app.config['ML_RETRY_INTERVAL'],
+    validator=validate_knn_engine,
+    reload_validator=check_knn_holdout,
+    watch_paths=[MODEL_PATH, SCALER_PATH, KNN_ENCODER_PATH, os.path.join(MODEL_ARTIFACT_DIR, ARTIFACT_HEADER), KNN_INDEX_PATH],
+    watch_interval=app.config['ML_WATCH_INTERVAL']
+)
+
+# Keras ANN exported to plain weight arrays by export_ann_weights.py, served with NumPy only
+ANN_WEIGHTS_PATH = os.path.join("output_models", "ann_weights.npz")
+
+
+def load_ann_engine():
+    """Load the exported ANN weights; returns None if they have not been exported."""
+    if not os.path.exists(ANN_WEIGHTS_PATH):
+        return None
+    return ANNInferenceEngine.from_npz(ANN_WEIGHTS_PATH)
+
+
+def validate_ann_engine(engine):
+    """Reject exported weights whose forward pass does not produce a probability distribution."""
+    probe = engine.scaler.mean_ + np.outer(np.linspace(-2, 2, 9), engine.scaler.scale_)
+    probabilities = engine.predict_proba(probe)
+    if probabilities.shape[1] != len(engine.class_names) or not np.allclose(probabilities.sum(axis=1), 1, atol=1e-3):
+        raise ValueError("Smoke test produced invalid class probabilities.")
 
-    except Exception as e:
-        print(f"Error loading KNN model or scaler: {e}")
+
+ann_registry = ModelRegistry(
+    load_ann_engine,
+    name='ann',
+    retry_interval=app.config['ML_RETRY_INTERVAL'],
+    validator=validate_ann_engine,
+    watch_paths=[ANN_WEIGHTS_PATH],
+    watch_interval=app.config['ML_WATCH_INTERVAL']
+)
+
+if app.config['ML_PRELOAD']:
+    knn_registry.load()
+    ann_registry.load()
 
 # ==============================================================================
 # --- ML/App Data ---
@@ -1385,10 +1722,30 @@ fertilizers_ml = sorted([
     "Calcium Carbonate", "Calcium Magnesium Fertilizers", "Sodium Sulphate", "Magnesium Oxide"
 ])
 
-# Create integer mappings for ML model input
+# Integer mappings served by /api/catalog (knn_encoder.npz holds the same codes for the shipped KNN)
 crop_to_int = {crop: i for i, crop in enumerate([item for sublist in crops_ml.values() for item in sublist])}
 region_to_int = {region: i for i, region in enumerate(regions_ml)}
 month_to_int = {month: i for i, month in enumerate(months_ml)}
+CROP_GROUP_LABELS = {
+    "cereals": "Cereals", "pulses": "Pulses", "oilseeds": "Oilseeds",
+    "cash_crops": "Cash Crops", "vegetables": "Vegetables", "fruits": "Fruits"
+}
+
+
+def build_catalog():
+    """Dropdown catalogs and the model's integer encodings, as served by /api/catalog."""
+    return {
+        "crop_groups": [{"key": key, "label": CROP_GROUP_LABELS[key], "crops": crops} for key, crops in crops_ml.items()],
+        "regions": regions_ml,
+        "months": months_ml,
+        "fertilizers": fertilizers_ml,
+        "encodings": {"crop": crop_to_int, "region": region_to_int, "month": month_to_int},
+    }
+
+
+# Serialized once; its content hash versions /api/catalog/<version> and keys fragment caches and page ETags
+CATALOG_BODY = json.dumps(build_catalog(), sort_keys=True, separators=(',', ':')).encode()
+CATALOG_VERSION = hashlib.sha256(CATALOG_BODY).hexdigest()[:16]
 EXPECTED_MODEL_INPUT_FEATURES = 10
 
 
@@ -1397,8 +1754,27 @@ EXPECTED_MODEL_INPUT_FEATURES = 10
 # ==============================================================================
 
 def init_db():
-    """Initialize SQLite database with users table if it doesn't exist."""
-    conn = sqlite3.connect('agridash.db')
+    """Initialize SQLite database with users table if it doesn't exist, then apply migrations."""
+    conn = sqlite3.connect(app.config['DATABASE'])
+    create_schema(conn)
+    migrate_db(conn)
+    conn.close()
+
+
+def ensure_db_schema():
+    """Run init_db() unless the database is already fully migrated and in WAL mode."""
+    conn = sqlite3.connect(app.config['DATABASE'])
+    try:
+        current_version = conn.execute('PRAGMA user_version').fetchone()[0]
+        journal_mode = conn.execute('PRAGMA journal_mode').fetchone()[0]
+    finally:
+        conn.close()
+    if current_version < SCHEMA_MIGRATIONS[-1][0] or journal_mode.lower() != 'wal':
+        init_db()
+
+
+def create_schema(conn):
+    """Create the base tables (as first released) if they don't exist."""
     cursor = conn.cursor()
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS users (
@@ -1441,14 +1817,173 @@ def init_db():
         )
     ''')
     conn.commit()
-    conn.close()
+
+
+# Ordered (version, statements) schema changes; PRAGMA user_version records the last one applied
+SCHEMA_MIGRATIONS = [
+    (1, [
+        # Serve "WHERE user_id = ? ORDER BY <date> DESC" straight from the index, no table scan or sort
+        'CREATE INDEX IF NOT EXISTS idx_crops_user_planting ON crops (user_id, planting_date)',
+        'CREATE INDEX IF NOT EXISTS idx_soil_testing_user_date ON soil_testing (user_id, test_date)',
+    ]),
+    (2, [
+        # Per-user dashboard totals, kept current by the triggers below on every crop/soil test write
+        '''CREATE TABLE IF NOT EXISTS dashboard_summary (
+            user_id INTEGER PRIMARY KEY,
+            crop_count INTEGER NOT NULL DEFAULT 0,
+            total_acreage REAL NOT NULL DEFAULT 0,
+            latest_soil_test_id INTEGER
+        )''',
+        '''CREATE TRIGGER IF NOT EXISTS trg_crops_summary_insert AFTER INSERT ON crops BEGIN
+            INSERT INTO dashboard_summary (user_id, crop_count, total_acreage) VALUES (NEW.user_id, 1, NEW.acre)
+            ON CONFLICT (user_id) DO UPDATE SET crop_count = crop_count + 1, total_acreage = total_acreage + NEW.acre;
+        END''',
+        # Back to exactly 0 when the last crop goes, so float drift from repeated +/- never shows
+        '''CREATE TRIGGER IF NOT EXISTS trg_crops_summary_delete AFTER DELETE ON crops BEGIN
+            UPDATE dashboard_summary SET crop_count = crop_count - 1,
+                total_acreage = CASE WHEN crop_count = 1 THEN 0 ELSE total_acreage - OLD.acre END
+            WHERE user_id = OLD.user_id;
+        END''',
+        '''CREATE TRIGGER IF NOT EXISTS trg_crops_summary_update AFTER UPDATE OF user_id, acre ON crops BEGIN
+            UPDATE dashboard_summary SET crop_count = crop_count - 1,
+                total_acreage = CASE WHEN crop_count = 1 THEN 0 ELSE total_acreage - OLD.acre END
+            WHERE user_id = OLD.user_id;
+            INSERT INTO dashboard_summary (user_id, crop_count, total_acreage) VALUES (NEW.user_id, 1, NEW.acre)
+            ON CONFLICT (user_id) DO UPDATE SET crop_count = crop_count + 1, total_acreage = total_acreage + NEW.acre;
+        END''',
+        # Latest test = first row of get_soil_test_page()'s order; one seek on idx_soil_testing_user_date
+        '''CREATE TRIGGER IF NOT EXISTS trg_soil_summary_insert AFTER INSERT ON soil_testing BEGIN
+            INSERT INTO dashboard_summary (user_id, latest_soil_test_id) VALUES (NEW.user_id, NEW.id)
+            ON CONFLICT (user_id) DO UPDATE SET latest_soil_test_id = (
+                SELECT id FROM soil_testing WHERE user_id = NEW.user_id ORDER BY test_date DESC, id DESC LIMIT 1);
+        END''',
+        '''CREATE TRIGGER IF NOT EXISTS trg_soil_summary_delete AFTER DELETE ON soil_testing BEGIN
+            UPDATE dashboard_summary SET latest_soil_test_id = (
+                SELECT id FROM soil_testing WHERE user_id = OLD.user_id ORDER BY test_date DESC, id DESC LIMIT 1)
+            WHERE user_id = OLD.user_id;
+        END''',
+        '''CREATE TRIGGER IF NOT EXISTS trg_soil_summary_update AFTER UPDATE OF user_id, test_date ON soil_testing BEGIN
+            UPDATE dashboard_summary SET latest_soil_test_id = (
+                SELECT id FROM soil_testing WHERE user_id = OLD.user_id ORDER BY test_date DESC, id DESC LIMIT 1)
+            WHERE user_id = OLD.user_id;
+            INSERT INTO dashboard_summary (user_id, latest_soil_test_id) VALUES (NEW.user_id, NEW.id)
+            ON CONFLICT (user_id) DO UPDATE SET latest_soil_test_id = (
+                SELECT id FROM soil_testing WHERE user_id = NEW.user_id ORDER BY test_date DESC, id DESC LIMIT 1);
+        END''',
+        # Backfill users who already have crops or soil tests
+        '''INSERT OR REPLACE INTO dashboard_summary (user_id, crop_count, total_acreage, latest_soil_test_id)
+            SELECT u.user_id,
+                (SELECT COUNT(*) FROM crops WHERE user_id = u.user_id),
+                (SELECT COALESCE(SUM(acre), 0) FROM crops WHERE user_id = u.user_id),
+                (SELECT id FROM soil_testing WHERE user_id = u.user_id ORDER BY test_date DESC, id DESC LIMIT 1)
+            FROM (SELECT user_id FROM crops UNION SELECT user_id FROM soil_testing) AS u''',
+    ]),
+]
+
+
+def migrate_db(conn):
+    """Apply pending schema migrations and switch the database to WAL journaling."""
+    for version, statements in SCHEMA_MIGRATIONS:
+        if version <= conn.execute('PRAGMA user_version').fetchone()[0]:
+            continue
+        # Take the write lock before re-checking, so workers starting together apply each migration once
+        conn.execute('BEGIN IMMEDIATE')
+        with conn:
+            if conn.execute('PRAGMA user_version').fetchone()[0] >= version:
+                continue
+            for statement in statements:
+                conn.execute(statement)
+            conn.execute(f'PRAGMA user_version = {version}')
+        print(f"Applied database migration {version}.")
+
+    # WAL is persistent in the database file: readers no longer block on writers (or vice versa)
+    conn.execute('PRAGMA journal_mode = WAL')
+    conn.execute('ANALYZE')
+
+
+def apply_connection_pragmas(conn):
+    """Per-connection tuning; WAL makes synchronous=NORMAL safe against corruption."""
+    conn.execute('PRAGMA synchronous = NORMAL')
+    conn.execute(f"PRAGMA cache_size = -{app.config['DB_CACHE_SIZE_KB']}")
+    conn.execute(f"PRAGMA mmap_size = {app.config['DB_MMAP_SIZE']}")
+    conn.execute(f"PRAGMA busy_timeout = {app.config['DB_BUSY_TIMEOUT_MS']}")
+    conn.execute('PRAGMA temp_store = MEMORY')
+
+
+class SQLiteConnectionPool:
+    """A small pool of long-lived SQLite connections handed out one per request.
+
+    Keeping connections open avoids the connect/teardown cost on every query and lets each
+    connection's prepared-statement cache (sqlite3 `cached_statements`) survive across requests.
+    """
+
+    def __init__(self, path, size=8, statement_cache_size=256, setup=None):
+        self.path = path
+        self.size = size
+        self.statement_cache_size = statement_cache_size
+        # Called once, before the first connection is opened (schema migrations)
+        self.setup = setup
+        self._setup_lock = threading.Lock()
+        self._idle = queue.LifoQueue(maxsize=size)
+        self._pid = os.getpid()
+        self.created = 0
+        self.reused = 0
+
+    def _connect(self):
+        if self.setup is not None:
+            with self._setup_lock:
+                if self.setup is not None:
+                    self.setup()
+                    self.setup = None
+        # Connections may be released by a different worker thread than the one that opened them
+        conn = sqlite3.connect(self.path, check_same_thread=False, cached_statements=self.statement_cache_size)
+        conn.row_factory = sqlite3.Row
+        apply_connection_pragmas(conn)
+        self.created += 1
+        return conn
+
+    def acquire(self):
+        if self._pid != os.getpid():
+            # Never share SQLite handles across fork(): start the child with an empty pool
+            self._idle = queue.LifoQueue(maxsize=self.size)
+            self._pid = os.getpid()
+        try:
+            conn = self._idle.get_nowait()
+            self.reused += 1
+            return conn
+        except queue.Empty:
+            return self._connect()
+
+    def release(self, conn):
+        if conn.in_transaction:
+            # Discard work a failed helper left uncommitted so the next request starts clean
+            conn.rollback()
+        try:
+            self._idle.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+    def stats(self):
+        return {"size": self.size, "idle": self._idle.qsize(), "created": self.created, "reused": self.reused}
+
+
+db_pool = SQLiteConnectionPool(app.config['DATABASE'], size=app.config['DB_POOL_SIZE'],
+                               statement_cache_size=app.config['DB_STATEMENT_CACHE_SIZE'], setup=ensure_db_schema)
 
 
 def get_db_connection():
-    """Get a connection to the SQLite database."""
-    conn = sqlite3.connect('agridash.db')
-    conn.row_factory = sqlite3.Row
-    return conn
+    """Get this request's SQLite connection, checking one out of the pool on first use."""
+    if 'db' not in g:
+        g.db = db_pool.acquire()
+    return g.db
+
+
+@app.teardown_appcontext
+def release_db_connection(exception=None):
+    """Return the request's connection to the pool when the app context ends."""
+    conn = g.pop('db', None)
+    if conn is not None:
+        db_pool.release(conn)
 
 
 # --- User Retrieval Functions ---
@@ -1457,15 +1992,48 @@ def get_user_by_id(user_id):
     """Retrieve a user by their ID."""
     conn = get_db_connection()
     user = conn.execute('SELECT * FROM users WHERE id = ?', (user_id,)).fetchone()
-    conn.close()
     return user
 
 
+def get_cached_user(user_id):
+    """Retrieve a user by ID through the in-process user cache (see invalidate_cached_user)."""
+    user = user_cache.get(user_id)
+    if user is None:
+        user = get_user_by_id(user_id)
+        if user is not None:
+            user_cache.set(user_id, user)
+    return user
+
+
+def invalidate_cached_user(user_id):
+    """Drop a user's cached record after their row changes."""
+    user_cache.delete(user_id)
+
+
+def get_user_station(user):
+    """StationMatch for the user's farm location, resolved once per user and location (see station_cache)."""
+    location = user['location'] or ''
+    cached = station_cache.get(user['id'])
+    if cached is not None and cached[0] == location:
+        return cached[1]
+    match = station_catalog.resolve(location)
+    station_cache.set(user['id'], (location, match))
+    return match
+
+
+def get_user_weather_city(user):
+    """City whose weather a user sees: the station nearest their farm, or Delhi without a location."""
+    if user is None or not user['location']:
+        return 'Delhi'
+    if station_catalog is None:
+        return user['location']
+    return get_user_station(user).station['name']
+
+
 def get_user_by_email(email):
     """Retrieve a user by their email address."""
     conn = get_db_connection()
     user = conn.execute('SELECT * FROM users WHERE email = ?', (email,)).fetchone()
-    conn.close()
     return user
 
 
@@ -1477,7 +2045,6 @@ def get_user_by_identifier(identifier):
     if not user:
         # Check for email if not found by username
         user = conn.execute('SELECT * FROM users WHERE email = ?', (identifier,)).fetchone()
-    conn.close()
     return user
 
 
@@ -1489,7 +2056,6 @@ def get_user_by_reset_token(token):
         'SELECT * FROM users WHERE reset_token = ? AND token_expiry > datetime("now")',
         (token,)
     ).fetchone()
-    conn.close()
     return user
 
 
@@ -1504,19 +2070,17 @@ def set_reset_token(user_id, token):
             (token, expiry_time, user_id)
         )
         conn.commit()
+        invalidate_cached_user(user_id)
         return True
     except Exception as e:
         print(f"Set reset token error: {e}")
         return False
-    finally:
-        conn.close()
 
 
 def get_all_users():
     """Retrieve all users from the database."""
     conn = get_db_connection()
     users = conn.execute('SELECT * FROM users').fetchall()
-    conn.close()
     return users
 
 
@@ -1535,8 +2099,6 @@ def create_user(username, password_hash, email, phone, full_name, farm_name, loc
     except sqlite3.IntegrityError as e:
         print(f"Integrity error: {e}")
         return False
-    finally:
-        conn.close()
 
 
 def update_password(user_id, password_hash):
@@ -1548,12 +2110,25 @@ def update_password(user_id, password_hash):
             (password_hash, user_id)
         )
         conn.commit()
+        invalidate_cached_user(user_id)
         return True
     except Exception as e:
         print(f"Password update error: {e}")
         return False
-    finally:
-        conn.close()
+
+
+def update_password_hash(user_id, old_hash, new_hash):
+    """Replace a password hash with a rehash of the same password, unless it changed meanwhile."""
+    conn = get_db_connection()
+    try:
+        conn.execute('UPDATE users SET password_hash = ? WHERE id = ? AND password_hash = ?',
+                     (new_hash, user_id, old_hash))
+        conn.commit()
+        invalidate_cached_user(user_id)
+        return True
+    except Exception as e:
+        print(f"Password rehash error: {e}")
+        return False
 
 
 def update_user_profile(user_id, email, phone, full_name, farm_name, location, total_land):
@@ -1565,12 +2140,11 @@ def update_user_profile(user_id, email, phone, full_name, farm_name, location, t
             (email, phone, full_name, farm_name, location, total_land, user_id)
         )
         conn.commit()
+        invalidate_cached_user(user_id)
         return True
     except sqlite3.IntegrityError as e:
         print(f"Profile update integrity error: {e}")
         return False
-    finally:
-        conn.close()
 
 
 # --- Crop CRUD Functions ---
@@ -1588,8 +2162,6 @@ def add_user_crop(user_id, acre, crop_type, stage, planting_date):
     except Exception as e:
         print(f"Add crop error: {e}")
         return False
-    finally:
-        conn.close()
 
 
 def get_user_crops(user_id):
@@ -1599,7 +2171,6 @@ def get_user_crops(user_id):
         'SELECT * FROM crops WHERE user_id = ? ORDER BY planting_date DESC',
         (user_id,)
     ).fetchall()
-    conn.close()
     return crops
 
 
@@ -1613,28 +2184,68 @@ def delete_user_crop(crop_id, user_id):
     )
     success = cursor.rowcount > 0
     conn.commit()
-    conn.close()
     return success
 
 
-# --- Soil Testing Functions ---
-
-def get_soil_testing_data(user_id):
-    """Retrieve all soil test results for the user, newest first."""
+def get_recent_user_crops(user_id, limit):
+    """The user's `limit` most recently planted crops, read straight off idx_crops_user_planting."""
     conn = get_db_connection()
-    data = conn.execute(
-        'SELECT * FROM soil_testing WHERE user_id = ? ORDER BY test_date DESC',
-        (user_id,)
+    return conn.execute(
+        'SELECT * FROM crops WHERE user_id = ? ORDER BY planting_date DESC LIMIT ?',
+        (user_id, limit)
     ).fetchall()
-    conn.close()
-    return data
 
 
-def get_last_soil_test_date(soil_data):
-    """Get the date of the most recent soil test."""
-    if soil_data:
-        return soil_data[0]['test_date']
-    return 'N/A'
+# --- Soil Testing Functions ---
+
+def encode_soil_test_cursor(test):
+    """Opaque keyset cursor pointing just past `test` in history order."""
+    raw = json.dumps([test['test_date'], test['id']]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_soil_test_cursor(cursor):
+    """(test_date, id) from a cursor made by encode_soil_test_cursor; ValueError if it is malformed."""
+    try:
+        test_date, test_id = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except (ValueError, TypeError):
+        raise ValueError("Invalid cursor.")
+    if not isinstance(test_date, str) or not isinstance(test_id, int):
+        raise ValueError("Invalid cursor.")
+    return test_date, test_id
+
+
+def get_soil_test_page(user_id, limit, after=None):
+    """One page of the user's soil tests, newest first, and the cursor of the next page (None at the end).
+
+    Keyset pagination over (user_id, test_date, id): each page is a range seek on
+    idx_soil_testing_user_date, so deep pages cost the same as the first.
+    """
+    conn = get_db_connection()
+    if after is None:
+        rows = conn.execute(
+            'SELECT * FROM soil_testing WHERE user_id = ? ORDER BY test_date DESC, id DESC LIMIT ?',
+            (user_id, limit + 1)
+        ).fetchall()
+    else:
+        rows = conn.execute(
+            'SELECT * FROM soil_testing WHERE user_id = ? AND (test_date, id) < (?, ?) '
+            'ORDER BY test_date DESC, id DESC LIMIT ?',
+            (user_id, after[0], after[1], limit + 1)
+        ).fetchall()
+    next_cursor = encode_soil_test_cursor(rows[limit - 1]) if len(rows) > limit else None
+    return rows[:limit], next_cursor
+
+
+def iter_soil_tests(user_id, batch_size):
+    """Every soil test of the user, newest first, read one keyset page at a time."""
+    after = None
+    while True:
+        rows, next_cursor = get_soil_test_page(user_id, batch_size, after)
+        yield from rows
+        if next_cursor is None:
+            return
+        after = (rows[-1]['test_date'], rows[-1]['id'])
 
 
 def add_soil_test_result(user_id, test_date, n_level, p_level, k_level, ph_level, recommendations):
@@ -1650,47 +2261,72 @@ def add_soil_test_result(user_id, test_date, n_level, p_level, k_level, ph_level
     except Exception as e:
         print(f"Add soil test error: {e}")
         return False
-    finally:
-        conn.close()
+
+
+# --- Dashboard Summary ---
+
+def get_dashboard_summary(user_id):
+    """Crop count, total acreage and latest soil test from the trigger-maintained dashboard_summary row."""
+    conn = get_db_connection()
+    row = conn.execute(
+        'SELECT s.crop_count, s.total_acreage, t.* FROM dashboard_summary s '
+        'LEFT JOIN soil_testing t ON t.id = s.latest_soil_test_id WHERE s.user_id = ?',
+        (user_id,)
+    ).fetchone()
+    if row is None:
+        return {'crop_count': 0, 'total_acreage': 0, 'latest_soil_test': None}
+    return {
+        'crop_count': row['crop_count'],
+        'total_acreage': row['total_acreage'],
+        'latest_soil_test': dict(row) if row['id'] is not None else None,
+    }
 
 
 # ==============================================================================
 # --- Static Data/Simulation Functions ---
 # ==============================================================================
 
-STATIC_WEATHER = {
-    'Delhi': {'temperature': 28, 'description': 'Sunny with haze', 'humidity': 65, 'icon': '☀️', 'wind': '5 km/h'},
-    'Pune': {'temperature': 24, 'description': 'Partly Cloudy', 'humidity': 70, 'icon': '⛅', 'wind': '10 km/h'},
-    'Shimla': {'temperature': 15, 'description': 'Cloudy, chance of rain', 'humidity': 60, 'icon': '☁️',
-               'wind': '8 km/h'},
-    'Bangalore': {'temperature': 26, 'description': 'Clear skies', 'humidity': 68, 'icon': '☀️', 'wind': '7 km/h'},
-    'Mumbai': {'temperature': 30, 'description': 'Humid and Overcast', 'humidity': 80, 'icon': '🌧️', 'wind': '12 km/h'},
-    'Hyderabad': {'temperature': 27, 'description': 'Light Rain', 'humidity': 75, 'icon': '🌧️', 'wind': '8 km/h'}
-}
+# Built-in readings: the 'static' provider, and the fallback whenever the configured provider fails
+static_weather = StaticWeatherProvider(STATIC_WEATHER, default_city='Delhi')
 
 
-def get_weather_data(location):
-    """Fetches weather data for a given location, defaulting to Delhi if location is unknown."""
-    city = location.title()  # Capitalize first letter of each word
-    if city in STATIC_WEATHER:
-        data = STATIC_WEATHER[city].copy()
-        data['city'] = city
-        data['forecast'] = [
-            {'day': 'Tomorrow', 'condition': 'Sunny', 'high': 29, 'low': 20, 'icon': '☀️'},
-            {'day': 'Day 3', 'condition': 'Partly Cloudy', 'high': 27, 'low': 18, 'icon': '⛅'},
-            {'day': 'Day 4', 'condition': 'Light Rain', 'high': 25, 'low': 17, 'icon': '🌧️'},
-        ]
-        return data
+def build_weather_provider():
+    """The provider selected by WEATHER_PROVIDER ('static' or 'http')."""
+    if app.config['WEATHER_PROVIDER'] == 'http':
+        return HTTPWeatherProvider(app.config['WEATHER_API_URL'], timeout=app.config['WEATHER_TIMEOUT'],
+                                   api_key=app.config['WEATHER_API_KEY'])
+    return static_weather
+
+
+weather_cache = WeatherCache(
+    build_weather_provider(),
+    ttl=app.config['WEATHER_CACHE_TTL'],
+    stale_ttl=app.config['WEATHER_STALE_TTL'],
+    error_ttl=app.config['WEATHER_ERROR_TTL'],
+    max_entries=app.config['WEATHER_CACHE_SIZE'],
+    refresh_workers=app.config['WEATHER_REFRESH_WORKERS']
+)
+
+
+def load_station_catalog():
+    """The nearest-station catalog, or None (weather is then looked up by the location text itself)."""
+    try:
+        return StationCatalog.from_csv(app.config['WEATHER_STATIONS_PATH'], app.config['GEOCODING_PATH'])
+    except (OSError, KeyError, ValueError, StopIteration) as e:
+        print(f"Station catalog unavailable, using location names for weather: {e}")
+        return None
 
-    # Fallback to Delhi if user location is not in static data
-    data = STATIC_WEATHER['Delhi'].copy()
-    data['city'] = 'Delhi'
-    data['forecast'] = [
-        {'day': 'Tomorrow', 'condition': 'Sunny', 'high': 29, 'low': 20, 'icon': '☀️'},
-        {'day': 'Day 3', 'condition': 'Partly Cloudy', 'high': 27, 'low': 18, 'icon': '⛅'},
-        {'day': 'Day 4', 'condition': 'Light Rain', 'high': 25, 'low': 17, 'icon': '🌧️'},
-    ]
-    return data
+
+station_catalog = load_station_catalog()
+
+
+def get_weather_data(location):
+    """Weather for a location through the provider cache, defaulting to Delhi if the provider has none."""
+    try:
+        return weather_cache.get(location or 'Delhi')
+    except Exception:
+        # The cache already logged the failure; an unknown city or an outage must not break the page
+        return static_weather.fetch(location)
 
 
 def get_fertilizer_recommendation(soil_data, crop_type):
@@ -1761,8 +2397,137 @@ def categorize_fertilizer(fertilizer_name):
         return "Specialty Fertilizer"
 
 
+# ==============================================================================
+# --- Email Delivery ---
+# ==============================================================================
+
+class MailQueue:
+    """Delivers email from a background thread over one persistent, reconnecting SMTP connection.
+
+    enqueue() returns at once, so a slow mail server never holds up a request. When the bounded
+    queue is full the message is rejected rather than blocking. A failed send reconnects and is
+    retried with exponential backoff; permanent (5xx) rejections are not retried.
+    """
+
+    def __init__(self, config):
+        self.config = config
+        self._queue = queue.Queue(maxsize=config['MAIL_QUEUE_SIZE'])
+        self._lock = threading.Lock()
+        self._worker_pid = None
+        self._smtp = None
+        self.enqueued = 0
+        self.sent = 0
+        self.retries = 0
+        self.failed = 0
+        self.rejected = 0
+        self.connections = 0
+
+    def enqueue(self, msg):
+        """Queue a message for delivery; returns False if the queue is full."""
+        self._ensure_worker()
+        try:
+            self._queue.put_nowait(msg)
+        except queue.Full:
+            self.rejected += 1
+            print(f"Email queue full, dropping message to {msg['To']}")
+            return False
+        self.enqueued += 1
+        return True
+
+    def _ensure_worker(self):
+        # One delivery thread per process; threads do not survive fork(), so restart it in each worker
+        if self._worker_pid == os.getpid():
+            return
+        with self._lock:
+            if self._worker_pid != os.getpid():
+                self._smtp = None
+                threading.Thread(target=self._worker, name='mail-queue', daemon=True).start()
+                self._worker_pid = os.getpid()
+
+    def _connect(self):
+        server = smtplib.SMTP(self.config['MAIL_SERVER'], self.config['MAIL_PORT'],
+                              timeout=self.config['MAIL_TIMEOUT'])
+        if self.config['MAIL_USE_TLS']:
+            server.starttls()
+        if self.config['MAIL_USERNAME'] and self.config['MAIL_PASSWORD']:
+            server.login(self.config['MAIL_USERNAME'], self.config['MAIL_PASSWORD'])
+        self.connections += 1
+        return server
+
+    def _disconnect(self):
+        if self._smtp is not None:
+            try:
+                self._smtp.quit()
+            except (smtplib.SMTPException, OSError):
+                pass
+            self._smtp = None
+
+    def _worker(self):
+        while True:
+            try:
+                msg = self._queue.get(timeout=self.config['MAIL_IDLE_TIMEOUT'])
+            except queue.Empty:
+                # Servers drop idle sessions anyway; reconnect on the next message
+                self._disconnect()
+                continue
+            try:
+                self._deliver(msg)
+            except Exception as e:
+                # A malformed message (e.g. an unencodable header) must not end the only delivery thread
+                print(f"Email error (not retried) to {msg['To']}: {e!r}")
+                self._disconnect()
+                self.failed += 1
+            finally:
+                self._queue.task_done()
+
+    def _deliver(self, msg):
+        max_retries = self.config['MAIL_MAX_RETRIES']
+        for attempt in range(max_retries + 1):
+            try:
+                if self._smtp is None:
+                    self._smtp = self._connect()
+                self._smtp.send_message(msg)
+                self.sent += 1
+                return True
+            except (smtplib.SMTPException, OSError) as e:
+                print(f"Email error (attempt {attempt + 1}/{max_retries + 1}) to {msg['To']}: {e}")
+                self._disconnect()
+                permanent = isinstance(e, smtplib.SMTPRecipientsRefused) or \
+                    (isinstance(e, smtplib.SMTPResponseException) and e.smtp_code >= 500)
+                if permanent or attempt == max_retries:
+                    break
+                self.retries += 1
+                time.sleep(self.config['MAIL_RETRY_BACKOFF'] * 2 ** attempt)
+        self.failed += 1
+        return False
+
+    def drain(self, timeout=None):
+        """Wait until every queued message has been delivered or given up on; returns True if drained."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self._queue.unfinished_tasks:
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(0.01)
+        return True
+
+    def stats(self):
+        return {
+            "pending": self._queue.qsize(),
+            "max_pending": self._queue.maxsize,
+            "enqueued": self.enqueued,
+            "sent": self.sent,
+            "retries": self.retries,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "connections": self.connections,
+        }
+
+
+mail_queue = MailQueue(app.config)
+
+
 def send_reset_email(recipient_email, token):
-    """Sends a password reset email to the user."""
+    """Queues a password reset email to the user; returns False if it could not be queued."""
     try:
         reset_link = url_for('reset_password', token=token, _external=True)
         subject = "AgriDash Pro Password Reset Request"
@@ -1791,18 +2556,555 @@ def send_reset_email(recipient_email, token):
             print(f"--- FAKE EMAIL SENT ---\nTo: {recipient_email}\nLink: {reset_link}\n-------------------------")
             return True
 
-        # Use the actual configured SMTP server
-        server = smtplib.SMTP(app.config['MAIL_SERVER'], app.config['MAIL_PORT'])
-        server.starttls()
-        server.login(app.config['MAIL_USERNAME'], app.config['MAIL_PASSWORD'])
-        server.send_message(msg)
-        server.quit()
-        return True
+        # Delivered by the background mail queue so the request does not wait on SMTP
+        return mail_queue.enqueue(msg)
     except Exception as e:
         print(f"Email error: {e}")
         return False
 
 
+# ==============================================================================
+# --- ML Prediction Helpers ---
+# ==============================================================================
+
+NUMERIC_INPUT_FIELDS = ["temperature", "humidity", "ph", "moisture", "N", "P", "K"]
+MAX_BATCH_SIZE = 10000
+
+
+# Request field -> dataset column name (train_and_save.py)
+INPUT_COLUMNS = {"crop": "Crop", "region": "Region", "month": "Month", "N": "N", "P": "P", "K": "K",
+                 "temperature": "Temperature(C)", "humidity": "Humidity(%)", "ph": "Soil_pH",
+                 "moisture": "Moisture(%)"}
+CATEGORICAL_INPUT_FIELDS = ["crop", "region", "month"]
+
+
+def parse_numeric_inputs(data):
+    """Validate that a prediction sample is an object with numeric soil/weather readings."""
+    if not isinstance(data, dict):
+        raise ValueError("Invalid input data or format: sample must be a JSON object.")
+
+    try:
+        values = {field: float(data.get(field)) for field in NUMERIC_INPUT_FIELDS}
+    except (TypeError, ValueError) as e:
+        raise ValueError(f"Invalid input data or format: {str(e)}")
+    # float() also accepts "nan", "inf" and overflowing literals such as 1e999
+    for field, value in values.items():
+        if not math.isfinite(value):
+            raise ValueError(f"Invalid input data or format: '{field}' must be a finite number.")
+    return values
+
+
+def build_feature_rows(samples, encoder, feature_names, model_name="the model"):
+    """Validate samples and encode them into feature rows ordered as feature_names.
+
+    Numeric readings are parsed per sample; the crop/region/month names of all samples are
+    encoded with one vectorized lookup per column. Entries of samples may be ValueErrors from
+    read_batch_samples(). Returns (rows array, sample positions of the rows, {position: error}).
+    """
+    errors = {}
+    numeric = {}
+    for i, sample in enumerate(samples):
+        try:
+            if isinstance(sample, ValueError):
+                raise sample
+            numeric[i] = parse_numeric_inputs(sample)
+        except ValueError as e:
+            errors[i] = str(e)
+
+    positions = list(numeric)
+    columns = {INPUT_COLUMNS[field]: field for field in INPUT_COLUMNS}
+    rows = np.empty((len(positions), len(feature_names)))
+    known = np.ones(len(positions), dtype=bool)
+    for j, column in enumerate(feature_names):
+        field = columns[column]
+        if field in CATEGORICAL_INPUT_FIELDS:
+            codes = encoder.transform(column, [samples[i].get(field) for i in positions])
+            for i, code, ok in zip(positions, codes, known):
+                if code >= 0 or not ok:
+                    continue
+                # Report the first unknown name of each sample, e.g. a region the model was never trained on
+                errors[i] = (f"Invalid categorical input value: {field} '{samples[i].get(field)}' "
+                             f"is not covered by {model_name}.")
+            known &= codes >= 0
+            rows[:, j] = codes
+        else:
+            rows[:, j] = [numeric[i][field] for i in positions]
+    return rows[known], [i for i, ok in zip(positions, known) if ok], errors
+
+
+def unsupported_catalog_values(encoder):
+    """Catalog crops, regions and months a model's encoder has no code for, by request field."""
+    catalog = {"crop": list(crop_to_int), "region": regions_ml, "month": months_ml}
+    return {field: [name for name, code in zip(names, encoder.transform(INPUT_COLUMNS[field], names)) if code < 0]
+            for field, names in catalog.items()}
+
+
+def format_prediction(predicted_label, distance, vote_share=None):
+    """Build the JSON-ready prediction result from a predicted label and nearest-neighbor distance."""
+    # This is a heuristic and not a true probability, assuming max distance is 10
+    confidence = 1 - (distance / 10)
+    confidence = max(0, min(1, confidence))  # Clamp between 0 and 1
+
+    # Models from train_knn.py predict fertilizer names; older models predict an index into fertilizers_ml
+    if isinstance(predicted_label, str):
+        predicted_fertilizer = display_fertilizer_name(predicted_label)
+    elif 0 <= predicted_label < len(fertilizers_ml):
+        predicted_fertilizer = fertilizers_ml[predicted_label]
+    else:
+        predicted_fertilizer = "Custom Fertilizer Blend"
+
+    prediction = {
+        "fertilizer": predicted_fertilizer,
+        "fertilizer_type": categorize_fertilizer(predicted_fertilizer),
+        "confidence": float(confidence * 100),  # Return as percentage
+        "algorithm": "K-Nearest Neighbors (KNN)"
+    }
+    if vote_share is not None:
+        # Share of the (weighted) neighbor vote won by the predicted label, as a percentage
+        prediction["vote_share"] = float(vote_share * 100)
+    return prediction
+
+
+def read_batch_samples(req):
+    """Read a list of samples from a JSON array, a {"samples": [...]} object or an NDJSON body."""
+    if req.mimetype in ('application/x-ndjson', 'application/jsonlines'):
+        samples = []
+        for line_no, line in enumerate(req.get_data(as_text=True).splitlines(), start=1):
+            if not line.strip():
+                continue
+            try:
+                samples.append(json.loads(line))
+            except json.JSONDecodeError as e:
+                # Keep the slot so row positions are preserved; reported as that row's error
+                samples.append(ValueError(f"Invalid JSON on line {line_no}: {e.msg}"))
+        return samples
+
+    data = req.get_json(silent=True)
+    if isinstance(data, dict) and isinstance(data.get("samples"), list):
+        return data["samples"]
+    if isinstance(data, list):
+        return data
+    raise ValueError("Expected a JSON array of samples, an object with a 'samples' list, or an NDJSON body.")
+
+
+def display_fertilizer_name(name):
+    """Title-case a lowercase encoder class name, keeping abbreviations like (DAP) and NPK upper-case."""
+    display = name.title()
+    display = re.sub(r'\(([A-Za-z]{2,4})\)', lambda m: f"({m.group(1).upper()})", display)
+    return re.sub(r'\b(Npk|Edta)\b', lambda m: m.group(1).upper(), display)
+
+
+def format_ann_prediction(label, probability):
+    """Build the JSON-ready prediction result for the ANN's predicted class and softmax probability."""
+    fertilizer_name = display_fertilizer_name(str(label))
+    return {
+        "fertilizer": fertilizer_name,
+        "fertilizer_type": categorize_fertilizer(fertilizer_name),
+        "confidence": float(probability * 100),  # Return as percentage
+        "algorithm": "Artificial Neural Network (ANN)"
+    }
+
+
+def run_knn_predictions(knn_engine, rows):
+    """Score feature rows with one neighbor search and format each result."""
+    result = knn_engine.predict(rows)
+    return [format_prediction(result.labels[i], result.nearest_distances[i], result.vote_shares[i])
+            for i in range(len(rows))]
+
+
+def run_ann_predictions(ann_engine, rows):
+    """Score feature rows with one batched forward pass and format each result."""
+    result = ann_engine.predict(rows)
+    return [format_ann_prediction(result.labels[i], result.confidences[i]) for i in range(len(rows))]
+
+
+# algorithm name -> (registry, engine -> (encoder, feature columns), runner, unavailable message)
+PREDICTORS = {
+    "knn": (knn_registry, lambda engine: (engine.encoder, engine.feature_names), run_knn_predictions,
+            "KNN model is not available. Please ensure knn_model.pkl and scaler.pkl exist."),
+    "ann": (ann_registry, lambda engine: (engine.encoder, engine.feature_names), run_ann_predictions,
+            "ANN model is not available. Please run export_ann_weights.py to create output_models/ann_weights.npz."),
+}
+
+
+# ==============================================================================
+# --- In-Process Caches ---
+# ==============================================================================
+
+class LRUCache:
+    """Thread-safe in-process LRU cache with a per-entry TTL and hit/miss/eviction counters."""
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()  # key -> (value, expires_at), least recently used first
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            value, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._data[key]
+                self.expirations += 1
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            if self._data.pop(key, None) is not None:
+                self.invalidations += 1
+
+    def purge(self, predicate):
+        """Drop every entry whose key matches predicate(key)."""
+        with self._lock:
+            stale = [key for key in self._data if predicate(key)]
+            for key in stale:
+                del self._data[key]
+            self.invalidations += len(stale)
+
+    def clear(self):
+        with self._lock:
+            self.invalidations += len(self._data)
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+            }
+
+
+class PredictionCache:
+    """Caches formatted predictions keyed on the encoded feature row, with numeric inputs
+    quantized to `resolution` so near-identical slider values share one entry.
+
+    Cached rows are predicted at their quantized values, so a hit returns exactly what a
+    miss would have computed. With the cache disabled (maxsize 0) rows are predicted as given.
+    All entries of an algorithm are dropped when its model version changes.
+    """
+
+    def __init__(self, maxsize, ttl, resolution):
+        self.resolution = resolution
+        self.cache = LRUCache(maxsize, ttl)
+        self._versions = {}
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.cache.maxsize > 0
+
+    def quantize(self, row):
+        """Return (cache key part, snapped feature row) for one encoded feature row, or None if it
+        has a non-finite value (such rows are predicted as given and never cached)."""
+        if not all(math.isfinite(value) for value in row):
+            return None
+        steps = tuple(int(round(value / self.resolution)) for value in row)
+        return steps, [round(step * self.resolution, 10) for step in steps]
+
+    def check_version(self, algorithm, version):
+        with self._lock:
+            if self._versions.get(algorithm) != version:
+                if algorithm in self._versions:
+                    # A reloaded model may predict differently: drop this algorithm's entries
+                    self.cache.purge(lambda key: key[0] == algorithm)
+                self._versions[algorithm] = version
+
+    def stats(self):
+        return {"resolution": self.resolution, "model_versions": dict(self._versions), **self.cache.stats()}
+
+
+prediction_cache = PredictionCache(app.config['PREDICTION_CACHE_SIZE'], app.config['PREDICTION_CACHE_TTL'],
+                                   app.config['PREDICTION_CACHE_RESOLUTION'])
+
+
+# sqlite3.Row records of logged-in users, so steady-state requests skip 'SELECT * FROM users'.
+# Invalidated on profile/password/reset-token writes; other workers see a change within the TTL.
+user_cache = LRUCache(app.config['USER_CACHE_SIZE'], app.config['USER_CACHE_TTL'])
+
+# (location text, StationMatch) per user id, so the geocode and nearest-station search run once per
+# user rather than on every request. Entries carry the location they were resolved from, so a
+# profile edit is picked up on the next request without cross-worker invalidation.
+station_cache = LRUCache(app.config['STATION_CACHE_SIZE'], app.config['STATION_CACHE_TTL'])
+
+
+def run_cached_predictions(algorithm, engine, version, rows, run_predictions):
+    """Serve rows from the prediction cache, scoring all misses in one batched model call."""
+    if not prediction_cache.enabled:
+        # No cache to share entries through, so no reason to snap the inputs
+        return run_predictions(engine, rows)
+
+    prediction_cache.check_version(algorithm, version)
+    predictions = [None] * len(rows)
+    miss_positions, miss_rows, miss_keys = [], [], []
+    for i, row in enumerate(rows):
+        quantized = prediction_cache.quantize(row)
+        if quantized is None:
+            miss_positions.append(i)
+            miss_rows.append(list(row))
+            miss_keys.append(None)
+            continue
+        steps, snapped = quantized
+        key = (algorithm, version, steps)
+        cached = prediction_cache.cache.get(key)
+        if cached is not None:
+            predictions[i] = dict(cached)
+        else:
+            miss_positions.append(i)
+            miss_rows.append(snapped)
+            miss_keys.append(key)
+
+    if miss_rows:
+        for i, key, prediction in zip(miss_positions, miss_keys, run_predictions(engine, miss_rows)):
+            if key is not None:
+                prediction_cache.cache.set(key, prediction)
+            predictions[i] = dict(prediction)
+    return predictions
+
+
+# Rendered HTML of static template fragments, keyed on (template name, catalog version)
+fragment_cache = LRUCache(app.config['FRAGMENT_CACHE_SIZE'], app.config['FRAGMENT_CACHE_TTL'])
+
+
+def cached_fragment(name):
+    """Render a static fragment template once per catalog version and reuse its HTML in every page."""
+    key = (name, CATALOG_VERSION)
+    html = fragment_cache.get(key)
+    if html is None:
+        html = Markup(app.jinja_env.get_template(name).render(crops=crops_ml, regions=regions_ml, months=months_ml))
+        fragment_cache.set(key, html)
+    return html
+
+
+app.jinja_env.globals['cached_fragment'] = cached_fragment
+
+
+# ==============================================================================
+# --- Password Hashing & Rate Limiting ---
+# ==============================================================================
+
+class PasswordHasherBusy(Exception):
+    """Raised when too many password hashes are already waiting for a hashing thread."""
+
+
+class PasswordHasher:
+    """Runs werkzeug password hashing on a small, bounded thread pool.
+
+    hashlib's scrypt/pbkdf2 release the GIL, so at most `workers` hashes burn CPU at once however
+    many logins arrive, leaving cores for /predict. Past `max_pending` queued hashes new callers get
+    PasswordHasherBusy instead of piling up. The cost is set by `method`; stored hashes made with a
+    different method are upgraded through rehash() on the next successful login.
+    """
+
+    def __init__(self, method, workers=2, max_pending=32):
+        self.method = method
+        # werkzeug expands defaults ('scrypt' -> 'scrypt:32768:8:1'); compare stored hashes to the full form
+        self.method_prefix = generate_password_hash('', method).split('$', 1)[0] + '$'
+        self.workers = workers
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self.max_pending = max_pending
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._counts = {"hash": 0, "verify": 0}
+        self._seconds = {"hash": 0.0, "verify": 0.0}
+        self.wait_seconds = 0.0
+        self.rehashes = 0
+        self.rejected = 0
+
+    def _pool(self):
+        # Executor threads do not survive fork(); give each worker process its own pool
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix='password-hash')
+                    self._pid = os.getpid()
+        return self._executor
+
+    def _run(self, kind, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            self.rejected += 1
+            raise PasswordHasherBusy()
+        try:
+            submitted = time.perf_counter()
+            started, result = self._pool().submit(lambda: (time.perf_counter(), fn(*args))).result()
+        finally:
+            self._slots.release()
+        finished = time.perf_counter()
+        with self._lock:
+            self._counts[kind] += 1
+            self._seconds[kind] += finished - started
+            self.wait_seconds += started - submitted
+        if has_request_context():
+            # Lets the request timings split hashing from the rest of the request
+            g.hash_seconds = g.get('hash_seconds', 0.0) + (finished - submitted)
+        return result
+
+    def hash(self, password):
+        return self._run("hash", generate_password_hash, password, self.method)
+
+    def verify(self, password_hash, password):
+        return self._run("verify", check_password_hash, password_hash, password)
+
+    def rehash(self, password_hash, password):
+        """Hash an already verified password again if password_hash was made with another method, else None."""
+        if password_hash.startswith(self.method_prefix):
+            return None
+        new_hash = self.hash(password)
+        self.rehashes += 1
+        return new_hash
+
+    def stats(self):
+        with self._lock:
+            stats = {"method": self.method_prefix[:-1], "workers": self.workers, "max_pending": self.max_pending,
+                     "rehashes": self.rehashes, "rejected": self.rejected,
+                     "queue_wait_seconds": round(self.wait_seconds, 4)}
+            for kind in ("hash", "verify"):
+                count = self._counts[kind]
+                stats[kind] = {"count": count, "total_seconds": round(self._seconds[kind], 4),
+                               "mean_ms": round(self._seconds[kind] / count * 1000, 2) if count else None}
+            return stats
+
+
+password_hasher = PasswordHasher(app.config['PASSWORD_HASH_METHOD'], workers=app.config['PASSWORD_HASH_WORKERS'],
+                                 max_pending=app.config['PASSWORD_HASH_MAX_PENDING'])
+
+
+class RateLimiter:
+    """Sliding-window limit on attempts per key (e.g. login identifier), kept in a bounded LRU."""
+
+    def __init__(self, limit, window, maxsize=100000):
+        self.limit = limit
+        self.window = window
+        self._attempts = LRUCache(maxsize, window)
+        self._lock = threading.Lock()
+        self.limited = 0
+
+    def hit(self, key):
+        """Record an attempt; returns False (without recording it) once the key is over its limit."""
+        if self.limit <= 0:
+            return True
+        now = time.monotonic()
+        with self._lock:
+            recent = [t for t in self._attempts.get(key, ()) if now - t < self.window]
+            if len(recent) >= self.limit:
+                self.limited += 1
+                return False
+            recent.append(now)
+            self._attempts.set(key, recent)
+            return True
+
+    def reset(self, key):
+        self._attempts.delete(key)
+
+    def stats(self):
+        return {"limit": self.limit, "window_seconds": self.window, "limited": self.limited,
+                "tracked_keys": self._attempts.stats()["size"]}
+
+
+login_limiter = RateLimiter(app.config['LOGIN_RATE_LIMIT'], app.config['LOGIN_RATE_WINDOW'])
+
+
+class RequestTimings:
+    """Per-endpoint request count and wall time, with the share spent waiting on password hashing
+    and how many requests materialized each lazy request value (see LazyRequestGlobals)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._totals = {}  # endpoint -> [requests, seconds, hash seconds, {lazy value name: requests}]
+
+    def record(self, endpoint, seconds, hash_seconds, materialized=()):
+        with self._lock:
+            totals = self._totals.setdefault(endpoint, [0, 0.0, 0.0, {}])
+            totals[0] += 1
+            totals[1] += seconds
+            totals[2] += hash_seconds
+            for name in materialized:
+                totals[3][name] = totals[3].get(name, 0) + 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                endpoint: {"requests": count, "total_seconds": round(seconds, 4),
+                           "hash_seconds": round(hash_seconds, 4), "mean_ms": round(seconds / count * 1000, 2),
+                           "mean_hash_ms": round(hash_seconds / count * 1000, 2),
+                           "materialized": {name: materialized.get(name, 0) for name in LazyRequestGlobals.loaders}}
+                for endpoint, (count, seconds, hash_seconds, materialized) in self._totals.items()
+            }
+
+
+request_timings = RequestTimings()
+
+
+class LazyRequestGlobals(Flask.app_ctx_globals_class):
+    """Flask's `g` with values computed on first read instead of in before_request.
+
+    Reading a name registered with @lazy_global runs its loader once, stores the result on `g`
+    (later reads are plain attribute hits) and notes the name for the request timings, so routes
+    that never touch a value (JSON APIs, POST-redirects) never pay for it. `'name' in g` only
+    reports values already materialized.
+    """
+
+    loaders = {}  # name -> zero-argument loader
+
+    def __getattr__(self, name):
+        loader = self.loaders.get(name)
+        if loader is None:
+            raise AttributeError(name)
+        value = loader()
+        self.__dict__[name] = value
+        self.__dict__.setdefault('lazy_loaded', []).append(name)
+        return value
+
+    def get(self, name, default=None):
+        if name in self.loaders and name not in self.__dict__:
+            return getattr(self, name)
+        return self.__dict__.get(name, default)
+
+
+app.app_ctx_globals_class = LazyRequestGlobals
+
+
+def lazy_global(name):
+    """Register the decorated function as the per-request loader of g.<name>."""
+
+    def register(loader):
+        LazyRequestGlobals.loaders[name] = loader
+        return loader
+
+    return register
+
+
 # ==============================================================================
 # --- Utility Functions & Decorators ---
 # ==============================================================================
@@ -1820,26 +3122,77 @@ def login_required(f):
     return decorated_function
 
 
-def calculate_total_acreage(crops):
-    """Calculates the total acreage under cultivation."""
-    return sum(float(crop['acre']) for crop in crops) if crops else 0
+def coalesce_chunks(chunks, min_size=16384):
+    """Join a template stream's many small pieces into writes of at least min_size characters."""
+    buffer, size = [], 0
+    try:
+        for chunk in chunks:
+            buffer.append(chunk)
+            size += len(chunk)
+            if size >= min_size:
+                yield ''.join(buffer)
+                buffer, size = [], 0
+        if buffer:
+            yield ''.join(buffer)
+    finally:
+        # Closing the inner stream ends its request context (and returns the DB connection) promptly
+        chunks.close()
+
+
+def conditional_render(template_name, validators, last_modified, **context):
+    """Render a page with ETag/Last-Modified, answering 304 without rendering when the client copy is current.
+
+    validators lists everything besides the template and catalogs that the page HTML depends on.
+    """
+    response = app.response_class(mimetype='text/html')
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    response.vary.add('Cookie')
+    # Pending flash messages are rendered once into this response, so it must not be revalidated
+    if not session.get('_flashes'):
+        etag_source = repr((template_name, TEMPLATE_VERSION, CATALOG_VERSION) + tuple(validators))
+        response.set_etag(hashlib.sha256(etag_source.encode()).hexdigest()[:32])
+        response.last_modified = max(CONTENT_LOADED_AT, last_modified or CONTENT_LOADED_AT)
+        response.make_conditional(request)
+        if response.status_code == 304:
+            return response
+    response.set_data(render_template(template_name, **context))
+    return response
+
+
+def model_loaded_at(registry):
+    """UTC datetime the registry's current model was installed, or None if it never loaded."""
+    if registry.loaded_at is None:
+        return None
+    return datetime.fromisoformat(registry.loaded_at).astimezone(timezone.utc)
+
+
+@lazy_global('user')
+def load_logged_in_user():
+    """g.user: the logged-in user's record, or None."""
+    user_id = session.get('user_id') if has_request_context() else None
+    return None if user_id is None else get_cached_user(user_id)
+
+
+@lazy_global('weather')
+def load_weather():
+    """g.weather: weather at the station nearest the user's farm (anonymous visitors see Delhi)."""
+    return get_weather_data(get_user_weather_city(g.user))
 
 
 @app.before_request
-def load_logged_in_user_and_weather():
-    """Load user data and weather into Flask's global context 'g'."""
-    user_id = session.get('user_id')
-    if user_id is None:
-        g.user = None
-        # Default to Delhi weather
-        g.weather = get_weather_data('Delhi')
-    else:
-        g.user = get_user_by_id(user_id)
-        if g.user and g.user['location']:
-            g.weather = get_weather_data(g.user['location'])
-        else:
-            # Fallback to Delhi weather if user is logged in but location is missing
-            g.weather = get_weather_data('Delhi')
+def start_request_timer():
+    """Note the request's start time for record_request_timing (g.user and g.weather load lazily)."""
+    g.request_started = time.perf_counter()
+
+
+@app.after_request
+def record_request_timing(response):
+    """Add this request's wall time, hashing time and lazy loads to the per-endpoint totals in /metrics."""
+    if 'request_started' in g and request.endpoint != 'static':
+        request_timings.record(request.endpoint or 'not_found', time.perf_counter() - g.request_started,
+                               g.get('hash_seconds', 0.0), g.get('lazy_loaded', ()))
+    return response
 
 
 # ==============================================================================
@@ -1853,7 +3206,7 @@ def home():
     if g.user:
         return redirect(url_for('dashboard'))
 
-    return render_template_string(BASE_TEMPLATE + LANDING_PAGE_CONTENT, title='Welcome')
+    return conditional_render('landing.html', (), None, title='Welcome')
 
 
 @app.route('/login', methods=['GET', 'POST'])
@@ -1866,9 +3219,31 @@ def login():
         identifier = request.form.get('identifier')
         password = request.form.get('password')
 
+        limiter_key = (identifier or '').strip().lower()
+        if not login_limiter.hit(limiter_key):
+            flash('Too many login attempts. Please wait a few minutes and try again.', 'error')
+            return render_template('login.html', title='Login'), 429
+
         user = get_user_by_identifier(identifier)
 
-        if user and check_password_hash(user['password_hash'], password):
+        try:
+            valid = user is not None and password_hasher.verify(user['password_hash'], password)
+        except PasswordHasherBusy:
+            flash('The server is busy. Please try again in a moment.', 'error')
+            return render_template('login.html', title='Login'), 503
+
+        if valid:
+            try:
+                new_hash = password_hasher.rehash(user['password_hash'], password)
+            except PasswordHasherBusy:
+                # The upgrade is optional; leave it for the next login rather than refuse a correct password
+                new_hash = None
+            if new_hash:
+                # The configured cost changed: upgrade the stored hash while the password is at hand
+                update_password_hash(user['id'], user['password_hash'], new_hash)
+
+        if valid:
+            login_limiter.reset(limiter_key)
             session['user_id'] = user['id']
             flash(f'Welcome back, {user["full_name"].split()[0]}!', 'success')
             next_url = request.args.get('next') or url_for('dashboard')
@@ -1876,7 +3251,7 @@ def login():
         else:
             flash('Login failed. Check your credentials.', 'error')
 
-    return render_template_string(BASE_TEMPLATE + LOGIN_CONTENT, title='Login')
+    return render_template('login.html', title='Login')
 
 
 @app.route('/register', methods=['GET', 'POST'])
@@ -1912,7 +3287,11 @@ def register():
                 flash('Total land must be a number.', 'error')
                 return redirect(url_for('register'))
 
-            password_hash = generate_password_hash(password)
+            try:
+                password_hash = password_hasher.hash(password)
+            except PasswordHasherBusy:
+                flash('The server is busy. Please try again in a moment.', 'error')
+                return render_template('register.html', title='Register'), 503
 
             if create_user(username, password_hash, email, phone, full_name, farm_name, location, total_land):
                 flash('Registration successful! Please log in.', 'success')
@@ -1920,7 +3299,7 @@ def register():
             else:
                 flash('Registration failed due to a database error.', 'error')
 
-    return render_template_string(BASE_TEMPLATE + REGISTER_CONTENT, title='Register')
+    return render_template('register.html', title='Register')
 
 
 @app.route('/logout')
@@ -1956,7 +3335,7 @@ def forgot_password():
 
         return redirect(url_for('forgot_password'))
 
-    return render_template_string(BASE_TEMPLATE + FORGOT_PASSWORD_CONTENT, title='Forgot Password')
+    return render_template('forgot_password.html', title='Forgot Password')
 
 
 @app.route('/reset-password/<token>', methods=['GET', 'POST'])
@@ -1977,45 +3356,52 @@ def reset_password(token):
 
         if password != confirm_password:
             flash('Passwords do not match.', 'error')
-            return render_template_string(BASE_TEMPLATE + RESET_PASSWORD_CONTENT, title='Reset Password')
+            return render_template('reset_password.html', title='Reset Password')
 
         if len(password) < 6:
             flash('Password must be at least 6 characters.', 'error')
-            return render_template_string(BASE_TEMPLATE + RESET_PASSWORD_CONTENT, title='Reset Password')
+            return render_template('reset_password.html', title='Reset Password')
+
+        try:
+            password_hash = password_hasher.hash(password)
+        except PasswordHasherBusy:
+            flash('The server is busy. Please try again in a moment.', 'error')
+            return render_template('reset_password.html', title='Reset Password'), 503
 
-        password_hash = generate_password_hash(password)
         if update_password(user['id'], password_hash):
             flash('Your password has been updated. You can now log in.', 'success')
             return redirect(url_for('login'))
         else:
             flash('An error occurred during password update.', 'error')
 
-    return render_template_string(BASE_TEMPLATE + RESET_PASSWORD_CONTENT, title='Reset Password')
+    return render_template('reset_password.html', title='Reset Password')
 
 
 @app.route('/dashboard', methods=['GET'])
 @login_required
 def dashboard():
     """Renders the user's main dashboard."""
-    user_crops = get_user_crops(g.user['id'])
-    total_acreage = calculate_total_acreage(user_crops)
-    soil_data = get_soil_testing_data(g.user['id'])
-    last_test_date = get_last_soil_test_date(soil_data)
+    # Totals and the latest soil test come from the summary row; only the shown crops are fetched
+    summary = get_dashboard_summary(g.user['id'])
+    recent_crops = get_recent_user_crops(g.user['id'], app.config['DASHBOARD_RECENT_CROPS'])
+    latest_test = summary['latest_soil_test']
+    last_test_date = latest_test['test_date'] if latest_test else 'N/A'
 
     # Get recommendation for dashboard (using the first crop found for simplicity)
     dashboard_rec = None
-    if user_crops and soil_data:
-        dashboard_rec = get_fertilizer_recommendation(soil_data, user_crops[0]['crop_type'])
+    if recent_crops and latest_test:
+        dashboard_rec = get_fertilizer_recommendation([latest_test], recent_crops[0]['crop_type'])
 
     # FIX: Add weather=g.weather to the context to resolve UndefinedError
-    return render_template_string(
-        BASE_TEMPLATE + DASHBOARD_CONTENT,
+    return render_template(
+        'dashboard.html',
         title='Dashboard',
         user=g.user,
-        crops=user_crops,
-        total_acreage=total_acreage,
+        crops=recent_crops,
+        crop_count=summary['crop_count'],
+        total_acreage=summary['total_acreage'],
         last_test_date=last_test_date,
-        soil_data=soil_data[0] if soil_data else None,
+        soil_data=latest_test,
         get_soil_status_class=get_soil_status_class,
         dashboard_rec=dashboard_rec,
         weather=g.weather  # <--- ADDED THIS LINE
@@ -2026,12 +3412,14 @@ def dashboard():
 @login_required
 def weather():
     """Renders the weather intelligence page."""
-    # g.weather is loaded in @app.before_request
-    return render_template_string(
-        BASE_TEMPLATE + WEATHER_CONTENT,
+    # g.weather is loaded on first access (see load_weather)
+    return render_template(
+        'weather.html',
         title='Weather Intelligence',
         weather=g.weather,
-        forecast=g.weather['forecast']
+        forecast=g.weather['forecast'],
+        station=get_user_station(g.user) if station_catalog and g.user['location'] else None,
+        location=g.user['location']
     )
 
 
@@ -2040,15 +3428,17 @@ def weather():
 def fertilizer():
     """Handles the fertilizer and soil management page and form submissions."""
     user_crops = get_user_crops(g.user['id'])
-    soil_data = get_soil_testing_data(g.user['id'])
+    # The latest test plus the first page of history; older pages come from /api/soil-tests
+    soil_page, history_cursor = get_soil_test_page(g.user['id'], app.config['SOIL_HISTORY_PAGE_SIZE'] + 1)
+    latest_test = soil_page[0] if soil_page else None
 
     selected_crop = request.args.get('crop')
     if not selected_crop and user_crops:
         selected_crop = user_crops[0]['crop_type']
 
     recommendation = None
-    if soil_data and selected_crop:
-        recommendation = get_fertilizer_recommendation(soil_data, selected_crop)
+    if latest_test and selected_crop:
+        recommendation = get_fertilizer_recommendation([latest_test], selected_crop)
 
     if request.method == 'POST':
         if 'soil_test_submit' in request.form:
@@ -2072,92 +3462,128 @@ def fertilizer():
 
             return redirect(url_for('fertilizer'))
 
-    return render_template_string(
-        BASE_TEMPLATE + FERTILIZER_CONTENT,
+    return render_template(
+        'fertilizer.html',
         title='Fertilizer & Soil Management',
         crops=user_crops,
-        soil_data=soil_data,
+        latest=latest_test,
+        history=soil_page[1:],
+        history_cursor=history_cursor,
         recommendation=recommendation,
         selected_crop=selected_crop,
         get_soil_status_class=get_soil_status_class,
         current_date=datetime.now().strftime('%Y-%m-%d'),
-        ml_model_available=ml_model_available
+        ml_model_available=knn_registry.is_ready()
     )
 
 
+@app.route('/api/soil-tests', methods=['GET'])
+@login_required
+def api_soil_tests():
+    """A page of the user's soil test history as JSON (?cursor=<next_cursor>&limit=N)."""
+    try:
+        after = decode_soil_test_cursor(request.args['cursor']) if request.args.get('cursor') else None
+        limit = int(request.args.get('limit', app.config['SOIL_HISTORY_PAGE_SIZE']))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    limit = max(1, min(limit, app.config['SOIL_HISTORY_MAX_PAGE_SIZE']))
+
+    rows, next_cursor = get_soil_test_page(g.user['id'], limit, after)
+    tests = []
+    for row in rows:
+        test = dict(row)
+        test['status_classes'] = {level: get_soil_status_class(row[level])
+                                  for level in ('nitrogen_level', 'phosphorus_level', 'potassium_level')}
+        tests.append(test)
+    return jsonify({"tests": tests, "next_cursor": next_cursor})
+
+
+@app.route('/fertilizer/history/export', methods=['GET'])
+@login_required
+def export_soil_history():
+    """Stream the user's full soil test history as a standalone HTML page."""
+    tests = iter_soil_tests(g.user['id'], app.config['SOIL_HISTORY_EXPORT_BATCH'])
+    return app.response_class(coalesce_chunks(stream_template(
+        'soil_history_export.html',
+        user=g.user,
+        tests=tests,
+        exported_at=datetime.now().strftime('%Y-%m-%d %H:%M')
+    )))
+
+
 @app.route('/ml-fertilizer-predictor', methods=['GET'])
 @login_required
 def ml_fertilizer_predictor():
     """Renders the KNN-based fertilizer prediction page."""
-    return render_template_string(
-        BASE_TEMPLATE + ML_PREDICTOR_CONTENT,
+    engine, version = knn_registry.snapshot()
+    return conditional_render(
+        'ml_predictor.html',
+        (g.user['id'], g.user['full_name'], version, engine is not None),
+        model_loaded_at(knn_registry),
         title='KNN Fertilizer Predictor',
-        crops=crops_ml,
-        regions=regions_ml,
-        months=months_ml,
-        ml_model_available=ml_model_available
+        catalog_url=url_for('api_catalog_version', version=CATALOG_VERSION),
+        ml_model_available=engine is not None
     )
 
 
+def catalog_response(cache_control):
+    """The serialized catalog with its content hash as ETag, answering 304 to a matching If-None-Match."""
+    response = app.response_class(CATALOG_BODY, mimetype='application/json')
+    response.set_etag(CATALOG_VERSION)
+    response.headers['Cache-Control'] = cache_control
+    response.headers['Content-Location'] = url_for('api_catalog_version', version=CATALOG_VERSION)
+    return response.make_conditional(request)
+
+
+@app.route('/api/catalog', methods=['GET'])
+def api_catalog():
+    """Current crop/region/month/fertilizer catalog; clients revalidate it with the ETag."""
+    return catalog_response('public, no-cache')
+
+
+@app.route('/api/catalog/<version>', methods=['GET'])
+def api_catalog_version(version):
+    """A specific catalog version. Its content never changes, so it may be cached forever."""
+    if version != CATALOG_VERSION:
+        return jsonify({"error": "Unknown catalog version.", "current_version": CATALOG_VERSION,
+                        "url": url_for('api_catalog_version', version=CATALOG_VERSION)}), 404
+    return catalog_response('public, max-age=31536000, immutable')
+
+
+@app.route('/api/models/<algorithm>/coverage', methods=['GET'])
+@login_required
+def api_model_coverage(algorithm):
+    """Catalog values a model cannot encode, so the predictor page can disable them for that model."""
+    if algorithm not in PREDICTORS:
+        return jsonify({"error": f"Unknown algorithm '{algorithm}'. Choose one of: {', '.join(PREDICTORS)}."}), 404
+    registry, feature_spec, _, unavailable_message = PREDICTORS[algorithm]
+    engine, version = registry.snapshot()
+    if engine is None:
+        return jsonify({"error": unavailable_message}), 503
+    encoder, _ = feature_spec(engine)
+    return jsonify({"algorithm": algorithm, "version": version, "unsupported": unsupported_catalog_values(encoder)})
+
+
 @app.route('/predict', methods=['POST'])
 @login_required
 def predict():
-    """KNN-based fertilizer prediction endpoint."""
-    if not ml_model_available:
-        return jsonify({"error": "KNN model is not available. Please ensure knn_model.pkl and scaler.pkl exist."}), 503
+    """Fertilizer prediction endpoint (KNN by default, or the NumPy ANN with "algorithm": "ann")."""
+    data = request.get_json()
+    algorithm = str((data.get("algorithm") if isinstance(data, dict) else None) or "knn").lower()
+    if algorithm not in PREDICTORS:
+        return jsonify({"error": f"Unknown algorithm '{algorithm}'. Choose one of: {', '.join(PREDICTORS)}."}), 400
 
-    try:
-        data = request.get_json()
-        n_val = float(data.get("N"))
-        p_val = float(data.get("P"))
-        k_val = float(data.get("K"))
-        temp_val = float(data.get("temperature"))
-        humidity_val = float(data.get("humidity"))
-        ph_val = float(data.get("ph"))
-        moisture_val = float(data.get("moisture"))
-
-        # Convert categorical data to integers using the global mappings
-        crop_name = data.get("crop")
-        region_name = data.get("region")
-        month_name = data.get("month")
-
-        crop_int = crop_to_int.get(crop_name)
-        region_int = region_to_int.get(region_name)
-        month_int = month_to_int.get(month_name)
-
-        if any(v is None for v in [crop_int, region_int, month_int]):
-            return jsonify({"error": "Invalid categorical input value."}), 400
-
-        # Features array creation (must match model's training order)
-        features = np.array(
-            [crop_int, region_int, month_int, temp_val, humidity_val, ph_val, moisture_val, n_val, p_val, k_val])
-
-        # FIX: Reshape the 1D array to a 2D array for the scaler and model.
-        features_reshaped = features.reshape(1, -1)
-        features_scaled = scaler.transform(features_reshaped)
-
-        # Get the predicted index/label
-        predicted_index = knn_model.predict(features_scaled)[0]
-
-        # Calculate confidence score (distance to nearest neighbor heuristic)
-        distances, indices = knn_model.kneighbors(features_scaled)
-        distance = distances[0][0]
-        # This is a heuristic and not a true probability, assuming max distance is 10
-        confidence = 1 - (distance / 10)
-        confidence = max(0, min(1, confidence))  # Clamp between 0 and 1
-
-        # Map the predicted index back to a fertilizer name
-        if 0 <= predicted_index < len(fertilizers_ml):
-            predicted_fertilizer = fertilizers_ml[predicted_index]
-        else:
-            predicted_fertilizer = "Custom Fertilizer Blend"
+    registry, feature_spec, run_predictions, unavailable_message = PREDICTORS[algorithm]
+    engine, version = registry.snapshot()
+    if engine is None:
+        return jsonify({"error": unavailable_message}), 503
+
+    rows, _, errors = build_feature_rows([data], *feature_spec(engine), model_name=f"the {algorithm.upper()} model")
+    if errors:
+        return jsonify({"error": errors[0]}), 400
 
-        return jsonify({
-            "fertilizer": predicted_fertilizer,
-            "fertilizer_type": categorize_fertilizer(predicted_fertilizer),
-            "confidence": float(confidence * 100),  # Return as percentage
-            "algorithm": "K-Nearest Neighbors (KNN)"
-        })
+    try:
+        return jsonify(run_cached_predictions(algorithm, engine, version, rows, run_predictions)[0])
 
     except (KeyError, ValueError, IndexError) as e:
         return jsonify({"error": f"Invalid input data or format: {str(e)}"}), 400
@@ -2166,6 +3592,98 @@ def predict():
         return jsonify({"error": "Internal server error"}), 500
 
 
+@app.route('/predict/batch', methods=['POST'])
+@login_required
+def predict_batch():
+    """Vectorized prediction for many samples (JSON array or NDJSON body); ?algorithm=knn|ann."""
+    algorithm = request.args.get("algorithm", "knn").lower()
+    if algorithm not in PREDICTORS:
+        return jsonify({"error": f"Unknown algorithm '{algorithm}'. Choose one of: {', '.join(PREDICTORS)}."}), 400
+
+    registry, feature_spec, run_predictions, unavailable_message = PREDICTORS[algorithm]
+    engine, version = registry.snapshot()
+    if engine is None:
+        return jsonify({"error": unavailable_message}), 503
+
+    try:
+        samples = read_batch_samples(request)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    if len(samples) > MAX_BATCH_SIZE:
+        return jsonify({"error": f"Batch too large: {len(samples)} samples (max {MAX_BATCH_SIZE})."}), 413
+
+    # Validate and encode every row first; invalid rows get an error entry instead of failing the batch
+    results = [None] * len(samples)
+    valid_rows, valid_positions, errors = build_feature_rows(samples, *feature_spec(engine),
+                                                             model_name=f"the {algorithm.upper()} model")
+    for i, error in errors.items():
+        results[i] = {"index": i, "error": error}
+
+    try:
+        if len(valid_rows):
+            # Cache misses get one scaler pass and one neighbor search (or forward pass) for the whole batch
+            predictions = run_cached_predictions(algorithm, engine, version, valid_rows, run_predictions)
+
+            for prediction, i in zip(predictions, valid_positions):
+                results[i] = {"index": i, **prediction}
+    except Exception as e:
+        print(f"Batch prediction error: {e}")
+        return jsonify({"error": "Internal server error"}), 500
+
+    return jsonify({
+        "count": len(samples),
+        "succeeded": len(valid_rows),
+        "failed": len(samples) - len(valid_rows),
+        "results": results
+    })
+
+
+@app.route('/healthz', methods=['GET'])
+def healthz():
+    """Liveness probe: the process is serving; reports model load state without triggering a load."""
+    return jsonify({"status": "ok", "models": [knn_registry.state(), ann_registry.state()]})
+
+
+@app.route('/readyz', methods=['GET'])
+def readyz():
+    """Readiness probe: loads the model on first call (retrying failed loads) and reports 503 until ready."""
+    # The KNN is the default predictor; the ANN is optional and only reported
+    ready = knn_registry.is_ready()
+    ann_registry.get()
+    return jsonify({"ready": ready, "models": [knn_registry.state(), ann_registry.state()]}), 200 if ready else 503
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """In-process counters for monitoring."""
+    return jsonify({
+        "prediction_cache": prediction_cache.stats(),
+        "user_cache": user_cache.stats(),
+        "fragment_cache": fragment_cache.stats(),
+        "mail_queue": mail_queue.stats(),
+        "password_hashing": password_hasher.stats(),
+        "login_rate_limit": login_limiter.stats(),
+        "weather": weather_cache.stats(),
+        "stations": {**(station_catalog.stats() if station_catalog else {}), "cache": station_cache.stats()},
+        "requests": request_timings.stats(),
+        "db_pool": db_pool.stats()
+    })
+
+
+@app.route('/admin/reload-model', methods=['POST'])
+def reload_model():
+    """Reload model artifacts in the background; requests in flight finish on the current model."""
+    token = app.config['ADMIN_TOKEN']
+    if not token:
+        return jsonify({"error": "Model reload is disabled. Set AGRIDASH_ADMIN_TOKEN to enable it."}), 404
+    if not secrets.compare_digest(request.headers.get('X-Admin-Token', ''), token):
+        return jsonify({"error": "Invalid admin token."}), 403
+
+    started = knn_registry.reload(background=True)
+    return jsonify({"reload_started": started, "models": [knn_registry.state()]}), 202
+
+
 @app.route('/crop-management', methods=['GET', 'POST'])
 @login_required
 def crop_management():
@@ -2204,8 +3722,8 @@ def crop_management():
 
             return redirect(url_for('crop_management'))
 
-    return render_template_string(
-        BASE_TEMPLATE + CROP_MANAGEMENT_CONTENT,
+    return render_template(
+        'crop_management.html',
         title='Crop Management',
         user_crops=user_crops
     )
@@ -2232,14 +3750,14 @@ def profile():
         if update_user_profile(g.user['id'], email, phone, full_name, farm_name, location, total_land):
             flash('Profile updated successfully!', 'success')
             # Reload user data to update g.user for the current request
-            g.user = get_user_by_id(g.user['id'])
+            g.user = get_cached_user(g.user['id'])
         else:
             flash('Profile update failed. Email or phone might already be in use.', 'error')
 
         return redirect(url_for('profile'))
 
-    return render_template_string(
-        BASE_TEMPLATE + PROFILE_CONTENT,
+    return render_template(
+        'profile.html',
         title='User Profile',
         user=g.user
     )
@@ -2250,17 +3768,24 @@ def profile():
 def contact():
     """Renders the contact and support page."""
     all_users = get_all_users()
-    return render_template_string(
-        BASE_TEMPLATE + CONTACT_CONTENT,
+    return render_template(
+        'contact.html',
         title='Contact Support',
         all_users=all_users
     )
 
 
+@app.cli.command('init-db')
+def init_db_command():
+    """Create the tables, apply pending migrations and refresh the query planner statistics."""
+    init_db()
+    print(f"Database {app.config['DATABASE']} is at schema version {SCHEMA_MIGRATIONS[-1][0]}.")
+
+
 # Run initialization and the app
 if __name__ == '__main__':
     init_db()
     # Note: To send actual emails, you must replace the placeholder mail credentials
     # and use an app-specific password for a service like Gmail.
-    print(f"ML Model Available: {ml_model_available}")
+    print(f"ML Model Available: {knn_registry.load() is not None}")
     app.run(debug=True)
\ No newline at end of file
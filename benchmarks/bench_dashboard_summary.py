@@ -0,0 +1,83 @@
+"""Dashboard data for a large estate account: full-history fetches vs. the materialized dashboard_summary.
+
+Builds a throwaway database where one user has N_CROPS crops and N_TESTS soil tests, then times the
+dashboard's reads both ways.  Run from the project root:
+
+    python benchmarks/bench_dashboard_summary.py
+"""
+import os
+import sys
+import time
+import random
+import sqlite3
+import tempfile
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from agri_dash import app, create_schema, migrate_db, get_dashboard_summary, get_recent_user_crops
+
+N_CROPS = 5000
+N_TESTS = 2400
+N_REPEATS = 200
+
+
+def populate(conn):
+    rng = random.Random(0)
+    conn.executemany(
+        'INSERT INTO crops (user_id, acre, crop_type, stage, planting_date) VALUES (?, ?, ?, ?, ?)',
+        ((1, rng.uniform(0.5, 20), 'Rice', 'Growing', f'20{rng.randint(10, 25)}-{rng.randint(1, 12):02d}-01')
+         for _ in range(N_CROPS))
+    )
+    conn.executemany(
+        'INSERT INTO soil_testing (user_id, test_date, nitrogen_level, phosphorus_level, potassium_level, ph_level, '
+        'recommendations) VALUES (?, ?, ?, ?, ?, ?, ?)',
+        ((1, f'20{rng.randint(10, 25)}-{rng.randint(1, 12):02d}-15', 'Low', 'Medium', 'High', 6.5, None)
+         for _ in range(N_TESTS))
+    )
+    conn.commit()
+
+
+def full_history(conn):
+    """The dashboard's reads before the summary table: every crop and soil test, summed in Python."""
+    crops = conn.execute('SELECT * FROM crops WHERE user_id = ? ORDER BY planting_date DESC', (1,)).fetchall()
+    tests = conn.execute('SELECT * FROM soil_testing WHERE user_id = ? ORDER BY test_date DESC', (1,)).fetchall()
+    return len(crops), sum(float(crop['acre']) for crop in crops), tests[0] if tests else None, crops[:5]
+
+
+def summary():
+    result = get_dashboard_summary(1)
+    return result['crop_count'], result['total_acreage'], result['latest_soil_test'], get_recent_user_crops(1, 5)
+
+
+def time_calls(fn):
+    timings = []
+    for _ in range(N_REPEATS):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1e6)
+    return np.array(timings)
+
+
+if __name__ == '__main__':
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'bench.db')
+        conn = sqlite3.connect(path)
+        create_schema(conn)
+        migrate_db(conn)
+        populate(conn)
+        conn.row_factory = sqlite3.Row
+
+        with app.app_context():
+            from flask import g
+            g.db = conn
+            before, after = full_history(conn), summary()
+            assert before[0] == after[0] and abs(before[1] - after[1]) < 1e-6
+            assert before[2]['id'] == after[2]['id'] and [c['id'] for c in before[3]] == [c['id'] for c in after[3]]
+
+            print(f"One user with {N_CROPS} crops and {N_TESTS} soil tests")
+            for label, fn in (('full history', lambda: full_history(conn)), ('dashboard_summary', summary)):
+                timings = time_calls(fn)
+                print(f"{label:<20} p50 {np.percentile(timings, 50):9.1f} us   p99 {np.percentile(timings, 99):9.1f} us")
+            g.pop('db')
+        conn.close()
@@ -0,0 +1,83 @@
+"""Per-request latency of the /predict KNN path: predict()+kneighbors() vs. the single-pass engine.
+
+Run from the project root:  python benchmarks/bench_knn_inference.py
+"""
+import os
+import sys
+import time
+import pickle
+import warnings
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from ml_engine import KNNInferenceEngine
+
+MODEL_PATH = "knn_model.pkl"
+SCALER_PATH = "scaler.pkl"
+N_REQUESTS = 2000
+
+
+def load_model():
+    warnings.filterwarnings("ignore")
+    with open(MODEL_PATH, 'rb') as f:
+        knn_model = pickle.load(f)
+    with open(SCALER_PATH, 'rb') as f:
+        scaler = pickle.load(f)
+    return knn_model, scaler
+
+
+def random_samples(scaler, n, seed=0):
+    """Raw feature rows drawn around the scaler's training distribution."""
+    rng = np.random.default_rng(seed)
+    return scaler.mean_ + rng.standard_normal((n, len(scaler.mean_))) * scaler.scale_
+
+
+def old_path(knn_model, scaler, row):
+    """The original /predict code path: two neighbor searches per request."""
+    features_scaled = scaler.transform(row.reshape(1, -1))
+    predicted_index = knn_model.predict(features_scaled)[0]
+    distances, indices = knn_model.kneighbors(features_scaled)
+    return predicted_index, distances[0][0]
+
+
+def new_path(engine, row):
+    result = engine.predict(row)
+    return result.labels[0], result.nearest_distances[0]
+
+
+def time_calls(fn, samples):
+    timings = []
+    for row in samples:
+        start = time.perf_counter()
+        fn(row)
+        timings.append((time.perf_counter() - start) * 1e6)
+    return np.array(timings)
+
+
+def report(name, timings):
+    print(f"{name:<28} p50 {np.percentile(timings, 50):8.1f} us   p99 {np.percentile(timings, 99):8.1f} us   "
+          f"mean {timings.mean():8.1f} us")
+
+
+if __name__ == '__main__':
+    knn_model, scaler = load_model()
+    engine = KNNInferenceEngine(knn_model, scaler)
+    samples = random_samples(scaler, N_REQUESTS)
+
+    # Sanity check: the single-pass vote must reproduce KNeighborsClassifier.predict()
+    mismatches = sum(old_path(knn_model, scaler, row)[0] != new_path(engine, row)[0] for row in samples)
+    print(f"Label mismatches vs. KNeighborsClassifier.predict(): {mismatches}/{N_REQUESTS}")
+
+    # Warm up both paths before timing
+    time_calls(lambda row: old_path(knn_model, scaler, row), samples[:100])
+    time_calls(lambda row: new_path(engine, row), samples[:100])
+
+    before = time_calls(lambda row: old_path(knn_model, scaler, row), samples)
+    after = time_calls(lambda row: new_path(engine, row), samples)
+
+    print(f"\nPer-request latency over {N_REQUESTS} single-sample requests "
+          f"({knn_model._fit_X.shape[0]} training points, k={knn_model.n_neighbors}):")
+    report("before (predict+kneighbors)", before)
+    report("after (single pass)", after)
+    print(f"speedup (p50): {np.percentile(before, 50) / np.percentile(after, 50):.2f}x")
@@ -0,0 +1,87 @@
+"""Dashboard query plans and latency before/after the schema migration (indexes, WAL, pragmas).
+
+Builds a throwaway database with N_USERS users, each with a few crops and soil tests, and times the
+two per-user queries the dashboard runs.  Run from the project root:
+
+    python benchmarks/bench_sqlite_schema.py
+"""
+import os
+import sys
+import time
+import random
+import sqlite3
+import tempfile
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from agri_dash import create_schema, migrate_db, apply_connection_pragmas
+
+N_USERS = 100_000
+CROPS_PER_USER = 3
+TESTS_PER_USER = 4
+N_QUERIES = 2000
+
+QUERIES = {
+    "get_user_crops": 'SELECT * FROM crops WHERE user_id = ? ORDER BY planting_date DESC',
+    "get_soil_testing_data": 'SELECT * FROM soil_testing WHERE user_id = ? ORDER BY test_date DESC',
+}
+
+
+def populate(conn):
+    rng = random.Random(0)
+    conn.executemany(
+        'INSERT INTO users (username, password_hash, email, phone, full_name, farm_name, location, total_land) '
+        'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+        ((f'user{i}', 'x', f'user{i}@example.com', f'9{i:09d}', f'User {i}', f'Farm {i}', 'Pune', 10.0)
+         for i in range(1, N_USERS + 1))
+    )
+    conn.executemany(
+        'INSERT INTO crops (user_id, acre, crop_type, stage, planting_date) VALUES (?, ?, ?, ?, ?)',
+        ((rng.randint(1, N_USERS), rng.uniform(0.5, 20), 'Rice', 'Growing', f'2025-{rng.randint(1, 12):02d}-01')
+         for _ in range(N_USERS * CROPS_PER_USER))
+    )
+    conn.executemany(
+        'INSERT INTO soil_testing (user_id, test_date, nitrogen_level, phosphorus_level, potassium_level, ph_level, '
+        'recommendations) VALUES (?, ?, ?, ?, ?, ?, ?)',
+        ((rng.randint(1, N_USERS), f'2025-{rng.randint(1, 12):02d}-15', 'Low', 'Medium', 'High', 6.5, None)
+         for _ in range(N_USERS * TESTS_PER_USER))
+    )
+    conn.commit()
+
+
+def measure(conn, label):
+    rng = random.Random(1)
+    user_ids = [rng.randint(1, N_USERS) for _ in range(N_QUERIES)]
+    journal_mode = conn.execute('PRAGMA journal_mode').fetchone()[0]
+    print(f"\n=== {label} (journal_mode={journal_mode}) ===")
+    for name, sql in QUERIES.items():
+        plan = [row[-1] for row in conn.execute('EXPLAIN QUERY PLAN ' + sql, (1,))]
+        timings = []
+        for user_id in user_ids:
+            start = time.perf_counter()
+            conn.execute(sql, (user_id,)).fetchall()
+            timings.append((time.perf_counter() - start) * 1e6)
+        timings = np.array(timings)
+        print(f"{name:<24} p50 {np.percentile(timings, 50):9.1f} us   p99 {np.percentile(timings, 99):9.1f} us")
+        print(f"{'':<24} plan: {' | '.join(plan)}")
+
+
+if __name__ == '__main__':
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'bench.db')
+        conn = sqlite3.connect(path)
+        create_schema(conn)
+        start = time.perf_counter()
+        populate(conn)
+        print(f"Populated {N_USERS} users, {N_USERS * CROPS_PER_USER} crops, {N_USERS * TESTS_PER_USER} soil tests "
+              f"in {time.perf_counter() - start:.1f}s")
+        measure(conn, "before: base schema, default pragmas")
+
+        migrate_db(conn)
+        conn.close()
+
+        conn = sqlite3.connect(path)
+        apply_connection_pragmas(conn)
+        measure(conn, "after: migrated schema, tuned pragmas")
+        conn.close()
@@ -0,0 +1,86 @@
+"""Nearest-station lookup: a haversine scan over every station vs. the BallTree, and per-request
+resolution vs. the per-user station cache.
+
+The bundled catalog is small, so the tree comparison also runs on N_STATIONS synthetic stations
+spread over India (the size of a national automatic-weather-station network).  Run from the
+project root:
+
+    python benchmarks/bench_station_lookup.py
+"""
+import os
+import sys
+import time
+import random
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from weather_service import StationCatalog, EARTH_RADIUS_KM
+from agri_dash import LRUCache
+
+N_STATIONS = 5000
+N_QUERIES = 2000
+N_USERS = 200
+
+
+def haversine_scan(stations_rad, point_rad):
+    """Index and distance (km) of the nearest station by computing the distance to every station."""
+    dlat = stations_rad[:, 0] - point_rad[0]
+    dlon = stations_rad[:, 1] - point_rad[1]
+    a = np.sin(dlat / 2) ** 2 + np.cos(point_rad[0]) * np.cos(stations_rad[:, 0]) * np.sin(dlon / 2) ** 2
+    distances = 2 * np.arcsin(np.sqrt(a))
+    index = int(np.argmin(distances))
+    return index, float(distances[index]) * EARTH_RADIUS_KM
+
+
+def time_calls(fn, args):
+    timings = []
+    for arg in args:
+        start = time.perf_counter()
+        fn(arg)
+        timings.append((time.perf_counter() - start) * 1e6)
+    return np.array(timings)
+
+
+def report(label, timings):
+    print(f"{label:<28} p50 {np.percentile(timings, 50):8.1f} us   p99 {np.percentile(timings, 99):8.1f} us")
+
+
+if __name__ == '__main__':
+    rng = np.random.default_rng(0)
+    points = np.column_stack([rng.uniform(8, 34, N_QUERIES), rng.uniform(69, 95, N_QUERIES)])
+
+    bundled = StationCatalog.from_csv()
+    synthetic = StationCatalog(
+        [{'station_id': f'S{i}', 'name': f'Station {i}', 'state': '', 'latitude': lat, 'longitude': lon}
+         for i, (lat, lon) in enumerate(zip(rng.uniform(8, 34, N_STATIONS), rng.uniform(69, 95, N_STATIONS)))],
+        bundled.places, default_station='S0')
+
+    for catalog in (bundled, synthetic):
+        stations_rad = np.radians([[s['latitude'], s['longitude']] for s in catalog.stations])
+        for lat, lon in points[:200]:
+            index, distance = haversine_scan(stations_rad, np.radians([lat, lon]))
+            station, tree_distance = catalog.nearest(lat, lon)
+            assert station is catalog.stations[index] and abs(distance - tree_distance) < 1e-6
+
+        print(f"\n{len(catalog.stations)} stations, {N_QUERIES} random points")
+        report('haversine scan', time_calls(lambda p: haversine_scan(stations_rad, np.radians(p)), points))
+        report('BallTree', time_calls(lambda p: catalog.nearest(*p), points))
+
+    # Per request: every page view geocodes the user's address and searches the tree again
+    random.seed(0)
+    places = list(bundled.places)
+    locations = [f"{random.choice(places).title()} District, Maharashtra" for _ in range(N_USERS)]
+    requests = [random.randrange(N_USERS) for _ in range(N_QUERIES)]
+    cache = LRUCache(N_USERS, 86400)
+
+    def cached(user_id):
+        entry = cache.get(user_id)
+        if entry is None or entry[0] != locations[user_id]:
+            entry = (locations[user_id], bundled.resolve(locations[user_id]))
+            cache.set(user_id, entry)
+        return entry[1]
+
+    print(f"\n{N_QUERIES} requests from {N_USERS} users")
+    report('resolve per request', time_calls(lambda u: bundled.resolve(locations[u]), requests))
+    report('per-user station cache', time_calls(cached, requests))
@@ -0,0 +1,97 @@
+"""Per-page render latency: render_template_string(BASE_TEMPLATE + content) vs. the precompiled templates.
+
+Renders every page with representative context inside a test request.  Run from the project root:
+
+    python benchmarks/bench_template_render.py
+"""
+import os
+import sys
+import time
+import tempfile
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('TEMPLATE_CACHE_DIR', '')
+import agri_dash
+from agri_dash import app, render_template, get_weather_data, get_soil_status_class
+from flask import render_template_string, g
+
+N_RENDERS = 500
+
+USER = {
+    'id': 1, 'username': 'farmer', 'email': 'farmer@example.com', 'phone': '9000000000', 'full_name': 'Test Farmer',
+    'farm_name': 'Green Acres', 'location': 'Pune', 'total_land': 12.5, 'created_at': '2025-01-01 00:00:00',
+}
+CROPS = [
+    {'id': i, 'user_id': 1, 'acre': 2.5, 'crop_type': crop, 'stage': 'Growing', 'planting_date': '2025-06-01'}
+    for i, crop in enumerate(['Rice', 'Wheat', 'Cotton'], start=1)
+]
+SOIL = [
+    {'id': i, 'user_id': 1, 'test_date': f'2025-0{i}-15', 'nitrogen_level': 'Low', 'phosphorus_level': 'Medium',
+     'potassium_level': 'High', 'ph_level': 6.5, 'recommendations': 'Add urea'}
+    for i in range(1, 5)
+]
+
+
+def page_contexts(weather):
+    """(template name, page content constant, context) for every page."""
+    return [
+        ('landing.html', agri_dash.LANDING_PAGE_CONTENT, dict(title='Welcome')),
+        ('login.html', agri_dash.LOGIN_CONTENT, dict(title='Login')),
+        ('register.html', agri_dash.REGISTER_CONTENT, dict(title='Register')),
+        ('forgot_password.html', agri_dash.FORGOT_PASSWORD_CONTENT, dict(title='Forgot Password')),
+        ('reset_password.html', agri_dash.RESET_PASSWORD_CONTENT, dict(title='Reset Password')),
+        ('dashboard.html', agri_dash.DASHBOARD_CONTENT, dict(
+            title='Dashboard', user=USER, crops=CROPS, crop_count=len(CROPS), total_acreage=7.5, last_test_date='2025-04-15',
+            soil_data=SOIL[0], get_soil_status_class=get_soil_status_class, dashboard_rec=None, weather=weather)),
+        ('weather.html', agri_dash.WEATHER_CONTENT, dict(
+            title='Weather Intelligence', weather=weather, forecast=weather['forecast'])),
+        ('fertilizer.html', agri_dash.FERTILIZER_CONTENT, dict(
+            title='Fertilizer & Soil Management', crops=CROPS, latest=SOIL[0], history=SOIL[1:],
+            history_cursor='next', recommendation=None,
+            selected_crop='Rice', get_soil_status_class=get_soil_status_class, current_date='2025-06-01',
+            ml_model_available=True)),
+        ('ml_predictor.html', agri_dash.ML_PREDICTOR_CONTENT, dict(
+            title='KNN Fertilizer Predictor', catalog_url='/api/catalog/' + agri_dash.CATALOG_VERSION,
+            ml_model_available=True)),
+        ('crop_management.html', agri_dash.CROP_MANAGEMENT_CONTENT, dict(title='Crop Management', user_crops=CROPS)),
+        ('profile.html', agri_dash.PROFILE_CONTENT, dict(title='User Profile', user=USER)),
+        ('contact.html', agri_dash.CONTACT_CONTENT, dict(title='Contact Support', all_users=[USER] * 20)),
+    ]
+
+
+def time_renders(fn, n=N_RENDERS):
+    timings = []
+    for _ in range(n):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1e6)
+    return np.array(timings)
+
+
+if __name__ == '__main__':
+    with app.test_request_context('/'):
+        g.user = USER
+        weather = get_weather_data('Pune')
+        g.weather = weather
+        print(f"{'page':<22}{'string p50 (us)':>18}{'compiled p50 (us)':>20}{'speedup':>10}")
+        for name, content, context in page_contexts(weather):
+            source = agri_dash.BASE_TEMPLATE + content
+            before = time_renders(lambda: render_template_string(source, **context))
+            after = time_renders(lambda: render_template(name, **context))
+            p50_before, p50_after = np.percentile(before, 50), np.percentile(after, 50)
+            print(f"{name:<22}{p50_before:>18.1f}{p50_after:>20.1f}{p50_before / p50_after:>9.2f}x")
+
+    # Cold start: compile every page from source vs. loading the on-disk bytecode cache
+    with tempfile.TemporaryDirectory() as cache_dir:
+        from jinja2 import FileSystemBytecodeCache
+        env = app.jinja_env
+        for label, bytecode_cache in (('no bytecode cache', None),
+                                      ('bytecode cache (cold)', FileSystemBytecodeCache(cache_dir)),
+                                      ('bytecode cache (warm)', FileSystemBytecodeCache(cache_dir))):
+            env.bytecode_cache = bytecode_cache
+            env.cache.clear()
+            start = time.perf_counter()
+            agri_dash.precompile_templates()
+            print(f"precompile, {label:<22} {(time.perf_counter() - start) * 1000:8.2f} ms")
@@ -0,0 +1,50 @@
+"""Weather lookups against a slow upstream: a provider call per request vs. the WeatherCache.
+
+Starts the local stub weather API with UPSTREAM_DELAY seconds of latency and sends N_REQUESTS
+lookups from N_THREADS threads, spread over a few cities.  Run from the project root:
+
+    python benchmarks/bench_weather_cache.py
+"""
+import os
+import sys
+import time
+import random
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from weather_service import StubWeatherServer, HTTPWeatherProvider, WeatherCache, STATIC_WEATHER
+
+UPSTREAM_DELAY = 0.05
+N_THREADS = 32
+N_REQUESTS = 2000
+
+
+def run(lookup, cities):
+    def timed(city):
+        start = time.perf_counter()
+        lookup(city)
+        return (time.perf_counter() - start) * 1e3
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(N_THREADS) as pool:
+        timings = np.array(list(pool.map(timed, cities)))
+    return timings, time.perf_counter() - start
+
+
+if __name__ == '__main__':
+    stub = StubWeatherServer(delay=UPSTREAM_DELAY)
+    provider = HTTPWeatherProvider(stub.start())
+    rng = random.Random(0)
+    cities = [rng.choice(list(STATIC_WEATHER)) for _ in range(N_REQUESTS)]
+
+    print(f"{N_REQUESTS} lookups, {N_THREADS} threads, {len(STATIC_WEATHER)} cities, "
+          f"{UPSTREAM_DELAY * 1000:.0f} ms upstream latency")
+    for label, lookup in (('provider per request', provider.fetch),
+                          ('WeatherCache', WeatherCache(provider).get)):
+        before = stub.requests
+        timings, elapsed = run(lookup, cities)
+        print(f"{label:<22} p50 {np.percentile(timings, 50):8.2f} ms   p99 {np.percentile(timings, 99):8.2f} ms   "
+              f"{N_REQUESTS / elapsed:8.0f} req/s   upstream calls {stub.requests - before}")
+    stub.stop()
@@ -0,0 +1,79 @@
+import os
+import time
+import pickle
+import argparse
+import warnings
+import numpy as np
+from ml_engine import build_knn_indexes
+
+# --- Configuration ---
+MODEL_PATH = "knn_model.pkl"
+INDEX_PATH = "knn_index.pkl"
+N_EVAL_QUERIES = 1000
+
+
+def recall_at_k(exact_indices, approx_indices):
+    """Fraction of the true k nearest neighbors that the approximate search also returned."""
+    hits = sum(len(np.intersect1d(e, a)) for e, a in zip(exact_indices, approx_indices))
+    return hits / exact_indices.size
+
+
+def time_queries(search, queries, k):
+    """Per-query latency (microseconds) issuing one single-row query at a time, like /predict does."""
+    timings = []
+    for row in queries:
+        start = time.perf_counter()
+        search(row.reshape(1, -1), k)
+        timings.append((time.perf_counter() - start) * 1e6)
+    return np.array(timings)
+
+
+def report(knn_model, indexes, n_queries=N_EVAL_QUERIES):
+    """Print recall and p50/p99 latency of every search mode against the model's own kneighbors()."""
+    rng = np.random.default_rng(0)
+    train_matrix = knn_model._fit_X
+    k = knn_model.n_neighbors
+    # Held-out style queries: training points jittered so they are not exact matches
+    queries = train_matrix[rng.integers(0, len(train_matrix), n_queries)]
+    queries = queries + rng.normal(0, 0.25, queries.shape)
+
+    searches = {'model (' + knn_model._fit_method + ')': lambda X, k: knn_model.kneighbors(X, n_neighbors=k)}
+    for mode in ('exact', 'approximate'):
+        if mode in indexes:
+            searches[mode] = indexes[mode].query
+
+    _, truth = knn_model.kneighbors(queries, n_neighbors=k)
+    print(f"\n{'mode':<22}{'recall@' + str(k):>10}{'p50 (us)':>12}{'p99 (us)':>12}")
+    for name, search in searches.items():
+        _, found = search(queries, k)
+        timings = time_queries(search, queries, k)
+        print(f"{name:<22}{recall_at_k(truth, found):>10.4f}"
+              f"{np.percentile(timings, 50):>12.1f}{np.percentile(timings, 99):>12.1f}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Build the precomputed KNN neighbor index used by /predict.")
+    parser.add_argument('--model', default=MODEL_PATH)
+    parser.add_argument('--output', default=INDEX_PATH)
+    parser.add_argument('--tree', choices=['kd_tree', 'ball_tree'], default=None,
+                        help="Exact index tree kind (default: the model's own, as chosen by train_knn.py, else kd_tree).")
+    parser.add_argument('--n-lists', type=int, default=None, help="Approximate mode: number of k-means buckets.")
+    parser.add_argument('--n-probe', type=int, default=None, help="Approximate mode: buckets scanned per query.")
+    args = parser.parse_args()
+
+    warnings.filterwarnings("ignore", category=UserWarning)
+    with open(args.model, 'rb') as f:
+        knn_model = pickle.load(f)
+    print(f"✅ Loaded {args.model}: {knn_model._fit_X.shape[0]} training points, k={knn_model.n_neighbors}.")
+
+    tree = args.tree or (knn_model.algorithm if knn_model.algorithm in ('kd_tree', 'ball_tree') else 'kd_tree')
+    start = time.perf_counter()
+    indexes = build_knn_indexes(knn_model, kind=tree, n_lists=args.n_lists, n_probe=args.n_probe)
+    print(f"✅ Built indexes {sorted(m for m in indexes if m != 'fingerprint')} "
+          f"in {time.perf_counter() - start:.2f}s.")
+
+    with open(args.output, 'wb') as f:
+        pickle.dump(indexes, f)
+    print(f"✅ Saved to {os.path.abspath(args.output)} ({os.path.getsize(args.output) / 1024:.1f} KB).")
+
+    report(knn_model, indexes)
@@ -0,0 +1,126 @@
+import os
+import json
+import pickle
+import argparse
+import warnings
+import h5py
+import numpy as np
+from ml_engine import fold_batch_norm, ANNInferenceEngine, CategoricalEncoder, CATEGORY_SYNONYMS
+
+# --- Configuration ---
+# Inputs are the files written by train_and_save.py
+OUTPUT_DIR = 'output_models'
+MODEL_PATH = os.path.join(OUTPUT_DIR, "model.h5")
+ENCODERS_PATH = os.path.join(OUTPUT_DIR, "encoders.pkl")
+SCALER_PATH = os.path.join(OUTPUT_DIR, "scaler.pkl")
+CATEGORY_ENCODER_PATH = os.path.join(OUTPUT_DIR, "category_encoder.npz")
+WEIGHTS_PATH = os.path.join(OUTPUT_DIR, "ann_weights.npz")
+
+
+def read_layer_weights(group):
+    """Map weight names (kernel, bias, gamma, ...) to arrays for one layer of a Keras H5 file."""
+    weights = {}
+    group.visititems(lambda name, obj: weights.__setitem__(name.split('/')[-1].split(':')[0], obj[()])
+                     if isinstance(obj, h5py.Dataset) else None)
+    return weights
+
+
+def read_keras_h5(path):
+    """Read a Sequential Keras .h5 file into fold_batch_norm()'s layer list, without TensorFlow."""
+    layers = []
+    with h5py.File(path, 'r') as f:
+        config = json.loads(f.attrs['model_config'])
+        weights_root = f['model_weights'] if 'model_weights' in f else f
+        for layer in config['config']['layers']:
+            kind, cfg = layer['class_name'], layer['config']
+            if kind == 'InputLayer':
+                continue
+            if kind == 'Dropout':
+                layers.append(('dropout',))
+                continue
+
+            weights = read_layer_weights(weights_root[cfg['name']])
+            if kind == 'Dense':
+                bias = weights.get('bias', np.zeros(weights['kernel'].shape[1]))
+                layers.append(('dense', weights['kernel'], bias, cfg.get('activation', 'linear')))
+            elif kind == 'BatchNormalization':
+                units = len(weights['moving_mean'])
+                layers.append(('batch_norm', weights.get('gamma', np.ones(units)), weights.get('beta', np.zeros(units)),
+                               weights['moving_mean'], weights['moving_variance'], cfg.get('epsilon', 1e-3)))
+            else:
+                raise ValueError(f"Layer type {kind} is not supported by the NumPy exporter.")
+    return layers
+
+
+def load_category_encoder(path, encoders):
+    """The encoder saved by train_and_save.py, or one rebuilt from an older run's LabelEncoders."""
+    if os.path.exists(path):
+        return CategoricalEncoder.load(path)
+    return CategoricalEncoder({col: le.classes_ for col, le in encoders['label_encoders'].items()},
+                              synonyms=CATEGORY_SYNONYMS)
+
+
+def reference_forward(layers, x):
+    """Unfolded forward pass (explicit BatchNormalization) used to verify the folded weights."""
+    for layer in layers:
+        if layer[0] == 'dense':
+            W, b, activation = layer[1:]
+            x = x @ W + b
+            if activation == 'relu':
+                x = np.maximum(x, 0)
+            elif activation == 'softmax':
+                x = np.exp(x - x.max(axis=1, keepdims=True))
+                x = x / x.sum(axis=1, keepdims=True)
+        elif layer[0] == 'batch_norm':
+            gamma, beta, mean, var, eps = layer[1:]
+            x = gamma * (x - mean) / np.sqrt(var + eps) + beta
+    return x
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Export the trained Keras ANN to plain NumPy weight arrays.")
+    parser.add_argument('--model', default=MODEL_PATH)
+    parser.add_argument('--encoders', default=ENCODERS_PATH)
+    parser.add_argument('--scaler', default=SCALER_PATH)
+    parser.add_argument('--category-encoder', default=CATEGORY_ENCODER_PATH)
+    parser.add_argument('--output', default=WEIGHTS_PATH)
+    args = parser.parse_args()
+
+    warnings.filterwarnings("ignore", category=UserWarning)
+    layers = read_keras_h5(args.model)
+    dense_layers = fold_batch_norm(layers)
+    print(f"✅ Read {len(layers)} layers; {len(dense_layers)} dense layers after folding BatchNorm and dropping Dropout.")
+
+    with open(args.encoders, 'rb') as f:
+        encoders = pickle.load(f)
+    with open(args.scaler, 'rb') as f:
+        scaler = pickle.load(f)
+
+    arrays = {
+        'activations': np.array([activation for _, _, activation in dense_layers]),
+        'scaler_mean': scaler.mean_,
+        'scaler_scale': scaler.scale_,
+        'feature_names': np.array(list(scaler.feature_names_in_)),
+        'classes': np.array(encoders['fertilizer_encoder'].classes_, dtype=str),
+    }
+    for i, (W, b, _) in enumerate(dense_layers):
+        arrays[f'W{i}'], arrays[f'b{i}'] = W, b
+    # Serving encodes requests with exactly the code tables training used
+    arrays.update(load_category_encoder(args.category_encoder, encoders).to_arrays())
+
+    os.makedirs(os.path.dirname(args.output) or '.', exist_ok=True)
+    # Write beside and rename into place so a running app never loads a half-written file
+    tmp_path = args.output + '.tmp.npz'
+    np.savez(tmp_path, **arrays)
+    os.replace(tmp_path, args.output)
+    print(f"✅ Saved weights to {os.path.abspath(args.output)} ({os.path.getsize(args.output) / 1024:.1f} KB).")
+
+    # Verify the folded NumPy forward pass against the unfolded network
+    engine = ANNInferenceEngine.from_npz(args.output)
+    rng = np.random.default_rng(0)
+    samples = scaler.mean_ + rng.standard_normal((1000, len(scaler.mean_))) * scaler.scale_
+    expected = reference_forward(layers, scaler.transform(samples))
+    actual = engine.predict_proba(samples)
+    max_error = np.abs(expected - actual).max()
+    agreement = np.mean(expected.argmax(axis=1) == actual.argmax(axis=1))
+    print(f"✅ Folded vs. unfolded network: max probability error {max_error:.2e}, argmax agreement {agreement:.2%}.")
@@ -0,0 +1,876 @@
+import os
+import json
+import time
+import pickle
+import hashlib
+import threading
+import numpy as np
+import sklearn
+from collections import namedtuple
+from datetime import datetime
+from sklearn.cluster import MiniBatchKMeans
+from sklearn.metrics import pairwise_distances
+from sklearn.neighbors import KDTree, BallTree
+
+# ==============================================================================
+# --- KNN Inference Engine ---
+# ==============================================================================
+
+# Per-row arrays: encoded label, vote share of that label, distance to the nearest neighbor
+KNNPrediction = namedtuple('KNNPrediction', ['labels', 'vote_shares', 'nearest_distances'])
+# Feature order the KNN is fitted with (train_knn.py) and queried with (agri_dash.py)
+KNN_FEATURE_COLUMNS = ["Crop", "Region", "Month", "Temperature(C)", "Humidity(%)", "Soil_pH", "Moisture(%)",
+                       "N", "P", "K"]
+
+
+class KNNInferenceEngine:
+    """Wraps a fitted KNeighborsClassifier and scaler, answering each query with one neighbor search.
+
+    KNeighborsClassifier.predict() runs its own kneighbors() internally, so calling predict()
+    and then kneighbors() for the confidence score searches the training set twice. Here the
+    neighbor search runs once and the vote is recomputed from its result.
+    """
+
+    def __init__(self, knn_model, scaler, index=None, encoder=None):
+        self.knn_model = knn_model
+        self.scaler = scaler
+        # Optional precomputed TreeIndex/IVFIndex; None uses the model's own kneighbors()
+        self.index = index
+        # CategoricalEncoder saved by train_knn.py with the model (knn_encoder.npz)
+        self.encoder = encoder
+        self.feature_names = list(KNN_FEATURE_COLUMNS)
+        self.classes = np.asarray(knn_model.classes_)
+        self.n_neighbors = knn_model.n_neighbors
+        self.weights = knn_model.weights
+        # Encoded class index (into classes_) of every fitted training point
+        self.train_labels = np.asarray(knn_model._y)
+
+    def _neighbor_weights(self, distances):
+        """Per-neighbor vote weights, matching scikit-learn's 'uniform'/'distance'/callable rules."""
+        if self.weights in (None, 'uniform'):
+            return np.ones_like(distances)
+        if self.weights == 'distance':
+            with np.errstate(divide='ignore'):
+                weights = 1.0 / distances
+            # An exact match gets all the vote, as in sklearn.neighbors._base._get_weights
+            inf_mask = np.isinf(weights)
+            inf_rows = inf_mask.any(axis=1)
+            weights[inf_rows] = inf_mask[inf_rows]
+            return weights
+        return np.asarray(self.weights(distances), dtype=float)
+
+    def kneighbors(self, features):
+        """Scale raw feature rows and run the single neighbor search."""
+        features_scaled = self.scaler.transform(np.atleast_2d(np.asarray(features, dtype=float)))
+        if self.index is not None:
+            return self.index.query(features_scaled, self.n_neighbors)
+        return self.knn_model.kneighbors(features_scaled, n_neighbors=self.n_neighbors)
+
+    def vote(self, distances, indices):
+        """Derive labels, vote shares and nearest distances from one kneighbors() result."""
+        neighbor_labels = self.train_labels[indices]
+        weights = self._neighbor_weights(distances)
+
+        votes = np.zeros((indices.shape[0], len(self.classes)))
+        rows = np.repeat(np.arange(indices.shape[0]), indices.shape[1])
+        np.add.at(votes, (rows, neighbor_labels.ravel()), weights.ravel())
+
+        # argmax keeps the lowest class on ties, like scipy's mode/weighted_mode
+        winners = votes.argmax(axis=1)
+        totals = votes.sum(axis=1)
+        shares = np.divide(votes[np.arange(len(winners)), winners], totals,
+                           out=np.zeros(len(winners)), where=totals > 0)
+
+        return KNNPrediction(self.classes[winners], shares, distances[:, 0])
+
+    def predict(self, features):
+        """Predict one or many raw (unscaled) feature rows."""
+        distances, indices = self.kneighbors(features)
+        return self.vote(distances, indices)
+
+
+# ==============================================================================
+# --- Precomputed Neighbor Indexes ---
+# ==============================================================================
+
+INDEX_MODES = ('exact', 'approximate')
+
+
+def training_fingerprint(train_matrix):
+    """Short content hash used to check that an index was built for this exact training matrix."""
+    return hashlib.sha256(np.ascontiguousarray(train_matrix, dtype=np.float64).tobytes()).hexdigest()[:16]
+
+
+def train_points(train_matrix):
+    """The training matrix as C-ordered float64, the layout sklearn trees search; mapped arrays are not copied."""
+    return np.ascontiguousarray(train_matrix, dtype=np.float64)
+
+
+class TreeIndex:
+    """Exact k-nearest-neighbor search over the scaled training matrix with a KD-tree or ball tree.
+
+    Pickles hold only the tree structure (point order and node bounds), not the training matrix.
+    attach() restores the tree over the model's own array, so with memory-mapped artifacts every
+    worker searches the shared pages instead of unpickling a private copy of the points.
+    """
+
+    def __init__(self, train_matrix, kind='kd_tree', leaf_size=30, metric='minkowski', p=2):
+        self.kind = kind
+        self.leaf_size = leaf_size
+        self.metric = metric
+        self.p = p
+        self.tree = self._build(train_points(train_matrix))
+
+    def _build(self, points):
+        tree_cls = KDTree if self.kind == 'kd_tree' else BallTree
+        metric_kwargs = {'p': self.p} if self.metric == 'minkowski' else {}
+        return tree_cls(points, leaf_size=self.leaf_size, metric=self.metric, **metric_kwargs)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        tree = state.pop('tree')
+        # sklearn's tree state is (data, idx_array, node_data, node_bounds, ...); keep all but the data
+        state['tree_state'] = tree.__getstate__()[1:]
+        state['sklearn_version'] = sklearn.__version__
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        # Indexes pickled before the points were split out still carry a complete tree
+        self.__dict__.setdefault('tree', None)
+
+    def attach(self, train_matrix):
+        """Restore the unpickled tree over train_matrix, the (possibly memory-mapped) points it was built on."""
+        if self.tree is not None:
+            return self
+        points = train_points(train_matrix)
+        if self.sklearn_version == sklearn.__version__:
+            tree_cls = KDTree if self.kind == 'kd_tree' else BallTree
+            tree = tree_cls.__new__(tree_cls)
+            tree.__setstate__((points,) + tuple(self.tree_state))
+        else:
+            # The saved node layout may not match this scikit-learn; rebuilding still shares the points
+            tree = self._build(points)
+        self.tree = tree
+        del self.tree_state
+        return self
+
+    def query(self, features_scaled, k):
+        return self.tree.query(features_scaled, k=k)
+
+
+class IVFIndex:
+    """Approximate search: points are bucketed by a coarse k-means quantizer and only the
+    n_probe buckets whose centroids are closest to the query are scanned (Euclidean only)."""
+
+    def __init__(self, train_matrix, n_lists=None, n_probe=None, random_state=42):
+        train_matrix = np.asarray(train_matrix, dtype=np.float32)
+        n_samples = train_matrix.shape[0]
+        self.n_lists = n_lists or max(1, int(np.sqrt(n_samples)))
+        self.n_probe = n_probe or max(1, self.n_lists // 4)
+
+        quantizer = MiniBatchKMeans(n_clusters=self.n_lists, random_state=random_state, n_init=3,
+                                    batch_size=min(n_samples, 4096))
+        assignments = quantizer.fit_predict(train_matrix)
+        self.centroids = quantizer.cluster_centers_.astype(np.float32)
+
+        # Inverted lists stored contiguously: bucket b holds order[offsets[b]:offsets[b + 1]]
+        self.order = np.argsort(assignments, kind='stable')
+        self.offsets = np.concatenate([[0], np.cumsum(np.bincount(assignments, minlength=self.n_lists))])
+        self.points = train_matrix[self.order]
+
+    def query(self, features_scaled, k):
+        features_scaled = np.asarray(features_scaled, dtype=np.float32)
+        if k > len(self.points):
+            # Same contract as KDTree.query: results are always (n, k)
+            raise ValueError(f"k={k} must be at most the number of indexed points ({len(self.points)}).")
+        all_distances = np.empty((features_scaled.shape[0], k))
+        all_indices = np.empty((features_scaled.shape[0], k), dtype=np.intp)
+
+        centroid_distances = ((features_scaled[:, None, :] - self.centroids[None, :, :]) ** 2).sum(axis=2)
+        probe_order = np.argsort(centroid_distances, axis=1)
+        bucket_sizes = np.diff(self.offsets)
+
+        for row, query in enumerate(features_scaled):
+            # Probe the n_probe nearest buckets, plus the next nearest ones until they hold at least k points
+            probed_sizes = np.cumsum(bucket_sizes[probe_order[row]])
+            n_probe = max(self.n_probe, int(np.searchsorted(probed_sizes, k)) + 1)
+            buckets = probe_order[row, :n_probe]
+            candidates = np.concatenate([np.arange(self.offsets[b], self.offsets[b + 1]) for b in buckets])
+
+            distances = np.sqrt(((self.points[candidates] - query) ** 2).sum(axis=1))
+            nearest = np.argpartition(distances, k - 1)[:k] if len(candidates) > k else np.arange(k)
+            nearest = nearest[np.argsort(distances[nearest])]
+            all_distances[row] = distances[nearest]
+            all_indices[row] = self.order[candidates[nearest]]
+
+        return all_distances, all_indices
+
+
+def build_knn_indexes(knn_model, kind='kd_tree', n_lists=None, n_probe=None):
+    """Build exact and (for Euclidean models) approximate indexes over a fitted model's training points."""
+    train_matrix = knn_model._fit_X
+    metric, p = knn_model.effective_metric_, knn_model.effective_metric_params_.get('p', 2)
+    indexes = {
+        'fingerprint': training_fingerprint(train_matrix),
+        'exact': TreeIndex(train_matrix, kind=kind, leaf_size=knn_model.leaf_size, metric=metric, p=p),
+    }
+    if metric == 'euclidean' or (metric == 'minkowski' and p == 2):
+        indexes['approximate'] = IVFIndex(train_matrix, n_lists=n_lists, n_probe=n_probe)
+    return indexes
+
+
+def load_knn_index(path, knn_model, mode):
+    """Load the persisted index for the requested mode, or None to fall back to the model's own search."""
+    if mode not in INDEX_MODES or not os.path.exists(path):
+        return None
+    try:
+        with open(path, 'rb') as f:
+            indexes = pickle.load(f)
+    except Exception as e:
+        print(f"Error loading KNN index: {e}")
+        return None
+
+    # Mapped models carry the fingerprint from their header, avoiding a full read of the training matrix
+    fingerprint = getattr(knn_model, 'fingerprint', None) or training_fingerprint(knn_model._fit_X)
+    if indexes.get('fingerprint') != fingerprint:
+        print(f"Warning: {path} was built for a different training set; rebuild it with build_knn_index.py.")
+        return None
+    if mode not in indexes:
+        print(f"Warning: {path} has no '{mode}' index; using the model's own neighbor search.")
+        return None
+    index = indexes[mode]
+    if isinstance(index, TreeIndex):
+        index.attach(knn_model._fit_X)
+    return index
+
+
+# ==============================================================================
+# --- Memory-Mapped Model Artifacts ---
+# ==============================================================================
+
+# Layout of an exported artifact directory: one .npy file per array plus header.json.
+# Arrays are opened with np.load(mmap_mode='r'), so every worker process maps the same
+# page-cache pages instead of unpickling a private copy of the training matrix.
+ARTIFACT_FORMAT_VERSION = 1
+ARTIFACT_HEADER = "header.json"
+ARTIFACT_ARRAYS = ('train_points', 'train_sq_norms', 'train_labels', 'classes', 'scaler_mean', 'scaler_scale')
+
+
+class ArrayScaler:
+    """StandardScaler.transform() over plain (possibly memory-mapped) mean/scale arrays."""
+
+    def __init__(self, mean, scale):
+        self.mean_ = mean
+        self.scale_ = scale
+        self.n_features_in_ = len(mean)
+
+    def transform(self, features):
+        return (np.asarray(features, dtype=float) - self.mean_) / self.scale_
+
+
+class MappedKNNModel:
+    """The parts of a fitted KNeighborsClassifier the inference engine needs, backed by mapped arrays.
+
+    kneighbors() is an exact brute-force search; use a precomputed index for large training sets.
+    """
+
+    _fit_method = 'brute'
+
+    def __init__(self, header, arrays):
+        self._fit_X = arrays['train_points']
+        self._y = arrays['train_labels']
+        self.classes_ = arrays['classes']
+        self.train_sq_norms = arrays['train_sq_norms']
+        self.n_neighbors = header['n_neighbors']
+        self.weights = header['weights']
+        self.leaf_size = header['leaf_size']
+        self.effective_metric_ = header['metric']
+        self.effective_metric_params_ = header['metric_params']
+        self.fingerprint = header['fingerprint']
+        self.n_features_in_ = header['n_features']
+
+    def kneighbors(self, features_scaled, n_neighbors=None, chunk_size=1024):
+        k = n_neighbors or self.n_neighbors
+        features_scaled = np.atleast_2d(np.asarray(features_scaled, dtype=float))
+        all_distances = np.empty((len(features_scaled), k))
+        all_indices = np.empty((len(features_scaled), k), dtype=np.intp)
+
+        for start in range(0, len(features_scaled), chunk_size):
+            chunk = features_scaled[start:start + chunk_size]
+            if self.effective_metric_ == 'euclidean':
+                # |a - b|^2 = |a|^2 - 2 a.b + |b|^2, with |b|^2 precomputed at export time
+                sq = (chunk ** 2).sum(axis=1)[:, None] - 2 * chunk @ self._fit_X.T + self.train_sq_norms[None, :]
+                distances = np.sqrt(np.maximum(sq, 0))
+            else:
+                distances = pairwise_distances(chunk, self._fit_X, metric=self.effective_metric_,
+                                               **self.effective_metric_params_)
+
+            nearest = np.argpartition(distances, k - 1, axis=1)[:, :k] if distances.shape[1] > k \
+                else np.tile(np.arange(distances.shape[1]), (len(chunk), 1))
+            nearest_distances = np.take_along_axis(distances, nearest, axis=1)
+            ordering = np.argsort(nearest_distances, axis=1, kind='stable')
+            all_indices[start:start + len(chunk)] = np.take_along_axis(nearest, ordering, axis=1)
+            all_distances[start:start + len(chunk)] = np.take_along_axis(nearest_distances, ordering, axis=1)
+
+        return all_distances, all_indices
+
+
+def source_digest(*paths):
+    """Short content hash of the files an export was made from (the model and scaler pickles)."""
+    digest = hashlib.sha256()
+    for path in paths:
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+    return digest.hexdigest()[:16]
+
+
+def export_knn_artifacts(knn_model, scaler, directory, source=None):
+    """Write a fitted KNeighborsClassifier and StandardScaler as .npy arrays plus a JSON header.
+
+    `source` is the source_digest() of the pickles the pair came from; artifacts_current() compares
+    it with the pickles on disk to tell whether the export is stale.
+    """
+    if callable(knn_model.weights):
+        raise ValueError("Models with callable weights cannot be exported to the array format.")
+
+    train_points = np.ascontiguousarray(knn_model._fit_X, dtype=np.float64)
+    n_features = train_points.shape[1]
+    scaler_mean = getattr(scaler, 'mean_', None)
+    scaler_scale = getattr(scaler, 'scale_', None)
+    arrays = {
+        'train_points': train_points,
+        'train_sq_norms': (train_points ** 2).sum(axis=1),
+        'train_labels': np.asarray(knn_model._y, dtype=np.int32),
+        'classes': np.asarray(knn_model.classes_),
+        'scaler_mean': np.zeros(n_features) if scaler_mean is None else np.asarray(scaler_mean, dtype=np.float64),
+        'scaler_scale': np.ones(n_features) if scaler_scale is None else np.asarray(scaler_scale, dtype=np.float64),
+    }
+    if arrays['classes'].dtype == object:
+        arrays['classes'] = arrays['classes'].astype(str)
+
+    os.makedirs(directory, exist_ok=True)
+    for name in ARTIFACT_ARRAYS:
+        # Write beside and rename over the old file: processes still mapping the previous
+        # export keep their (now unlinked) pages instead of seeing the file rewritten under them
+        path = os.path.join(directory, name + '.npy')
+        with open(path + '.tmp', 'wb') as f:
+            np.save(f, arrays[name], allow_pickle=False)
+        os.replace(path + '.tmp', path)
+
+    metric_params = dict(knn_model.effective_metric_params_ or {})
+    header = {
+        'format_version': ARTIFACT_FORMAT_VERSION,
+        'n_samples': int(train_points.shape[0]),
+        'n_features': int(n_features),
+        'n_neighbors': int(knn_model.n_neighbors),
+        'weights': knn_model.weights,
+        'leaf_size': int(knn_model.leaf_size),
+        'metric': knn_model.effective_metric_,
+        'metric_params': metric_params,
+        'fingerprint': training_fingerprint(train_points),
+        'source_digest': source,
+        'arrays': {name: name + '.npy' for name in ARTIFACT_ARRAYS},
+    }
+    # Header goes last and is swapped in atomically, so readers never see a half-written export
+    tmp_path = os.path.join(directory, ARTIFACT_HEADER + '.tmp')
+    with open(tmp_path, 'w') as f:
+        json.dump(header, f, indent=2)
+    os.replace(tmp_path, os.path.join(directory, ARTIFACT_HEADER))
+    return header
+
+
+def load_knn_artifacts(directory):
+    """Open an exported artifact directory memory-mapped; returns (MappedKNNModel, ArrayScaler)."""
+    with open(os.path.join(directory, ARTIFACT_HEADER)) as f:
+        header = json.load(f)
+    if header.get('format_version') != ARTIFACT_FORMAT_VERSION:
+        raise ValueError(f"Unsupported artifact format version: {header.get('format_version')}")
+
+    arrays = {name: np.load(os.path.join(directory, filename), mmap_mode='r', allow_pickle=False)
+              for name, filename in header['arrays'].items()}
+    if arrays['train_points'].shape != (header['n_samples'], header['n_features']):
+        raise ValueError("Artifact arrays do not match header.json; re-export the model.")
+
+    return MappedKNNModel(header, arrays), ArrayScaler(arrays['scaler_mean'], arrays['scaler_scale'])
+
+
+def artifacts_current(directory, model_path, scaler_path):
+    """True if the export in directory reflects the pickles: it was made from these exact files, or
+    there are no pickles. Exports without a recorded digest count as current unless a pickle is newer."""
+    header_path = os.path.join(directory, ARTIFACT_HEADER)
+    if not os.path.exists(header_path):
+        return False
+    if not (os.path.exists(model_path) and os.path.exists(scaler_path)):
+        return True
+    with open(header_path) as f:
+        exported_from = json.load(f).get('source_digest')
+    if exported_from is None:
+        return os.path.getmtime(header_path) >= max(os.path.getmtime(model_path), os.path.getmtime(scaler_path))
+    return exported_from == source_digest(model_path, scaler_path)
+
+
+# ==============================================================================
+# --- Categorical Encoding ---
+# ==============================================================================
+
+# Names that refer to the same category. An encoder maps every name in a group that is not
+# itself one of its classes to the first name in the group that is, so the app's display names
+# ("Maize (Corn)") and the training data's names ("maize") resolve to the same code.
+CATEGORY_SYNONYMS = {
+    "Crop": [
+        ["Maize (Corn)", "Maize", "Corn"],
+        ["Ragi (Finger Millet)", "Finger Millet (Ragi)", "Ragi", "Finger Millet"],
+        ["Jowar (Sorghum)", "Sorghum (Jowar)", "Jowar", "Sorghum"],
+        ["Bajra (Pearl Millet)", "Pearl Millet (Bajra)", "Bajra", "Pearl Millet"],
+        ["Bengal Gram (Chana)", "Chickpea (Chana)", "Chana", "Chickpea", "Gram"],
+        ["Red Gram (Arhar)", "Pigeon Pea (Arhar/Toor)", "Arhar", "Toor", "Tur", "Pigeon Pea"],
+        ["Green Gram (Moong)", "Mung Bean (Moong)", "Moong", "Mung Bean"],
+        ["Black Gram (Urad)", "Urd Bean (Urad)", "Urad", "Urd Bean"],
+        ["Kidney Bean (Rajma)", "Rajma", "Kidney Bean"],
+        ["Horse Gram (Kulthi)", "Kulthi", "Horse Gram"],
+        ["Moth Bean (Matki)", "Matki", "Moth Bean"],
+        ["Grass Pea (Khesari)", "Khesari", "Grass Pea"],
+        ["Sesame (Til)", "Sesame", "Til"],
+        ["Peas", "Peas (Matar)", "Matar"],
+        ["Brinjal (Eggplant)", "Brinjal", "Eggplant"],
+        ["Okra (Bhindi)", "Okra", "Bhindi", "Lady Finger"],
+        ["Citrus (Orange, Lemon, Lime)", "Citrus"],
+    ],
+    "Region": [
+        ["Odisha", "Orissa"],
+        ["Uttarakhand", "Uttaranchal"],
+    ],
+    "Month": [[month, month[:3]] for month in (
+        "January", "February", "March", "April", "May", "June",
+        "July", "August", "September", "October", "November", "December")] + [["September", "Sept"]],
+}
+
+
+def normalize_category(value):
+    """Lookup key of a category name: stripped and lowercased; a missing value becomes ''."""
+    return '' if value is None else str(value).strip().lower()
+
+
+def resolve_aliases(class_keys, synonym_groups):
+    """{alias key: class key} for the synonym groups that name one of the (normalized) classes."""
+    class_keys = set(class_keys)
+    aliases = {}
+    for group in synonym_groups:
+        keys = [normalize_category(name) for name in group]
+        target = next((key for key in keys if key in class_keys), None)
+        if target is None:
+            continue
+        for key in keys:
+            if key not in class_keys:
+                aliases.setdefault(key, target)
+    return aliases
+
+
+def hash_names(values):
+    """int64 array of hash() of each name; hashing is cached on str objects, so this is one C-level pass."""
+    values = values if isinstance(values, (list, tuple)) else list(values)
+    try:
+        return np.fromiter(map(hash, values), dtype=np.int64, count=len(values))
+    except TypeError:
+        # Unhashable JSON values (lists, objects) can never name a category
+        return np.fromiter((hash(v if isinstance(v, str) else str(v)) for v in values), dtype=np.int64,
+                           count=len(values))
+
+
+class CategoricalEncoder:
+    """Compiled string -> integer code tables for the categorical input columns.
+
+    A column's code is the position of its class in `classes[column]` (for fit(), the sorted order
+    LabelEncoder uses). Lookups are case- and surrounding-whitespace-insensitive and also accept
+    aliases. Each column is compiled to a sorted array of the keys' string hashes with their codes,
+    so transform() encodes N names with one hash pass and one np.searchsorted; only names that
+    miss the exact spellings are normalized and looked up again. The tables are rebuilt from the
+    classes and aliases that training saves and serving loads (to_arrays()/from_arrays()).
+    """
+
+    def __init__(self, classes, aliases=None, synonyms=None):
+        """classes: {column: names in code order}; aliases: {column: {alias: class}}; synonyms: groups
+        as in CATEGORY_SYNONYMS, resolved against the classes and added to aliases."""
+        self.classes = {col: np.asarray(values, dtype=str) for col, values in classes.items()}
+        self.aliases = {}
+        self._hashes = {}
+        self._codes = {}
+        for col, values in self.classes.items():
+            class_keys = [normalize_category(name) for name in values]
+            col_aliases = {}
+            if synonyms:
+                col_aliases.update(resolve_aliases(class_keys, synonyms.get(col, ())))
+            if aliases and col in aliases:
+                col_aliases.update((normalize_category(alias), normalize_category(target))
+                                   for alias, target in aliases[col].items())
+            code_of = {key: code for code, key in enumerate(class_keys)}
+            col_aliases = {alias: target for alias, target in col_aliases.items()
+                           if target in code_of and alias not in code_of}
+            self.aliases[col] = col_aliases
+
+            # Normalized class names and aliases, plus the classes as spelled, so exact names hit first time
+            table = dict(code_of)
+            table.update((alias, code_of[target]) for alias, target in col_aliases.items())
+            for code, name in enumerate(values):
+                table.setdefault(str(name), code)
+            hashes = hash_names(list(table))
+            order = np.argsort(hashes)
+            self._hashes[col] = hashes[order]
+            self._codes[col] = np.asarray(list(table.values()), dtype=np.int64)[order]
+
+    @classmethod
+    def fit(cls, columns, synonyms=None):
+        """Build an encoder whose classes are the sorted unique normalized values of each column."""
+        return cls({col: sorted({normalize_category(v) for v in values}) for col, values in columns.items()},
+                   synonyms=synonyms)
+
+    def _lookup(self, column, hashes):
+        keys, codes = self._hashes[column], self._codes[column]
+        if len(keys) == 0:
+            return np.full(len(hashes), -1, dtype=np.int64)
+        positions = np.minimum(np.searchsorted(keys, hashes), len(keys) - 1)
+        return np.where(keys[positions] == hashes, codes[positions], -1)
+
+    def transform(self, column, values):
+        """Codes for a sequence of names in one vectorized lookup; unknown names encode as -1."""
+        values = values if isinstance(values, (list, tuple)) else list(values)
+        codes = self._lookup(column, hash_names(values))
+        missed = np.flatnonzero(codes < 0)
+        if len(missed):
+            # Only names not spelled exactly like a class pay for normalization
+            codes[missed] = self._lookup(column, hash_names([normalize_category(values[i]) for i in missed]))
+        return codes
+
+    def encode(self, column, value):
+        """Code of one name, or None if it is unknown."""
+        code = int(self.transform(column, [value])[0])
+        return code if code >= 0 else None
+
+    def inverse_transform(self, column, codes):
+        return self.classes[column][np.asarray(codes)]
+
+    def to_arrays(self):
+        """Plain arrays for np.savez: classes__<column> in code order, aliases__<column> as (alias, class) rows."""
+        arrays = {}
+        for col, values in self.classes.items():
+            arrays[f'classes__{col}'] = values
+            pairs = sorted(self.aliases[col].items())
+            arrays[f'aliases__{col}'] = np.asarray(pairs, dtype=str).reshape(len(pairs), 2)
+        return arrays
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        classes, aliases = {}, {}
+        for key in arrays:
+            if key.startswith('classes__'):
+                col = key[len('classes__'):]
+                classes[col] = arrays[key]
+                aliases[col] = {str(alias): str(target) for alias, target in arrays.get(f'aliases__{col}', ())}
+        return cls(classes, aliases=aliases)
+
+    def save(self, path):
+        tmp_path = path + '.tmp.npz'
+        np.savez(tmp_path, **self.to_arrays())
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as data:
+            return cls.from_arrays({key: data[key] for key in data.files})
+
+
+# ==============================================================================
+# --- ANN NumPy Inference ---
+# ==============================================================================
+
+# Per-row arrays: predicted class name and its softmax probability
+ANNPrediction = namedtuple('ANNPrediction', ['labels', 'confidences'])
+
+ANN_ACTIVATIONS = ('linear', 'relu', 'softmax')
+
+
+def fold_batch_norm(layers):
+    """Fold inference-mode BatchNormalization into neighboring Dense layers and drop Dropout.
+
+    layers is a list of ('dense', W, b, activation), ('batch_norm', gamma, beta, mean, var, eps)
+    or ('dropout',) tuples in model order. BN is an affine map z = a*h + c per unit; after a
+    linear Dense it folds backwards into that layer, otherwise (e.g. after a ReLU) forwards into
+    the next Dense as W' = a[:, None] * W and b' = c @ W + b. Returns [(W, b, activation), ...].
+    """
+    folded = []
+    pending = None  # (a, c) of a BN that still has to be folded into the next Dense
+    for layer in layers:
+        kind = layer[0]
+        if kind == 'dropout':
+            continue
+        if kind == 'batch_norm':
+            gamma, beta, mean, var, eps = layer[1:]
+            a = gamma / np.sqrt(var + eps)
+            c = beta - mean * a
+            if pending is not None:
+                pending = (pending[0] * a, pending[1] * a + c)
+            elif folded and folded[-1][2] == 'linear':
+                W, b, activation = folded[-1]
+                folded[-1] = (W * a[None, :], b * a + c, activation)
+            else:
+                pending = (a, c)
+            continue
+        if kind != 'dense':
+            raise ValueError(f"Unsupported layer type for NumPy inference: {kind}")
+
+        W, b, activation = layer[1:]
+        if activation not in ANN_ACTIVATIONS:
+            raise ValueError(f"Unsupported activation for NumPy inference: {activation}")
+        if pending is not None:
+            a, c = pending
+            W, b = a[:, None] * W, c @ W + b
+            pending = None
+        folded.append((np.asarray(W, dtype=np.float32), np.asarray(b, dtype=np.float32), activation))
+
+    if pending is not None:
+        raise ValueError("A BatchNormalization layer after the last Dense layer cannot be folded.")
+    return folded
+
+
+class ANNInferenceEngine:
+    """Pure-NumPy forward pass of the exported Keras network (see export_ann_weights.py).
+
+    Inputs are raw feature rows in the network's training column order; categorical columns
+    hold the codes of the encoder saved by training (see encode()). No TensorFlow import is needed.
+    """
+
+    def __init__(self, dense_layers, scaler_mean, scaler_scale, feature_names, encoder, class_names):
+        self.dense_layers = dense_layers
+        self.scaler = ArrayScaler(np.asarray(scaler_mean, dtype=np.float32), np.asarray(scaler_scale, dtype=np.float32))
+        self.feature_names = list(feature_names)
+        self.class_names = np.asarray(class_names)
+        self.classes = self.class_names
+        self.encoder = encoder
+
+    @classmethod
+    def from_npz(cls, path):
+        with np.load(path, allow_pickle=False) as data:
+            n_layers = len(data['activations'])
+            dense_layers = [(data[f'W{i}'], data[f'b{i}'], str(data['activations'][i])) for i in range(n_layers)]
+            encoder_arrays = {key: data[key] for key in data.files if key.startswith(('classes__', 'aliases__'))}
+            if encoder_arrays:
+                encoder = CategoricalEncoder.from_arrays(encoder_arrays)
+            else:
+                # Weights exported before the shared encoder artifact: LabelEncoder classes only
+                encoder = CategoricalEncoder({key[len('categories__'):]: data[key] for key in data.files
+                                              if key.startswith('categories__')}, synonyms=CATEGORY_SYNONYMS)
+            return cls(dense_layers, data['scaler_mean'], data['scaler_scale'], data['feature_names'],
+                       encoder, data['classes'])
+
+    def encode(self, column, value):
+        """Encoded index of a categorical value (case/whitespace-insensitive, aliases allowed), or None."""
+        return self.encoder.encode(column, value)
+
+    def predict_proba(self, features):
+        x = self.scaler.transform(np.atleast_2d(np.asarray(features, dtype=np.float32))).astype(np.float32)
+        for W, b, activation in self.dense_layers:
+            x = x @ W + b
+            if activation == 'relu':
+                np.maximum(x, 0, out=x)
+            elif activation == 'softmax':
+                x = np.exp(x - x.max(axis=1, keepdims=True))
+                x /= x.sum(axis=1, keepdims=True)
+        return x
+
+    def predict(self, features):
+        """Predict one or many raw feature rows."""
+        probabilities = self.predict_proba(features)
+        winners = probabilities.argmax(axis=1)
+        return ANNPrediction(self.class_names[winners], probabilities[np.arange(len(winners)), winners])
+
+
+# ==============================================================================
+# --- Lazy Model Registry ---
+# ==============================================================================
+
+class ModelRegistry:
+    """Holds a lazily loaded, versioned model and records how loading went, for readiness probes.
+
+    Nothing is loaded at import; the first get() (or an explicit load() from a pre-fork hook)
+    runs the loader. A failed load is retried on a later get() once retry_interval has passed.
+
+    reload() builds a replacement beside the current model, validates it and swaps the single
+    reference get() returns. Requests that already called get() keep using the old model until
+    they finish. With watch_interval > 0 a background thread reloads when watch_paths change.
+    """
+
+    def __init__(self, loader, name='model', retry_interval=30.0, validator=None, reload_validator=None,
+                 watch_paths=(), watch_interval=0):
+        self.loader = loader
+        self.name = name
+        self.retry_interval = retry_interval
+        # validator(model) raises if a freshly loaded model must not be served
+        self.validator = validator
+        # reload_validator(model) raises if a model must not replace the one serving; with nothing
+        # serving yet its failure is only logged, so a bad check cannot keep the service down
+        self.reload_validator = reload_validator
+        self.watch_paths = tuple(watch_paths)
+        self.watch_interval = watch_interval
+        self._lock = threading.Lock()
+        self._reload_lock = threading.Lock()
+        self.model = None
+        self.version = 0
+        self._current = (None, 0)  # (model, version) swapped as one tuple, see snapshot()
+        self.status = 'not_loaded'  # not_loaded -> loading -> ready | failed
+        self.error = None
+        self.load_seconds = None
+        self.loaded_at = None
+        self.attempts = 0
+        self.reloading = False
+        self.last_reload_error = None
+        self._last_attempt = None
+        self._files_seen = None
+        self._watcher_pid = None
+
+    def _files_signature(self):
+        """(path, mtime, size) of every watched artifact; changes when a retrain rewrites them."""
+        signature = []
+        for path in self.watch_paths:
+            try:
+                st = os.stat(path)
+                signature.append((path, st.st_mtime_ns, st.st_size))
+            except OSError:
+                signature.append((path, None, None))
+        return tuple(signature)
+
+    def _build(self):
+        """Run the loader and validator; returns the new model or raises."""
+        model = self.loader()
+        if model is None:
+            raise FileNotFoundError(f"No {self.name} artifacts found.")
+        if self.validator is not None:
+            self.validator(model)
+        if self.reload_validator is not None:
+            try:
+                self.reload_validator(model)
+            except Exception as e:
+                if self.model is not None:
+                    raise
+                print(f"Warning: {self.name} failed its reload check; serving it as nothing else is loaded: {e}")
+        return model
+
+    def _install(self, model, files_seen, start):
+        """Swap in a built model; callers hold self._lock so loads and reloads number versions in turn."""
+        version = self.version + 1
+        # A single reference assignment: concurrent get() calls see either the old or the new model
+        self._current = (model, version)
+        self.model = model
+        self.version = version
+        self.status, self.error = 'ready', None
+        self.loaded_at = datetime.now().isoformat(timespec='seconds')
+        self.load_seconds = time.perf_counter() - start
+        self._files_seen = files_seen
+
+    def _load_locked(self):
+        self.status = 'loading'
+        self.attempts += 1
+        self._last_attempt = time.monotonic()
+        files_seen = self._files_signature()
+        start = time.perf_counter()
+        try:
+            model = self._build()
+        except Exception as e:
+            print(f"Error loading {self.name}: {e}")
+            self.status, self.error = 'failed', str(e)
+            self.load_seconds = time.perf_counter() - start
+            self._files_seen = files_seen
+        else:
+            self._install(model, files_seen, start)
+        return self.model
+
+    def load(self):
+        """Load (or re-load) now, e.g. from a pre-fork hook so workers inherit the pages."""
+        with self._lock:
+            return self._load_locked()
+
+    def get(self):
+        """Return the current model, loading on first use; None while unavailable."""
+        if self.watch_interval and self._watcher_pid != os.getpid():
+            self._start_watcher()
+        model = self.model
+        if model is not None:
+            return model
+        with self._lock:
+            retry_due = self._last_attempt is None or time.monotonic() - self._last_attempt >= self.retry_interval
+            if self.model is None and retry_due:
+                self._load_locked()
+            return self.model
+
+    def snapshot(self):
+        """Return (model, version) as one consistent pair, loading on first use like get()."""
+        self.get()
+        return self._current
+
+    def is_ready(self):
+        return self.get() is not None
+
+    def reload(self, background=True):
+        """Load, validate and swap in a new model while the current one keeps serving.
+
+        Returns False if a reload is already running. A model that fails to load or validate
+        is discarded and the current one stays in place.
+        """
+        if not self._reload_lock.acquire(blocking=False):
+            return False
+        if background:
+            threading.Thread(target=self._reload_worker, name=f'{self.name}-reload', daemon=True).start()
+        else:
+            self._reload_worker()
+        return True
+
+    def _reload_worker(self):
+        self.reloading = True
+        try:
+            files_seen = self._files_signature()
+            start = time.perf_counter()
+            try:
+                model = self._build()
+            except Exception as e:
+                print(f"Reload of {self.name} rejected, keeping version {self.version}: {e}")
+                self.last_reload_error = str(e)
+                # Remember these files so the watcher does not retry the same broken artifacts
+                self._files_seen = files_seen
+                return
+            self.last_reload_error = None
+            with self._lock:
+                self._install(model, files_seen, start)
+                version = self.version
+            print(f"Reloaded {self.name}: now serving version {version}.")
+        finally:
+            self.reloading = False
+            self._reload_lock.release()
+
+    def _start_watcher(self):
+        # Threads do not survive fork(), so each worker process starts its own watcher
+        with self._lock:
+            if self._watcher_pid == os.getpid():
+                return
+            self._watcher_pid = os.getpid()
+        threading.Thread(target=self._watch, name=f'{self.name}-watcher', daemon=True).start()
+
+    def _watch(self):
+        while True:
+            time.sleep(self.watch_interval)
+            if self._files_seen is not None and self._files_signature() != self._files_seen:
+                self.reload(background=False)
+
+    def state(self):
+        """JSON-ready load state for /healthz and /readyz."""
+        return {
+            'name': self.name,
+            'status': self.status,
+            'version': self.version,
+            'error': self.error,
+            'attempts': self.attempts,
+            'load_time_ms': None if self.load_seconds is None else round(self.load_seconds * 1000, 2),
+            'loaded_at': self.loaded_at,
+            'reloading': self.reloading,
+            'last_reload_error': self.last_reload_error,
+        }
@@ -2,12 +2,17 @@ import pandas as pd
 import numpy as np
 import pickle
 import os
-from sklearn.model_selection import train_test_split
+import json
+import time
+import shutil
+import hashlib
+import tensorflow as tf
 from sklearn.preprocessing import LabelEncoder, StandardScaler
 from tensorflow.keras.models import Sequential
 from tensorflow.keras.layers import Dense, Dropout, BatchNormalization
 from tensorflow.keras.callbacks import EarlyStopping
 from tensorflow.keras.utils import to_categorical
+from ml_engine import CategoricalEncoder, CATEGORY_SYNONYMS
 
 # --- Configuration ---
 DATA_FILE = 'synthetic_crop_data_all_crops.csv'
@@ -15,8 +20,158 @@ OUTPUT_DIR = 'output_models'
 MODEL_PATH = os.path.join(OUTPUT_DIR, "model.h5")
 ENCODERS_PATH = os.path.join(OUTPUT_DIR, "encoders.pkl")
 SCALER_PATH = os.path.join(OUTPUT_DIR, "scaler.pkl")
+# Crop/Region/Month code tables, shared with the app through export_ann_weights.py
+CATEGORY_ENCODER_PATH = os.path.join(OUTPUT_DIR, "category_encoder.npz")
+# Cleaned, encoded & scaled dataset, one entry per CSV content hash (see dataset_cache_key)
+DATASET_CACHE_DIR = os.environ.get('TRAIN_CACHE_DIR', os.path.join(OUTPUT_DIR, 'dataset_cache'))
+# Bump when the cleaning/encoding/scaling steps change so old cache entries stop matching
+PREPROCESS_VERSION = 1
 
-# ========== STEP 1: Load & Clean Dataset ==========
+# The CSV is streamed in chunks of CHUNK_SIZE rows, so memory stays bounded however large it is
+CHUNK_SIZE = int(os.environ.get('TRAIN_CHUNK_SIZE', '200000'))
+SHUFFLE_BUFFER = int(os.environ.get('TRAIN_SHUFFLE_BUFFER', '100000'))
+BATCH_SIZE = 32
+VALIDATION_SPLIT = 0.2
+RANDOM_STATE = 42
+
+CATEGORICAL_COLUMNS = ['Crop', 'Region', 'Month']
+NUMERIC_COLUMNS = ['N', 'P', 'K', 'Temperature(C)', 'Humidity(%)', 'Soil_pH', 'Moisture(%)']
+TARGET_COLUMN = 'Fertilizer'
+# Model input order (the CSV's column order without the target)
+FEATURE_COLUMNS = CATEGORICAL_COLUMNS + NUMERIC_COLUMNS
+required_columns = NUMERIC_COLUMNS + CATEGORICAL_COLUMNS + [TARGET_COLUMN]
+# Few distinct names per text column: 'category' stores each once plus small integer codes per row
+CSV_DTYPES = {**{col: 'category' for col in CATEGORICAL_COLUMNS + [TARGET_COLUMN]},
+              **{col: 'float32' for col in NUMERIC_COLUMNS}}
+
+
+def read_chunks(path, chunk_size=CHUNK_SIZE):
+    """Stream the dataset as cleaned DataFrame chunks with compact dtypes."""
+    for chunk in pd.read_csv(path, chunksize=chunk_size, usecols=required_columns, dtype=CSV_DTYPES):
+        chunk = chunk.dropna()
+        for cat_col in CATEGORICAL_COLUMNS + [TARGET_COLUMN]:
+            # Clean whitespace & casing once per distinct name instead of once per row
+            names = chunk[cat_col].cat.categories
+            chunk[cat_col] = chunk[cat_col].map(dict(zip(names, names.astype(str).str.strip().str.lower())))
+            chunk[cat_col] = chunk[cat_col].astype('category')
+        yield chunk
+
+
+def encode_categories(series, encode):
+    """Encode a categorical column by encoding its distinct names and indexing with the row codes."""
+    return encode(list(series.cat.categories))[series.cat.codes.to_numpy()]
+
+
+def validation_mask(chunk_index, n_rows):
+    """Rows of a chunk held out for validation; seeded per chunk so every epoch sees the same split."""
+    rng = np.random.default_rng([RANDOM_STATE, chunk_index])
+    return rng.random(n_rows) < VALIDATION_SPLIT
+
+
+def encode_chunk(chunk):
+    """Feature frame (categoricals as codes) and integer targets for one cleaned chunk."""
+    X = pd.DataFrame({col: encode_categories(chunk[col], lambda names: category_encoder.transform(col, names))
+                      for col in CATEGORICAL_COLUMNS}, index=chunk.index)
+    for col in NUMERIC_COLUMNS:
+        X[col] = chunk[col]
+    y = encode_categories(chunk[TARGET_COLUMN], fertilizer_encoder.transform)
+    return X[FEATURE_COLUMNS], y
+
+
+def file_digest(path, block_size=1 << 20):
+    """SHA-256 of a file's contents, read in blocks."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def dataset_cache_key(path):
+    """Cache entry name: the CSV's content hash plus every setting that changes the preprocessed arrays."""
+    params = json.dumps({'csv': file_digest(path), 'version': PREPROCESS_VERSION, 'features': FEATURE_COLUMNS,
+                         'chunk_size': CHUNK_SIZE, 'validation_split': VALIDATION_SPLIT,
+                         'random_state': RANDOM_STATE}, sort_keys=True)
+    return hashlib.sha256(params.encode()).hexdigest()[:16]
+
+
+def build_dataset_cache(cache_path, n_rows):
+    """Third pass over the CSV: write scaled features, targets and the validation mask as .npy columns."""
+    tmp_path = cache_path + '.tmp'
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+    features = np.lib.format.open_memmap(os.path.join(tmp_path, 'features.npy'), mode='w+',
+                                         dtype=np.float32, shape=(n_rows, len(FEATURE_COLUMNS)))
+    targets = np.lib.format.open_memmap(os.path.join(tmp_path, 'targets.npy'), mode='w+',
+                                        dtype=np.int32, shape=(n_rows,))
+    validation = np.lib.format.open_memmap(os.path.join(tmp_path, 'validation.npy'), mode='w+',
+                                           dtype=bool, shape=(n_rows,))
+    offset = 0
+    for i, chunk in enumerate(read_chunks(DATA_FILE)):
+        X, y = encode_chunk(chunk)
+        end = offset + len(X)
+        features[offset:end] = scaler.transform(X)
+        targets[offset:end] = y
+        validation[offset:end] = validation_mask(i, len(X))
+        offset = end
+    for array in (features, targets, validation):
+        array.flush()
+    del features, targets, validation
+
+    np.savez(os.path.join(tmp_path, 'meta.npz'),
+             fertilizer_classes=np.array(fertilizer_encoder.classes_, dtype=str),
+             scaler_mean=scaler.mean_, scaler_scale=scaler.scale_, scaler_var=scaler.var_,
+             scaler_n_samples_seen=np.asarray(scaler.n_samples_seen_),
+             feature_names=np.array(FEATURE_COLUMNS), **category_encoder.to_arrays())
+    # Rename into place last: a run interrupted mid-build leaves only the .tmp directory behind
+    os.replace(tmp_path, cache_path)
+
+
+def load_preprocessing(cache_path):
+    """Rebuild the category encoder, fertilizer encoder and fitted scaler stored with a cache entry."""
+    with np.load(os.path.join(cache_path, 'meta.npz')) as meta:
+        cached_encoder = CategoricalEncoder.from_arrays(meta)
+        cached_fertilizer_encoder = LabelEncoder()
+        cached_fertilizer_encoder.classes_ = meta['fertilizer_classes']
+        cached_scaler = StandardScaler()
+        cached_scaler.mean_, cached_scaler.scale_, cached_scaler.var_ = (
+            meta['scaler_mean'], meta['scaler_scale'], meta['scaler_var'])
+        cached_scaler.n_samples_seen_ = meta['scaler_n_samples_seen'][()]
+        cached_scaler.feature_names_in_ = meta['feature_names'].astype(object)
+        cached_scaler.n_features_in_ = len(cached_scaler.feature_names_in_)
+    return cached_encoder, cached_fertilizer_encoder, cached_scaler
+
+
+def open_dataset_cache(cache_path):
+    """Memory-map the cached features, targets and validation mask (nothing is read until sliced)."""
+    return tuple(np.load(os.path.join(cache_path, name + '.npy'), mmap_mode='r')
+                 for name in ('features', 'targets', 'validation'))
+
+
+def scaled_batches(split):
+    """Yield (scaled features, one-hot targets) of the 'train' or 'val' rows, CHUNK_SIZE cached rows at a time."""
+    for start in range(0, len(features), CHUNK_SIZE):
+        mask = np.asarray(validation[start:start + CHUNK_SIZE])
+        if split == 'train':
+            mask = ~mask
+        if mask.any():
+            yield (np.asarray(features[start:start + CHUNK_SIZE])[mask],
+                   to_categorical(targets[start:start + CHUNK_SIZE][mask], num_classes=n_classes).astype(np.float32))
+
+
+def make_dataset(split):
+    """tf.data pipeline over scaled_batches(); streams the memory-mapped cache each epoch."""
+    dataset = tf.data.Dataset.from_generator(
+        lambda: scaled_batches(split),
+        output_signature=(tf.TensorSpec((None, len(FEATURE_COLUMNS)), tf.float32),
+                          tf.TensorSpec((None, n_classes), tf.float32))
+    ).unbatch()
+    if split == 'train':
+        dataset = dataset.shuffle(SHUFFLE_BUFFER, seed=RANDOM_STATE)
+    return dataset.batch(BATCH_SIZE).prefetch(tf.data.AUTOTUNE)
+
+
+# ========== STEP 1: Load Cached or Scan & Clean Dataset ==========
 
 # Use a relative path, assuming the CSV is in the same directory as this script.
 print(f"Attempting to load data from: {os.path.abspath(DATA_FILE)}")
@@ -26,62 +181,68 @@ if not os.path.exists(DATA_FILE):
     print(f"Please place it in the same directory as this script, or update the 'DATA_FILE' variable.")
     exit()
 
-try:
-    df_crop_recommendation = pd.read_csv(DATA_FILE)
-except Exception as e:
-    print(f"\nFATAL ERROR: Failed to read CSV file. Error: {e}")
-    exit()
-
-# Verify and clean columns
-required_columns = [
-    'N', 'P', 'K', 'Temperature(C)', 'Humidity(%)', 'Soil_pH', 'Moisture(%)',
-    'Crop', 'Region', 'Month', 'Fertilizer'
-]
-
+# Verify columns from the header before streaming the whole file
+available_columns = pd.read_csv(DATA_FILE, nrows=0).columns.tolist()
 for col in required_columns:
-    if col not in df_crop_recommendation.columns:
+    if col not in available_columns:
         print(f"\nFATAL ERROR: Missing column in dataset: {col}.")
-        print(f"Available columns are: {df_crop_recommendation.columns.tolist()}")
+        print(f"Available columns are: {available_columns}")
         exit()
 
-# Clean whitespace & casing
-for cat_col in ['Crop', 'Region', 'Month', 'Fertilizer']:
-    df_crop_recommendation[cat_col] = df_crop_recommendation[cat_col].astype(str).str.strip().str.lower()
-print("✅ Data loaded and cleaned.")
-
-
-# ========== STEP 2: Encode Categorical Features ==========
-label_encoders = {}
-dropdowns = {}
+start = time.perf_counter()
+cache_path = os.path.join(DATASET_CACHE_DIR, dataset_cache_key(DATA_FILE))
+if os.path.exists(cache_path):
+    category_encoder, fertilizer_encoder, scaler = load_preprocessing(cache_path)
+    print(f"✅ Loaded preprocessed dataset from cache '{cache_path}'.")
+else:
+    # First pass: collect the distinct names of every text column and count rows
+    distinct_names = {col: set() for col in CATEGORICAL_COLUMNS + [TARGET_COLUMN]}
+    n_rows = 0
+    try:
+        for chunk in read_chunks(DATA_FILE):
+            n_rows += len(chunk)
+            for col, names in distinct_names.items():
+                names.update(chunk[col].cat.categories)
+    except Exception as e:
+        print(f"\nFATAL ERROR: Failed to read CSV file. Error: {e}")
+        exit()
+    print(f"✅ Data scanned and cleaned: {n_rows} rows in chunks of {CHUNK_SIZE}.")
 
-# Encode input features
-for col in ['Crop', 'Region', 'Month']:
-    le = LabelEncoder()
-    df_crop_recommendation[col] = le.fit_transform(df_crop_recommendation[col])
-    label_encoders[col] = le
-    dropdowns[col] = sorted(le.classes_)
+    # ========== STEP 2: Encode Categorical Features ==========
+    # Same codes as a LabelEncoder per column (sorted classes), plus the aliases the app accepts
+    category_encoder = CategoricalEncoder.fit(
+        {col: distinct_names[col] for col in CATEGORICAL_COLUMNS}, synonyms=CATEGORY_SYNONYMS)
 
-# Encode the target feature (Fertilizer)
-fertilizer_encoder = LabelEncoder()
-df_crop_recommendation['Fertilizer'] = fertilizer_encoder.fit_transform(df_crop_recommendation['Fertilizer'])
+    # Encode the target feature (Fertilizer)
+    fertilizer_encoder = LabelEncoder()
+    fertilizer_encoder.fit(sorted(distinct_names[TARGET_COLUMN]))
 
-# ========== STEP 3: Feature Scaling and One-Hot Encoding ==========
-X = df_crop_recommendation.drop('Fertilizer', axis=1)
-y = df_crop_recommendation['Fertilizer']
+    # ========== STEP 3: Feature Scaling (incremental) ==========
+    # Second pass: the scaler accumulates mean/variance chunk by chunk
+    scaler = StandardScaler()
+    for chunk in read_chunks(DATA_FILE):
+        X_chunk, _ = encode_chunk(chunk)
+        scaler.partial_fit(X_chunk)
+    print("✅ Features scaled and target encoded.")
 
-scaler = StandardScaler()
-X_scaled = scaler.fit_transform(X)
+    # Third pass: store the result so later runs on the same CSV skip parsing entirely
+    os.makedirs(DATASET_CACHE_DIR, exist_ok=True)
+    build_dataset_cache(cache_path, n_rows)
+    print(f"✅ Cached preprocessed dataset to '{cache_path}'.")
 
-y_encoded = to_categorical(y)
-print("✅ Features scaled and target encoded.")
+features, targets, validation = open_dataset_cache(cache_path)
+dropdowns = {col: list(category_encoder.classes[col]) for col in CATEGORICAL_COLUMNS}
+n_classes = len(fertilizer_encoder.classes_)
+print(f"   {len(features)} rows ready in {(time.perf_counter() - start) * 1000:.1f} ms.")
 
 
-# ========== STEP 4: Split Dataset for Validation ==========
-X_train, X_val, y_train, y_val = train_test_split(X_scaled, y_encoded, test_size=0.2, random_state=42)
+# ========== STEP 4: Streaming Train/Validation Pipelines ==========
+train_dataset = make_dataset('train')
+val_dataset = make_dataset('val')
 
 # ========== STEP 5: Define ANN Model ==========
 model = Sequential([
-    Dense(128, input_dim=X.shape[1], activation='relu'),
+    Dense(128, input_dim=len(FEATURE_COLUMNS), activation='relu'),
     BatchNormalization(),
     Dropout(0.4),
 
@@ -92,7 +253,7 @@ model = Sequential([
     Dense(128, activation='relu'),
     Dropout(0.3),
 
-    Dense(y_encoded.shape[1], activation='softmax')
+    Dense(n_classes, activation='softmax')
 ])
 
 model.compile(optimizer='adam', loss='categorical_crossentropy', metrics=['accuracy'])
@@ -103,10 +264,9 @@ early_stop = EarlyStopping(monitor='val_loss', patience=10, restore_best_weights
 
 print("\n--- Starting Model Training ---")
 history = model.fit(
-    X_train, y_train,
-    validation_data=(X_val, y_val),
+    train_dataset,
+    validation_data=val_dataset,
     epochs=100,
-    batch_size=32,
     callbacks=[early_stop],
     verbose=1
 )
@@ -122,9 +282,9 @@ try:
     model.save(MODEL_PATH)
 
     # 2. Save the Encoders and Dropdown values
+    category_encoder.save(CATEGORY_ENCODER_PATH)
     with open(ENCODERS_PATH, "wb") as f:
         pickle.dump({
-            "label_encoders": label_encoders,
             "fertilizer_encoder": fertilizer_encoder,
             "dropdowns": dropdowns
         }, f)
@@ -136,6 +296,7 @@ try:
     print(f"\n SUCCESS: All files saved to the '{OUTPUT_DIR}' directory.")
     print(f"   - Model: {MODEL_PATH}")
     print(f"   - Encoders: {ENCODERS_PATH}")
+    print(f"   - Category encoder: {CATEGORY_ENCODER_PATH}")
     print(f"   - Scaler: {SCALER_PATH}")
 
 except Exception as e:
@@ -0,0 +1,246 @@
+import os
+import csv
+import time
+import pickle
+import argparse
+import warnings
+import itertools
+import numpy as np
+import pandas as pd
+from joblib import Parallel, delayed
+from sklearn.model_selection import StratifiedKFold, train_test_split
+from sklearn.neighbors import KNeighborsClassifier
+from sklearn.preprocessing import StandardScaler
+from ml_engine import KNNInferenceEngine, CategoricalEncoder, KNN_FEATURE_COLUMNS, CATEGORY_SYNONYMS, \
+    build_knn_indexes, load_knn_index
+
+# --- Configuration ---
+DATA_FILE = 'synthetic_crop_data_all_crops.csv'
+# Outputs are the files agri_dash.py loads and watches
+MODEL_PATH = "knn_model.pkl"
+SCALER_PATH = "scaler.pkl"
+# Categorical code tables shared with the app: reused when present so codes stay stable across retrains
+ENCODER_PATH = "knn_encoder.npz"
+HOLDOUT_PATH = "knn_holdout.npz"
+# Rebuilt for the selected model, so /predict's default 'exact' search runs the tree the sweep timed
+INDEX_PATH = "knn_index.pkl"
+REPORT_PATH = os.path.join('output_models', 'knn_sweep.csv')
+
+CATEGORICAL_COLUMNS = ['Crop', 'Region', 'Month']
+TARGET_COLUMN = 'Fertilizer'
+HOLDOUT_SIZE = 0.2
+CV_FOLDS = 5
+N_LATENCY_QUERIES = 500
+RANDOM_STATE = 42
+# Pareto points within this much of the best accuracy count as ties, broken by p99 latency then size
+ACCURACY_TOLERANCE = 0.005
+# Same setting the app gates reloads with, so the script never writes a model the app would reject
+MIN_HOLDOUT_ACCURACY = float(os.environ.get('ML_MIN_HOLDOUT_ACCURACY', '0.5'))
+
+PARAM_GRID = {
+    'n_neighbors': [1, 3, 5, 7, 9, 15, 25],
+    'metric': ['euclidean', 'manhattan'],
+    'weights': ['uniform', 'distance'],
+    # Tree kind of the serving index (knn_index.pkl), also used for the classifier's own search
+    'algorithm': ['kd_tree', 'ball_tree'],
+}
+
+
+def load_dataset(path, encoder=None):
+    """Cleaned feature rows (KNN_FEATURE_COLUMNS order), lowercase fertilizer labels and the encoder used.
+
+    The encoder is fitted on the CSV's names when none is given."""
+    numeric_columns = [col for col in KNN_FEATURE_COLUMNS if col not in CATEGORICAL_COLUMNS]
+    dtypes = {**{col: 'category' for col in CATEGORICAL_COLUMNS + [TARGET_COLUMN]},
+              **{col: 'float32' for col in numeric_columns}}
+    df = pd.read_csv(path, usecols=KNN_FEATURE_COLUMNS + [TARGET_COLUMN], dtype=dtypes).dropna()
+    if encoder is None:
+        encoder = CategoricalEncoder.fit({col: df[col].cat.categories for col in CATEGORICAL_COLUMNS},
+                                         synonyms=CATEGORY_SYNONYMS)
+
+    features = pd.DataFrame(index=df.index)
+    for col in CATEGORICAL_COLUMNS:
+        # Encode each distinct name once, then index with the per-row category codes
+        codes = encoder.transform(col, list(df[col].cat.categories))
+        features[col] = codes[df[col].cat.codes.to_numpy()]
+    for col in numeric_columns:
+        features[col] = df[col]
+    # Fixed-width str, not object, so knn_holdout.npz loads without pickle
+    labels = df[TARGET_COLUMN].astype(str).str.strip().str.lower().to_numpy(dtype=str)
+
+    # Rows naming a crop/region/month the encoder cannot encode could never be queried
+    known = (features[CATEGORICAL_COLUMNS] >= 0).all(axis=1).to_numpy()
+    if not known.all():
+        print(f"⚠️  Skipped {int((~known).sum())} rows with categories the encoder does not know.")
+    return features[KNN_FEATURE_COLUMNS].to_numpy(dtype=np.float64)[known], labels[known], encoder
+
+
+def param_combinations(grid):
+    return [dict(zip(grid, values)) for values in itertools.product(*grid.values())]
+
+
+def fit_knn(params, X, y):
+    """Scaler and KNN fitted on raw feature rows, as agri_dash.py loads them."""
+    scaler = StandardScaler().fit(X)
+    knn_model = KNeighborsClassifier(n_jobs=1, **params).fit(scaler.transform(X), y)
+    return knn_model, scaler
+
+
+def fold_accuracy(params, X, y, train_idx, test_idx):
+    """Accuracy of one configuration on one cross-validation fold (runs in a worker process)."""
+    knn_model, scaler = fit_knn(params, X[train_idx], y[train_idx])
+    return float(np.mean(knn_model.predict(scaler.transform(X[test_idx])) == y[test_idx]))
+
+
+def query_latency(knn_model, scaler, queries):
+    """Per-query latency (microseconds) of single-row predictions through the engine and exact index /predict uses."""
+    index = build_knn_indexes(knn_model, kind=knn_model.algorithm)['exact']
+    engine = KNNInferenceEngine(knn_model, scaler, index=index)
+    timings = []
+    for row in queries:
+        start = time.perf_counter()
+        engine.predict(row.reshape(1, -1))
+        timings.append((time.perf_counter() - start) * 1e6)
+    return np.array(timings)
+
+
+def pareto_front(results):
+    """Indices of results not dominated on (higher accuracy, lower p99 latency, smaller size)."""
+    def dominates(a, b):
+        no_worse = (a['accuracy'] >= b['accuracy'] and a['p99_us'] <= b['p99_us'] and
+                    a['size_bytes'] <= b['size_bytes'])
+        better = (a['accuracy'] > b['accuracy'] or a['p99_us'] < b['p99_us'] or
+                  a['size_bytes'] < b['size_bytes'])
+        return no_worse and better
+    return [i for i, r in enumerate(results) if not any(dominates(other, r) for other in results)]
+
+
+def pick_best(results, front, tolerance):
+    """The fastest (then smallest) Pareto point whose accuracy is within tolerance of the best."""
+    best_accuracy = max(results[i]['accuracy'] for i in front)
+    candidates = [i for i in front if results[i]['accuracy'] >= best_accuracy - tolerance]
+    return min(candidates, key=lambda i: (results[i]['p99_us'], results[i]['size_bytes']))
+
+
+def dump_atomic(obj, path):
+    """Pickle beside and rename into place, so the app's file watcher never loads a half-written file."""
+    with open(path + '.tmp', 'wb') as f:
+        pickle.dump(obj, f)
+    os.replace(path + '.tmp', path)
+
+
+def check_outputs(args, expected_accuracy):
+    """Load the written files the way agri_dash.py does and re-score the held-out rows."""
+    with open(args.model, 'rb') as f:
+        knn_model = pickle.load(f)
+    with open(args.scaler, 'rb') as f:
+        scaler = pickle.load(f)
+    index = load_knn_index(args.index, knn_model, 'exact')
+    if index is None:
+        raise ValueError(f"{args.index} does not load for {args.model}.")
+    engine = KNNInferenceEngine(knn_model, scaler, index=index, encoder=CategoricalEncoder.load(args.encoder))
+    missing = [col for col in CATEGORICAL_COLUMNS if col not in engine.encoder.classes]
+    if missing:
+        raise ValueError(f"{args.encoder} has no code table for {', '.join(missing)}.")
+    with np.load(args.holdout, allow_pickle=False) as holdout:
+        accuracy = float(np.mean(engine.predict(holdout['X']).labels == holdout['y']))
+    if abs(accuracy - expected_accuracy) > 1e-9:
+        raise ValueError(f"Reloaded model scores {accuracy:.4f} on {args.holdout}, expected {expected_accuracy:.4f}.")
+
+
+def write_report(results, front, best, path):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    fields = list(PARAM_GRID) + ['accuracy', 'accuracy_std', 'p50_us', 'p99_us', 'size_bytes', 'pareto', 'selected']
+    with open(path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=fields)
+        writer.writeheader()
+        for i, r in enumerate(results):
+            writer.writerow({**r, 'pareto': i in front, 'selected': i == best})
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Cross-validated KNN hyperparameter sweep; writes the Pareto-best model.")
+    parser.add_argument('--data', default=DATA_FILE)
+    parser.add_argument('--model', default=MODEL_PATH)
+    parser.add_argument('--scaler', default=SCALER_PATH)
+    parser.add_argument('--encoder', default=ENCODER_PATH)
+    parser.add_argument('--holdout', default=HOLDOUT_PATH)
+    parser.add_argument('--index', default=INDEX_PATH)
+    parser.add_argument('--report', default=REPORT_PATH)
+    parser.add_argument('--folds', type=int, default=CV_FOLDS)
+    parser.add_argument('--jobs', type=int, default=-1, help="Worker processes for cross-validation (-1: all cores).")
+    parser.add_argument('--latency-queries', type=int, default=N_LATENCY_QUERIES)
+    parser.add_argument('--tolerance', type=float, default=ACCURACY_TOLERANCE)
+    parser.add_argument('--min-accuracy', type=float, default=MIN_HOLDOUT_ACCURACY,
+                        help="Refuse to write a model below this held-out accuracy (default: $ML_MIN_HOLDOUT_ACCURACY or 0.5).")
+    args = parser.parse_args()
+
+    warnings.filterwarnings("ignore", category=UserWarning)
+    if not os.path.exists(args.data):
+        print(f"\nFATAL ERROR: The data file '{args.data}' was not found.")
+        exit(1)
+    encoder = CategoricalEncoder.load(args.encoder) if os.path.exists(args.encoder) else None
+    X, y, encoder = load_dataset(args.data, encoder)
+    X_train, X_holdout, y_train, y_holdout = train_test_split(
+        X, y, test_size=HOLDOUT_SIZE, stratify=y, random_state=RANDOM_STATE)
+    print(f"✅ Loaded {len(X)} rows, {len(np.unique(y))} fertilizers; "
+          f"{len(X_train)} for the sweep, {len(X_holdout)} held out.")
+
+    # Accuracy: every (configuration, fold) pair is an independent task for the process pool
+    configs = param_combinations(PARAM_GRID)
+    folds = list(StratifiedKFold(n_splits=args.folds, shuffle=True, random_state=RANDOM_STATE).split(X_train, y_train))
+    start = time.perf_counter()
+    scores = Parallel(n_jobs=args.jobs)(
+        delayed(fold_accuracy)(params, X_train, y_train, train_idx, test_idx)
+        for params in configs for train_idx, test_idx in folds)
+    scores = np.array(scores).reshape(len(configs), len(folds))
+    print(f"✅ Cross-validated {len(configs)} configurations x {len(folds)} folds "
+          f"in {time.perf_counter() - start:.1f}s.")
+
+    # Latency and size: measured one configuration at a time so workers don't skew the timings
+    rng = np.random.default_rng(RANDOM_STATE)
+    queries = X_holdout[rng.integers(0, len(X_holdout), args.latency_queries)]
+    results = []
+    for params, fold_scores in zip(configs, scores):
+        knn_model, scaler = fit_knn(params, X_train, y_train)
+        timings = query_latency(knn_model, scaler, queries)
+        results.append({**params, 'accuracy': round(float(fold_scores.mean()), 4),
+                        'accuracy_std': round(float(fold_scores.std()), 4),
+                        'p50_us': round(float(np.percentile(timings, 50)), 1),
+                        'p99_us': round(float(np.percentile(timings, 99)), 1),
+                        'size_bytes': len(pickle.dumps(knn_model))})
+
+    front = pareto_front(results)
+    best = pick_best(results, front, args.tolerance)
+    print(f"\n{'k':>4} {'metric':<10}{'weights':<10}{'algorithm':<11}{'accuracy':>9}"
+          f"{'p50 (us)':>10}{'p99 (us)':>10}{'size (KB)':>11}")
+    for i in sorted(front, key=lambda i: -results[i]['accuracy']):
+        r = results[i]
+        print(f"{r['n_neighbors']:>4} {r['metric']:<10}{r['weights']:<10}{r['algorithm']:<11}{r['accuracy']:>9.4f}"
+              f"{r['p50_us']:>10.1f}{r['p99_us']:>10.1f}{r['size_bytes'] / 1024:>11.1f}"
+              f"{'  <- selected' if i == best else ''}")
+    write_report(results, front, best, args.report)
+    print(f"\n✅ Pareto front: {len(front)} of {len(results)} configurations; full table in {args.report}.")
+
+    # Refit the selected configuration on the whole sweep split and check it on the held-out rows
+    params = {name: results[best][name] for name in PARAM_GRID}
+    knn_model, scaler = fit_knn(params, X_train, y_train)
+    holdout_accuracy = float(np.mean(knn_model.predict(scaler.transform(X_holdout)) == y_holdout))
+    print(f"✅ Selected {params}: held-out accuracy {holdout_accuracy:.4f}.")
+    if holdout_accuracy < args.min_accuracy:
+        print(f"\nFATAL ERROR: Held-out accuracy {holdout_accuracy:.4f} is below {args.min_accuracy}; "
+              f"the app would reject this model on reload. Nothing was written.")
+        exit(1)
+
+    # Raw held-out rows the app scores a reloaded model on before swapping it in; written first,
+    # so a reload triggered by the files below already checks against this run's sample
+    np.savez(args.holdout + '.tmp.npz', X=X_holdout, y=y_holdout)
+    os.replace(args.holdout + '.tmp.npz', args.holdout)
+    encoder.save(args.encoder)
+    dump_atomic(scaler, args.scaler)
+    dump_atomic(knn_model, args.model)
+    dump_atomic(build_knn_indexes(knn_model, kind=params['algorithm']), args.index)
+    check_outputs(args, holdout_accuracy)
+    print(f"✅ Saved {args.model}, {args.scaler}, {args.encoder}, {args.index} ({params['algorithm']}) "
+          f"and {args.holdout}.")
+    print("   Re-run export_model_artifacts.py to refresh the memory-mapped artifacts.")
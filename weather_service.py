@@ -0,0 +1,420 @@
+import os
+import abc
+import re
+import csv
+import json
+import time
+import argparse
+import threading
+import urllib.parse
+import urllib.request
+from collections import OrderedDict, namedtuple
+from concurrent.futures import Future, ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import numpy as np
+from sklearn.neighbors import BallTree
+
+# ==============================================================================
+# --- Weather Providers ---
+# ==============================================================================
+
+# Built-in readings, served by StaticWeatherProvider and the stub server
+STATIC_WEATHER = {
+    'Delhi': {'temperature': 28, 'description': 'Sunny with haze', 'humidity': 65, 'icon': '☀️', 'wind': '5 km/h'},
+    'Pune': {'temperature': 24, 'description': 'Partly Cloudy', 'humidity': 70, 'icon': '⛅', 'wind': '10 km/h'},
+    'Shimla': {'temperature': 15, 'description': 'Cloudy, chance of rain', 'humidity': 60, 'icon': '☁️',
+               'wind': '8 km/h'},
+    'Bangalore': {'temperature': 26, 'description': 'Clear skies', 'humidity': 68, 'icon': '☀️', 'wind': '7 km/h'},
+    'Mumbai': {'temperature': 30, 'description': 'Humid and Overcast', 'humidity': 80, 'icon': '🌧️', 'wind': '12 km/h'},
+    'Hyderabad': {'temperature': 27, 'description': 'Light Rain', 'humidity': 75, 'icon': '🌧️', 'wind': '8 km/h'},
+    'Chennai': {'temperature': 32, 'description': 'Hot and Humid', 'humidity': 78, 'icon': '☀️', 'wind': '14 km/h'},
+    'Kolkata': {'temperature': 31, 'description': 'Humid with showers', 'humidity': 82, 'icon': '🌧️', 'wind': '9 km/h'},
+    'Jaipur': {'temperature': 33, 'description': 'Sunny and Dry', 'humidity': 35, 'icon': '☀️', 'wind': '11 km/h'},
+    'Lucknow': {'temperature': 30, 'description': 'Sunny with haze', 'humidity': 58, 'icon': '☀️', 'wind': '6 km/h'},
+    'Ahmedabad': {'temperature': 34, 'description': 'Clear and Hot', 'humidity': 45, 'icon': '☀️', 'wind': '10 km/h'},
+    'Bhopal': {'temperature': 29, 'description': 'Partly Cloudy', 'humidity': 55, 'icon': '⛅', 'wind': '8 km/h'},
+    'Indore': {'temperature': 28, 'description': 'Partly Cloudy', 'humidity': 52, 'icon': '⛅', 'wind': '9 km/h'},
+    'Patna': {'temperature': 31, 'description': 'Humid and Overcast', 'humidity': 72, 'icon': '☁️', 'wind': '7 km/h'},
+    'Guwahati': {'temperature': 27, 'description': 'Thundershowers', 'humidity': 85, 'icon': '⛈️', 'wind': '6 km/h'},
+    'Chandigarh': {'temperature': 27, 'description': 'Clear skies', 'humidity': 55, 'icon': '☀️', 'wind': '7 km/h'},
+    'Bhubaneswar': {'temperature': 31, 'description': 'Light Rain', 'humidity': 80, 'icon': '🌧️', 'wind': '12 km/h'},
+    'Nagpur': {'temperature': 33, 'description': 'Sunny', 'humidity': 48, 'icon': '☀️', 'wind': '8 km/h'},
+    'Raipur': {'temperature': 31, 'description': 'Partly Cloudy', 'humidity': 62, 'icon': '⛅', 'wind': '7 km/h'},
+    'Kochi': {'temperature': 29, 'description': 'Monsoon showers', 'humidity': 86, 'icon': '🌧️', 'wind': '15 km/h'},
+    'Coimbatore': {'temperature': 27, 'description': 'Breezy and Clear', 'humidity': 64, 'icon': '☀️', 'wind': '18 km/h'},
+    'Srinagar': {'temperature': 16, 'description': 'Cool and Clear', 'humidity': 50, 'icon': '☀️', 'wind': '5 km/h'}
+}
+STATIC_FORECAST = [
+    {'day': 'Tomorrow', 'condition': 'Sunny', 'high': 29, 'low': 20, 'icon': '☀️'},
+    {'day': 'Day 3', 'condition': 'Partly Cloudy', 'high': 27, 'low': 18, 'icon': '⛅'},
+    {'day': 'Day 4', 'condition': 'Light Rain', 'high': 25, 'low': 17, 'icon': '🌧️'},
+]
+
+
+def normalize_location(location):
+    """Cache/lookup key of a free-text location: stripped and lowercased."""
+    return '' if location is None else str(location).strip().lower()
+
+
+class WeatherProviderError(Exception):
+    """A provider could not return weather for a location (unknown city, timeout, bad response)."""
+
+
+class WeatherProvider(abc.ABC):
+    """Interface for weather sources: fetch(location) returns the dict the weather templates render.
+
+    Keys: city, temperature (°C), description, humidity (%), icon, wind and forecast, a list of
+    {day, condition, high, low, icon}. Failures raise WeatherProviderError. Results are shared
+    by every request that reads them from the cache, so callers must not modify them.
+    """
+
+    name = 'base'
+
+    @abc.abstractmethod
+    def fetch(self, location):
+        """Current reading and forecast for a location; raises WeatherProviderError on failure."""
+
+
+class StaticWeatherProvider(WeatherProvider):
+    """Fixed readings per city; any other location gets the default city's reading."""
+
+    name = 'static'
+
+    def __init__(self, table, default_city='Delhi', forecast=STATIC_FORECAST):
+        # Built once; fetch() hands out copies, so a caller changing its result cannot alter the table
+        self.readings = {normalize_location(city): {**reading, 'city': city, 'forecast': [dict(day) for day in forecast]}
+                         for city, reading in table.items()}
+        self.default = self.readings[normalize_location(default_city)]
+
+    def lookup(self, location):
+        """The reading for exactly this city, or None."""
+        return self.readings.get(normalize_location(location))
+
+    def fetch(self, location):
+        reading = self.lookup(location) or self.default
+        return {**reading, 'forecast': [dict(day) for day in reading['forecast']]}
+
+
+class HTTPWeatherProvider(WeatherProvider):
+    """Fetches GET <base_url>/weather?city=<location>, which must answer with the weather dict as JSON."""
+
+    name = 'http'
+
+    def __init__(self, base_url, timeout=5.0, api_key=None):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.api_key = api_key
+
+    def fetch(self, location):
+        url = f"{self.base_url}/weather?" + urllib.parse.urlencode({'city': location})
+        headers = {'Accept': 'application/json'}
+        if self.api_key:
+            headers['Authorization'] = f'Bearer {self.api_key}'
+        try:
+            with urllib.request.urlopen(urllib.request.Request(url, headers=headers), timeout=self.timeout) as response:
+                data = json.load(response)
+        except (OSError, ValueError) as e:
+            # URLError, HTTPError and socket timeouts are OSErrors; malformed JSON is a ValueError
+            raise WeatherProviderError(f"Weather for '{location}' unavailable: {e}") from e
+        if not isinstance(data, dict) or 'temperature' not in data or 'description' not in data:
+            raise WeatherProviderError(f"Weather for '{location}': response is missing temperature/description.")
+        data.setdefault('city', str(location).strip().title())
+        data.setdefault('forecast', [])
+        return data
+
+
+class StubWeatherServer:
+    """Local HTTP weather API for development and tests, in the format HTTPWeatherProvider expects.
+
+    Answers GET /weather?city=... from the static readings, 404 for unknown cities. `delay`
+    adds artificial upstream latency and `requests` counts the calls it served.
+    """
+
+    def __init__(self, table=STATIC_WEATHER, host='127.0.0.1', port=0, delay=0.0):
+        self.provider = StaticWeatherProvider(table)
+        self.delay = delay
+        self.requests = 0
+        self._lock = threading.Lock()
+        self.server = ThreadingHTTPServer((host, port), self._handler())
+        self.server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                parsed = urllib.parse.urlparse(self.path)
+                with stub._lock:
+                    stub.requests += 1
+                if stub.delay:
+                    time.sleep(stub.delay)
+                reading = stub.provider.lookup(urllib.parse.parse_qs(parsed.query).get('city', [''])[0])
+                if parsed.path != '/weather' or reading is None:
+                    status, body = 404, {"error": "Unknown city."}
+                else:
+                    status, body = 200, reading
+                payload = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, name='weather-stub', daemon=True)
+        self._thread.start()
+        return self.base_url
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+# ==============================================================================
+# --- Weather Cache ---
+# ==============================================================================
+
+class WeatherCache:
+    """Per-location cache in front of a WeatherProvider: TTL, stale-while-revalidate, single-flight.
+
+    A reading younger than `ttl` is served as is. Until `ttl + stale_ttl` it is still served
+    immediately while a background thread refreshes it. Missing or older readings are fetched in
+    the caller's thread. Only one upstream fetch per location runs at a time; concurrent callers
+    wait on that fetch instead of starting their own. A failed fetch is remembered for
+    `error_ttl` seconds. During that window callers get the last good reading if there is one,
+    otherwise the error, without calling the provider again.
+    """
+
+    def __init__(self, provider, ttl=600.0, stale_ttl=3600.0, error_ttl=60.0, max_entries=1000, refresh_workers=2):
+        self.provider = provider
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.error_ttl = error_ttl
+        self.max_entries = max_entries
+        self.refresh_workers = refresh_workers
+        # key -> [reading or None, fetched_at, last error or None, failed_at], least recently used first
+        self._entries = OrderedDict()
+        self._inflight = {}  # key -> Future of the one running fetch
+        self._lock = threading.Lock()
+        self._executor = None
+        self._pid = None
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.fetches = 0
+        self.refreshes = 0
+        self.errors = 0
+        self.error_hits = 0
+
+    def _pool(self):
+        # Executor threads do not survive fork(); give each worker process its own refresh pool
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._executor = ThreadPoolExecutor(self.refresh_workers, thread_name_prefix='weather-refresh')
+                    self._inflight = {}
+                    self._pid = os.getpid()
+        return self._executor
+
+    def _fetch(self, key, location, future):
+        """Run one upstream fetch, store its outcome and resolve the callers waiting on `future`."""
+        try:
+            reading = self.provider.fetch(location)
+        except Exception as e:
+            print(f"Weather fetch for '{location}' failed: {e}")
+            with self._lock:
+                entry = self._entries.setdefault(key, [None, 0.0, None, 0.0])
+                entry[2], entry[3] = e, time.monotonic()
+                self._inflight.pop(key, None)
+                self.errors += 1
+                self._evict()
+            future.set_exception(e)
+            return
+        with self._lock:
+            self._entries[key] = [reading, time.monotonic(), None, 0.0]
+            self._entries.move_to_end(key)
+            self._inflight.pop(key, None)
+            self.fetches += 1
+            self._evict()
+        future.set_result(reading)
+
+    def _evict(self):
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def get(self, location):
+        """The reading for a location, fetching or refreshing it as its age requires."""
+        pool = self._pool()
+        key = normalize_location(location)
+        now = time.monotonic()
+        stale, refresh, future, owner = None, None, None, False
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                reading, fetched_at, error, failed_at = entry
+                recently_failed = error is not None and now - failed_at < self.error_ttl
+                if reading is not None and now - fetched_at < self.ttl:
+                    self.hits += 1
+                    return reading
+                if reading is not None and now - fetched_at < self.ttl + self.stale_ttl:
+                    self.stale_hits += 1
+                    stale = reading
+                    if key not in self._inflight and not recently_failed:
+                        refresh = self._inflight[key] = Future()
+                        self.refreshes += 1
+                elif recently_failed:
+                    self.error_hits += 1
+                    if reading is None:
+                        raise error
+                    return reading
+            if stale is None:
+                # Single flight: the first caller fetches, later callers wait on its Future
+                future = self._inflight.get(key)
+                if future is None:
+                    future = self._inflight[key] = Future()
+                    owner = True
+                    self.misses += 1
+                else:
+                    self.coalesced += 1
+
+        if stale is not None:
+            # Serve the stale reading now; the refresh (if one was started) runs in the background
+            if refresh is not None:
+                pool.submit(self._fetch, key, location, refresh)
+            return stale
+        if owner:
+            self._fetch(key, location, future)
+        try:
+            return future.result()
+        except Exception:
+            # An expired reading beats none while the provider is failing
+            if entry is not None and entry[0] is not None:
+                return entry[0]
+            raise
+
+    def stats(self):
+        return {"provider": self.provider.name, "entries": len(self._entries), "inflight": len(self._inflight),
+                "hits": self.hits, "stale_hits": self.stale_hits, "misses": self.misses,
+                "coalesced": self.coalesced, "fetches": self.fetches, "refreshes": self.refreshes,
+                "errors": self.errors, "error_hits": self.error_hits,
+                "ttl": self.ttl, "stale_ttl": self.stale_ttl}
+
+
+# ==============================================================================
+# --- Station Lookup ---
+# ==============================================================================
+
+EARTH_RADIUS_KM = 6371.0
+# Bundled catalogs: one row per weather station, and place names (with '|'-separated aliases)
+# to coordinates, including a centroid row per state for addresses naming no known town
+STATIONS_PATH = 'weather_stations.csv'
+GEOCODING_PATH = 'geocoding.csv'
+
+# "18.52, 73.86" or "18.52 73.86" (decimal degrees, latitude first)
+COORDINATES_PATTERN = re.compile(r'^(-?\d{1,2}(?:\.\d+)?)\s*[,; ]\s*(-?\d{1,3}(?:\.\d+)?)$')
+# Address words that never name a place: "Pune District", "Haveli Taluka", "... 413102, India"
+ADDRESS_NOISE = re.compile(r'\b(?:district|dist|taluka|taluk|tehsil|tahsil|village|city|town|india|\d{6})\b\.?')
+
+# A resolved location: the station row, its great-circle distance in km (None for the default
+# station) and how the point was found ('coordinates', 'place' or 'default')
+StationMatch = namedtuple('StationMatch', 'station distance_km source')
+
+
+class StationCatalog:
+    """Weather stations plus a geocoding table, resolving free-text farm locations to the nearest station.
+
+    Station coordinates sit in a BallTree with the haversine metric, so each nearest-station query
+    is a tree search in great-circle distance instead of a scan of every station. Locations that
+    name no known place resolve to the default station.
+    """
+
+    def __init__(self, stations, places, default_station='Delhi'):
+        self.stations = stations
+        self.places = places  # normalized place name or alias -> (latitude, longitude)
+        self.tree = BallTree(np.radians([[s['latitude'], s['longitude']] for s in stations]), metric='haversine')
+        self.default = next(s for s in stations if default_station in (s['name'], s['station_id']))
+        self.resolutions = 0
+        self.unresolved = 0
+
+    @classmethod
+    def from_csv(cls, stations_path=STATIONS_PATH, geocoding_path=GEOCODING_PATH, default_station='Delhi'):
+        with open(stations_path, newline='', encoding='utf-8') as f:
+            stations = [{**row, 'latitude': float(row['latitude']), 'longitude': float(row['longitude'])}
+                        for row in csv.DictReader(f)]
+        places = {normalize_location(s['name']): (s['latitude'], s['longitude']) for s in stations}
+        with open(geocoding_path, newline='', encoding='utf-8') as f:
+            for row in csv.DictReader(f):
+                point = (float(row['latitude']), float(row['longitude']))
+                for name in [row['name']] + (row['aliases'] or '').split('|'):
+                    if name.strip():
+                        places[normalize_location(name)] = point
+        return cls(stations, places, default_station)
+
+    def geocode(self, location):
+        """(latitude, longitude) of a free-text location, or None if nothing in it is known.
+
+        Accepts "lat, lon" pairs, place names and aliases, and addresses such as
+        "Baramati, Pune District, Maharashtra", matched from the most specific part to the state.
+        """
+        text = normalize_location(location)
+        match = COORDINATES_PATTERN.match(text)
+        if match:
+            latitude, longitude = float(match.group(1)), float(match.group(2))
+            if -90 <= latitude <= 90 and -180 <= longitude <= 180:
+                return latitude, longitude
+        if text in self.places:
+            return self.places[text]
+        for part in re.split(r'[,;/]', text):
+            part = ' '.join(ADDRESS_NOISE.sub(' ', part).split()).strip(' -.')
+            if part in self.places:
+                return self.places[part]
+        return None
+
+    def nearest(self, latitude, longitude):
+        """The station closest to a point and its great-circle distance in km."""
+        distance, index = self.tree.query(np.radians([[latitude, longitude]]), k=1)
+        return self.stations[index[0][0]], float(distance[0][0]) * EARTH_RADIUS_KM
+
+    def resolve(self, location):
+        """StationMatch for a free-text location; the default station if it cannot be geocoded."""
+        self.resolutions += 1
+        text = normalize_location(location)
+        point = self.geocode(text)
+        if point is None:
+            self.unresolved += 1
+            return StationMatch(self.default, None, 'default')
+        station, distance_km = self.nearest(*point)
+        source = 'coordinates' if COORDINATES_PATTERN.match(text) else 'place'
+        return StationMatch(station, round(distance_km, 1), source)
+
+    def stats(self):
+        return {"stations": len(self.stations), "places": len(self.places),
+                "resolutions": self.resolutions, "unresolved": self.unresolved}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Run the local stub weather API (WEATHER_PROVIDER=http).")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--delay', type=float, default=0.0, help="Artificial latency per request, in seconds.")
+    args = parser.parse_args()
+
+    stub = StubWeatherServer(host=args.host, port=args.port, delay=args.delay)
+    print(f"Stub weather API on {stub.base_url}/weather?city=<name> (Ctrl+C to stop)")
+    try:
+        stub.server.serve_forever()
+    except KeyboardInterrupt:
+        stub.server.server_close()